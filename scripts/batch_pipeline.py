@@ -0,0 +1,175 @@
+"""Message Batches mode of the pipeline engine (Anthropic).
+
+For overnight runs latency does not matter, but price does: the Message Batches API bills half the
+regular price and answers within 24 hours. BatchPipeline plans, renders and encodes the pages like
+Pipeline, but instead of sending them one by one it
+- packs the requests into batches (at most max_batch_requests requests / max_batch_bytes each),
+- stores the submitted batches in output_dir/.batches.json, so an interrupted run continues to poll
+  them instead of paying for the pages a second time,
+- polls every poll_interval seconds until the batches have ended,
+- writes the results to the same per-page files and records them in the journal.
+
+Pages that fail in a batch (errored, expired) are not journaled and are submitted again by the next run.
+With a budget, the worst-case cost of every page is reserved when it is packed; pages that do not fit
+any more are not submitted. Answers that cannot be repaired locally get no (full-price) repair request;
+their pages are submitted again by the next run. Streaming (stream) and the detection of near-identical
+pages (dedup_distance) do not apply: every pending page is submitted, except blank pages of the content
+filter (content_filter), which get the empty result of the task directly.
+"""
+
+import asyncio
+import json
+import os
+
+from image_encoding import encode_image
+from llm_cache import ResponseCache
+from page_journal import atomic_write_text
+from pdf_pages import render_pages_parallel, render_source
+from pipeline import Pipeline
+from providers import ClaudeProvider
+from tasks import Task
+
+BATCH_STATE_FILENAME = ".batches.json"
+MAX_BATCH_REQUESTS = 100_000       # API limit per batch
+MAX_BATCH_BYTES = 100 * 1024 * 1024  # API limit is 256 MB; smaller batches keep the memory use low
+
+
+class BatchPipeline(Pipeline):
+    """Pipeline that sends all pages through the Anthropic Message Batches API."""
+
+    price_factor = 0.5
+    pricing_note = ", batch price -50%"
+
+    def __init__(self, provider: ClaudeProvider, task: Task, input_dir: str, output_dir: str, *,
+                 poll_interval: float = 60, max_batch_requests: int = MAX_BATCH_REQUESTS,
+                 max_batch_bytes: int = MAX_BATCH_BYTES, **kwargs):
+        kwargs.setdefault("repair_requests", False)
+        super().__init__(provider, task, input_dir, output_dir, **kwargs)
+        self.poll_interval = poll_interval
+        self.max_batch_requests = max_batch_requests
+        self.max_batch_bytes = max_batch_bytes
+        self.state_path = os.path.join(output_dir, BATCH_STATE_FILENAME)
+        # {batch_id: {custom_id: [doc_name, page_no, cache_key]}} of the batches not yet collected
+        self.batches = self.load_state()
+        self.reservations = {}  # batch_id -> dollars reserved for the batches of this run
+
+    # Submitted batches
+
+    def load_state(self) -> dict:
+        """Batches submitted by an earlier (interrupted) run."""
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_state(self):
+        """Write the open batches atomically."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        atomic_write_text(self.state_path, json.dumps(self.batches, indent=2))
+
+    def plan_jobs(self) -> list[tuple[str, int | None]]:
+        """Pending pages without those that wait in an open batch."""
+        jobs = super().plan_jobs()
+        submitted = {(doc_name, page_no) for pages in self.batches.values() for doc_name, page_no, _ in pages.values()}
+        pending = [(path, page_no) for path, page_no in jobs if (os.path.basename(path), page_no) not in submitted]
+        if len(pending) < len(jobs):
+            print(f"> {len(jobs) - len(pending)} pages are waiting in open batches")
+        self.stats.pages_planned = len(pending)
+        return pending
+
+    async def submit(self, requests: dict, pages: dict, reserved: float = 0.0):
+        """Submit one batch and remember it before anything else happens."""
+        try:
+            batch_id = await self.provider.submit_batch(requests)
+        except Exception:
+            self.ledger.release(reserved)
+            raise
+        self.batches[batch_id] = pages
+        self.reservations[batch_id] = reserved
+        await asyncio.to_thread(self.save_state)
+        print(f"> Batch {batch_id} submitted: {len(requests)} pages")
+
+    async def submit_jobs(self, jobs: list):
+        """Render and encode the pages and submit them in batches; cached pages are written directly."""
+        requests, pages, size, reserved = {}, {}, 0, 0.0
+        rendered = render_pages_parallel(jobs, dpi=self.dpi, workers=self.render_workers, render=render_source)
+        while (page := await asyncio.to_thread(next, rendered, None)) is not None:
+            doc_name = os.path.basename(page.pdf_path)
+            if page.error is not None:
+                self.fail_page(self.new_trace(doc_name, page.page_no, rasterize=page.render_seconds),
+                               f"❌ Fehler beim Konvertieren von {doc_name}: {page.error}", page.error)
+                continue
+            trace = self.new_trace(doc_name, page.page_no, rasterize=page.render_seconds)
+            image = await self.mask_page(page.page_no, page.image, trace)
+            prompt = await self.screen_page(doc_name, page.page_no, image, trace)
+            if prompt is None:
+                continue
+            image = await self.trim_page(image, trace)
+            encoded = await asyncio.to_thread(encode_image, image, self.encoding)
+            key = ResponseCache.make_key(self.provider.model, prompt, self.provider.cache_params(), encoded.data)
+            cached = self.cache.get(key)
+            if cached is not None:
+                trace.cached = True
+                await self.finish_page(doc_name, page.page_no, cached["text"], trace)
+                continue
+
+            cost = self.ledger.estimate(self.estimate_input_tokens(prompt, encoded), self.provider.max_tokens)
+            if not self.ledger.try_reserve(cost):
+                self.ledger.stop()
+                await asyncio.to_thread(rendered.close)
+                break
+            request_bytes = len(encoded.data) * 4 // 3 + len(prompt.encode("utf-8")) + 1024
+            if requests and (len(requests) >= self.max_batch_requests or size + request_bytes > self.max_batch_bytes):
+                await self.submit(requests, pages, reserved)
+                requests, pages, size, reserved = {}, {}, 0, 0.0
+            custom_id = f"page-{len(requests)}"
+            requests[custom_id] = self.provider.build_request(prompt, encoded)
+            pages[custom_id] = [doc_name, page.page_no, key]
+            size += request_bytes
+            reserved += cost
+        if requests:
+            await self.submit(requests, pages, reserved)
+
+    async def collect(self, batch_id: str):
+        """Write the results of an ended batch and forget the batch."""
+        pages = self.batches[batch_id]
+        async for custom_id, response, error in self.provider.batch_results(batch_id):
+            if custom_id not in pages:
+                continue
+            doc_name, page_no, key = pages[custom_id]
+            trace = self.new_trace(doc_name, page_no)
+            if response is None:
+                self.fail_page(trace, f"❌ Fehler bei {self.page_label(doc_name, page_no)}: {error}", error)
+                continue
+            trace.add_usage(response)
+            self.charge(trace, response)
+            self.record_response(key, response)
+            await self.finish_page(doc_name, page_no, response.text, trace)
+        del self.batches[batch_id]
+        self.ledger.release(self.reservations.pop(batch_id, 0.0))
+        await asyncio.to_thread(self.save_state)
+
+    async def wait_for_batches(self):
+        """Poll the open batches until all of them have ended and are collected."""
+        while self.batches:
+            for batch_id in list(self.batches):
+                batch = await self.provider.retrieve_batch(batch_id)
+                if batch.processing_status == "ended":
+                    await self.collect(batch_id)
+                    continue
+                counts = batch.request_counts
+                print(f"> Batch {batch_id}: {batch.processing_status} — {counts.processing} processing, "
+                      f"{counts.succeeded} succeeded, {counts.errored} errored")
+            if self.batches:
+                await asyncio.sleep(self.poll_interval)
+
+    # Run
+
+    async def run_async(self):
+        """Submit the pending pages, then wait for all open batches (also those of earlier runs)."""
+        if self.batches:
+            print(f"Resume: {len(self.batches)} batches submitted by an earlier run are still open")
+        jobs = await asyncio.to_thread(self.plan_jobs)
+        print("----------------------------------------")
+        await self.submit_jobs(jobs)
+        await self.wait_for_batches()
@@ -0,0 +1,74 @@
+"""
+Durchsatz-Vergleich: nacheinander vs. mehrere gleichzeitige Anfragen an Claude.
+- Rendert die ersten BENCHMARK_PAGES Seiten aus input_dir (Einstellungen aus claude_transcript.py)
+- Sendet sie einmal seriell und danach mit verschiedenen Concurrency-Stufen
+- Gibt Seiten/s, Speedup und Tokensummen pro Variante aus
+Achtung: Jeder Durchlauf wird von Anthropic verrechnet. Es werden keine Dateien geschrieben
+und der Antwort-Cache wird nicht benutzt.
+"""
+
+import asyncio
+import time
+
+from dotenv import load_dotenv
+
+from claude_transcript import (
+    DPI, IMAGE_ENCODING, MAX_OUTPUT_TOKENS, MODEL_NAME, PROMPT, TEMPERATURE, input_dir,
+)
+from image_encoding import encode_image
+from pdf_pages import iter_pdf_files, iter_pdf_pages
+from providers import ClaudeProvider
+
+load_dotenv()
+
+BENCHMARK_PAGES = 8
+CONCURRENCY_LEVELS = [1, 2, 4, 8]
+
+
+def load_pages(limit: int) -> list:
+    """Rendert und kodiert bis zu limit Seiten aus input_dir."""
+    pages = []
+    for _, pdf_path in iter_pdf_files(input_dir):
+        for _, image in iter_pdf_pages(pdf_path, dpi=DPI):
+            pages.append(encode_image(image, IMAGE_ENCODING))
+            if len(pages) >= limit:
+                return pages
+    return pages
+
+
+async def bench(provider: ClaudeProvider, pages: list, concurrency: int) -> tuple[float, int, int]:
+    """Sendet alle Seiten mit höchstens concurrency gleichzeitigen Anfragen (1 = serielle Schleife)."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(page):
+        async with semaphore:
+            return await provider.send(PROMPT, page)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(send(page) for page in pages))
+    duration = time.perf_counter() - start
+    return duration, sum(r.input_tokens for r in results), sum(r.output_tokens for r in results)
+
+
+def main():
+    """Send the benchmark pages at every concurrency level and print the throughput table."""
+    pages = load_pages(BENCHMARK_PAGES)
+    if not pages:
+        print("No pages found — check input directory.")
+        return
+
+    provider = ClaudeProvider(MODEL_NAME, temperature=TEMPERATURE, max_tokens=MAX_OUTPUT_TOKENS)
+    print("----------------------------------------")
+    print(f"Benchmark mit {len(pages)} Seiten")
+    serial_time = None
+    for concurrency in CONCURRENCY_LEVELS:
+        duration, in_toks, out_toks = asyncio.run(bench(provider, pages, concurrency))
+        serial_time = serial_time or duration
+        label = "serial" if concurrency == 1 else f"async x{concurrency}"
+        print(f"{label:<10}: {duration:8.2f} s  {len(pages) / duration:6.3f} pages/s  "
+              f"tokens (in/out) {in_toks} / {out_toks}  speedup {serial_time / duration:.2f}x")
+    print("----------------------------------------")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark of the two NER modes of gemini_ner.py on pdf_data_ner/schreibmaschine_done.
+- per page: every page is rendered and sent as image together with the NER prompt (pipeline.py)
+- whole document: every PDF is uploaded once and answered in one request (document_pipeline.py)
+Both runs use the settings of gemini_ner.py, bypass the response cache and the journal and write to
+their own folder below output_root. Reported per mode: wall time, input/output tokens, estimated
+cost and entity counts (entities over all page files, and unique persons/places per document).
+All requests are billed by Google.
+"""
+
+import json
+import os
+import re
+import shutil
+
+from gemini_ner import build_pipeline
+
+input_dir = "../pdf_data_ner/schreibmaschine_done"
+output_root = "../answers/benchmark_ner_modes"
+MODES = {"per page": False, "whole document": True}
+
+PAGE_FILE = re.compile(r"^(?P<doc>.+)_page_\d+\.json$")
+
+
+def entity_key(entity: dict) -> str:
+    """Identity of an entity within a document: normalized form, else the name."""
+    return str(entity.get("normalized") or entity.get("name") or "").strip().lower()
+
+
+def count_entities(output_dir: str) -> dict:
+    """Entity counts over the per-page result files of output_dir."""
+    counts = {"page entities": 0, "unique persons": 0, "unique places": 0}
+    documents = {}
+    for filename in sorted(os.listdir(output_dir)):
+        match = PAGE_FILE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(output_dir, filename), "r", encoding="utf-8") as f:
+            result = json.load(f)
+        persons, places = documents.setdefault(match.group("doc"), (set(), set()))
+        for key, seen in (("persons", persons), ("places", places)):
+            entities = [e for e in result.get(key) or [] if isinstance(e, dict)]
+            counts["page entities"] += len(entities)
+            seen.update(entity_key(e) for e in entities)
+    for persons, places in documents.values():
+        counts["unique persons"] += len(persons)
+        counts["unique places"] += len(places)
+    return counts
+
+
+def main():
+    """Run both NER modes and print the comparison table."""
+    rows = []
+    for label, document_mode in MODES.items():
+        output_dir = os.path.join(output_root, label.replace(" ", "_"))
+        shutil.rmtree(output_dir, ignore_errors=True)
+        pipeline = build_pipeline(document_mode=document_mode, input_dir=input_dir, output_dir=output_dir,
+                                  use_cache=False, resume=False)
+        stats = pipeline.run()
+        in_tokens = stats.input_tokens + stats.cache_read_tokens + stats.cache_write_tokens
+        rows.append((label, stats, in_tokens, pipeline.ledger.spent, count_entities(output_dir)))
+
+    print("----------------------------------------")
+    print(f"{'mode':<16} {'wall s':>8} {'pages':>6} {'failed':>6} {'in tokens':>10} {'out tokens':>10} "
+          f"{'cost $':>7} {'page ent.':>9} {'persons':>8} {'places':>7}")
+    for label, stats, in_tokens, cost, counts in rows:
+        print(f"{label:<16} {stats.duration:>8.1f} {stats.pages_done:>6} {stats.pages_failed:>6} {in_tokens:>10} "
+              f"{stats.output_tokens:>10} {cost:>7.2f} {counts['page entities']:>9} "
+              f"{counts['unique persons']:>8} {counts['unique places']:>7}")
+    page_row, document_row = rows[0], rows[1]
+    if page_row[2] and page_row[1].duration:
+        print(f"Whole document vs. per page: {document_row[2] / page_row[2]:.2f}x input tokens, "
+              f"{document_row[1].duration / page_row[1].duration:.2f}x wall time")
+    print("----------------------------------------")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark of the page image encoding options (image_encoding.py).
+- Renders the first pages of every folder in pdf_data_transcript
+- Encodes each page with every option in OPTIONS
+- Reports encode time, payload bytes and estimated image tokens (Anthropic / Gemini) per option
+- With SEND_REQUESTS = True, every encoded page is also sent to Claude (max_tokens=LATENCY_MAX_TOKENS)
+  to report the real input tokens and the request latency. This is billed by Anthropic.
+"""
+
+import asyncio
+import os
+import statistics
+import time
+
+from image_encoding import PROVIDER_LONG_EDGE, EncodingOptions, encode_image, estimate_image_tokens
+from pdf_pages import iter_pdf_files, iter_pdf_pages
+
+input_dir = "../pdf_data_transcript"
+PAGES_PER_FOLDER = 2
+DPI = 300
+SEND_REQUESTS = False
+LATENCY_MAX_TOKENS = 16
+
+CLAUDE_EDGE = PROVIDER_LONG_EDGE["anthropic"]
+OPTIONS = [
+    EncodingOptions(format="PNG"),
+    EncodingOptions(format="PNG", max_long_edge=CLAUDE_EDGE),
+    EncodingOptions(format="PNG", grayscale=True, max_long_edge=CLAUDE_EDGE),
+    EncodingOptions(format="JPEG", quality=90, max_long_edge=CLAUDE_EDGE),
+    EncodingOptions(format="JPEG", quality=75, grayscale=True, max_long_edge=CLAUDE_EDGE),
+    EncodingOptions(format="WEBP", quality=80, max_long_edge=CLAUDE_EDGE),
+    EncodingOptions(format="WEBP", quality=70, grayscale=True, max_long_edge=CLAUDE_EDGE),
+]
+
+
+def load_sample_pages() -> list:
+    """Render the first PAGES_PER_FOLDER pages of every sub folder of input_dir."""
+    pages = []
+    for entry in sorted(os.scandir(input_dir), key=lambda e: e.name):
+        if not entry.is_dir():
+            continue
+        folder_pages = []
+        for _, pdf_path in sorted(iter_pdf_files(entry.path)):
+            for _, image in iter_pdf_pages(pdf_path, dpi=DPI):
+                folder_pages.append(image)
+                if len(folder_pages) >= PAGES_PER_FOLDER:
+                    break
+            if len(folder_pages) >= PAGES_PER_FOLDER:
+                break
+        print(f"> {entry.name}: {len(folder_pages)} pages")
+        pages.extend(folder_pages)
+    return pages
+
+
+def measure_claude(encoded) -> tuple[int, float]:
+    """Send one encoded page to Claude and return (input_tokens, latency in seconds)."""
+    # Imported here, so the benchmark runs without the API packages when SEND_REQUESTS is False
+    from claude_transcript import MODEL_NAME, PROMPT  # pylint: disable=import-outside-toplevel
+    from providers import ClaudeProvider  # pylint: disable=import-outside-toplevel
+    provider = ClaudeProvider(MODEL_NAME, max_tokens=LATENCY_MAX_TOKENS)
+    start = time.perf_counter()
+    response = asyncio.run(provider.send(PROMPT, encoded))
+    return response.input_tokens, time.perf_counter() - start
+
+
+def main():
+    """Encode the sample pages with every option and print the size and token table."""
+    pages = load_sample_pages()
+    if not pages:
+        print("No pages found — check input directory.")
+        return
+
+    print("----------------------------------------")
+    header = f"{'option':<26} {'encode ms':>10} {'KiB':>9} {'~tok claude':>12} {'~tok gemini':>12}"
+    if SEND_REQUESTS:
+        header += f" {'in tokens':>10} {'latency s':>10}"
+    print(header)
+
+    for options in OPTIONS:
+        encode_ms, sizes, claude_toks, gemini_toks, in_toks, latencies = [], [], [], [], [], []
+        for image in pages:
+            start = time.perf_counter()
+            encoded = encode_image(image, options)
+            encode_ms.append((time.perf_counter() - start) * 1000)
+            sizes.append(len(encoded.data))
+            claude_toks.append(estimate_image_tokens(encoded.width, encoded.height, "anthropic"))
+            gemini_toks.append(estimate_image_tokens(encoded.width, encoded.height, "gemini"))
+            if SEND_REQUESTS:
+                tokens, latency = measure_claude(encoded)
+                in_toks.append(tokens)
+                latencies.append(latency)
+
+        line = (f"{options.label():<26} {statistics.mean(encode_ms):>10.1f} "
+                f"{statistics.mean(sizes) / 1024:>9.1f} {statistics.mean(claude_toks):>12.0f} "
+                f"{statistics.mean(gemini_toks):>12.0f}")
+        if SEND_REQUESTS:
+            line += f" {statistics.mean(in_toks):>10.0f} {statistics.mean(latencies):>10.2f}"
+        print(line)
+    print("----------------------------------------")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark of the two inputs of gemini_ner.py on transcribed documents (pdf_data_transcript/fraktur_done).
+- image: every page is rendered and sent as image together with the NER prompt (pipeline.py)
+- text: the transcription of the page in answers/google_transcript/Fraktur-LLM-Results is sent instead
+  (transcript_pipeline.py)
+Both runs use the settings of gemini_ner.py, bypass the response cache and the journal and write to
+their own folder below output_root. Reported per input: wall time, input/output tokens (also per page),
+estimated cost, request latency (p50/p95 over the pages) and entity counts.
+All requests are billed by Google.
+"""
+
+import os
+import shutil
+
+from benchmark_gemini_ner_modes import count_entities
+from gemini_ner import build_pipeline
+from run_trace import percentile
+
+input_dir = "../pdf_data_transcript/fraktur_done"
+transcript_dirs = ["../answers/google_transcript/Fraktur-LLM-Results"]
+output_root = "../answers/benchmark_ner_text_input"
+INPUTS = {"image": None, "text": transcript_dirs}
+
+
+def main():
+    """Run NER with image and with text input and print the comparison table."""
+    rows = []
+    for label, dirs in INPUTS.items():
+        output_dir = os.path.join(output_root, label)
+        shutil.rmtree(output_dir, ignore_errors=True)
+        pipeline = build_pipeline(document_mode=False, input_dir=input_dir, output_dir=output_dir, use_cache=False,
+                                  resume=False, transcript_dirs=dirs)
+        stats = pipeline.run()
+        in_tokens = stats.input_tokens + stats.cache_read_tokens + stats.cache_write_tokens
+        latencies = [r["request"] for r in pipeline.tracer.records if r["status"] == "ok" and r["request"] > 0]
+        rows.append((label, stats, in_tokens, pipeline.ledger.spent, latencies, count_entities(output_dir)))
+
+    print("----------------------------------------")
+    print(f"{'input':<8} {'wall s':>8} {'pages':>6} {'as text':>7} {'failed':>6} {'in tokens':>10} {'in/page':>8} "
+          f"{'out tokens':>10} {'cost $':>7} {'p50 s':>6} {'p95 s':>6} {'page ent.':>9} {'persons':>8} {'places':>7}")
+    for label, stats, in_tokens, cost, latencies, counts in rows:
+        print(f"{label:<8} {stats.duration:>8.1f} {stats.pages_done:>6} {stats.pages_text:>7} {stats.pages_failed:>6} "
+              f"{in_tokens:>10} {in_tokens / max(1, stats.pages_done):>8.0f} {stats.output_tokens:>10} {cost:>7.2f} "
+              f"{percentile(latencies, 50):>6.1f} {percentile(latencies, 95):>6.1f} {counts['page entities']:>9} "
+              f"{counts['unique persons']:>8} {counts['unique places']:>7}")
+    image_row, text_row = rows[0], rows[1]
+    if image_row[2] and image_row[1].duration:
+        print(f"Text vs. image input: {text_row[2] / image_row[2]:.2f}x input tokens, "
+              f"{text_row[3] / image_row[3] if image_row[3] else 0:.2f}x cost, "
+              f"{text_row[1].duration / image_row[1].duration:.2f}x wall time")
+    print("----------------------------------------")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Token savings of the page cleanup (page_cleanup.py) on the corpus.
+- Renders every page of the PDFs (or loads the page images) below the input folders
+- Trims the empty margins like the pipeline does before encoding (--mask: also masks the dodis.ch stamp)
+- Reports per folder: pages, masked stamps, trimmed pages, cleanup time per page and the estimated
+  image tokens per provider before and after the cleanup (image_encoding.estimate_image_tokens, at the
+  long-edge limit of the provider)
+- Pages are only measured, nothing is sent
+
+    python benchmark_page_cleanup.py
+    python benchmark_page_cleanup.py ../pdf_data_ner --dpi 300
+    python benchmark_page_cleanup.py /tmp/pages --extensions .jpg .png   # page images (no poppler needed)
+"""
+
+import argparse
+import os
+import time
+from collections import defaultdict
+
+from image_encoding import PROVIDER_LONG_EDGE, estimate_image_tokens
+from page_cleanup import CleanupOptions, clean_page
+from pdf_pages import get_page_count, iter_pdf_files, render_pages_parallel, render_source
+
+PROVIDERS = ("anthropic", "gemini", "openai")
+
+
+def sent_tokens(width: int, height: int, provider: str) -> int:
+    """Estimated image tokens of a page encoded at the long-edge limit of the provider."""
+    scale = min(1.0, PROVIDER_LONG_EDGE[provider] / max(width, height))
+    return estimate_image_tokens(max(1, round(width * scale)), max(1, round(height * scale)), provider)
+
+
+def plan_jobs(input_dirs: list[str], extensions: tuple) -> list[tuple[str, int | None]]:
+    """(path, page_no) of every page; page_no is None for image files."""
+    jobs = []
+    for input_dir in input_dirs:
+        for filename, path in iter_pdf_files(input_dir, extensions):
+            if filename.lower().endswith(".pdf"):
+                jobs.extend((path, page_no) for page_no in range(1, get_page_count(path) + 1))
+            else:
+                jobs.append((path, None))
+    return jobs
+
+
+def main():
+    """Measure the image tokens of the corpus pages with and without cleanup and print the savings."""
+    parser = argparse.ArgumentParser(description="Token savings of the page cleanup on the corpus")
+    parser.add_argument("input_dirs", nargs="*", default=["../pdf_data_transcript", "../pdf_data_ner"])
+    parser.add_argument("--extensions", nargs="+", default=[".pdf"])
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--mask", action="store_true", help="also mask the stamp (off in the scripts)")
+    parser.add_argument("--no-trim", action="store_true", help="do not trim the margins")
+    args = parser.parse_args()
+    options = CleanupOptions(mask=args.mask, trim=not args.no_trim)
+
+    jobs = plan_jobs(args.input_dirs, tuple(ext.lower() for ext in args.extensions))
+    if not jobs:
+        print("No pages found — check input directories.")
+        return
+    folders = defaultdict(lambda: defaultdict(float))
+    for page in render_pages_parallel(jobs, dpi=args.dpi, render=render_source):
+        if page.error is not None:
+            print(f"❌ Fehler beim Konvertieren von {page.pdf_path}: {page.error}")
+            continue
+        start = time.perf_counter()
+        result = clean_page(page.image, page.page_no, args.dpi, options)
+        seconds = time.perf_counter() - start
+        folder = folders[os.path.relpath(os.path.dirname(page.pdf_path), os.path.dirname(args.input_dirs[0]))]
+        folder["pages"] += 1
+        folder["masked"] += len(result.masked)
+        folder["trimmed"] += result.trimmed > 0
+        folder["seconds"] += seconds
+        for provider in PROVIDERS:
+            folder[f"{provider} before"] += sent_tokens(*page.image.size, provider)
+            folder[f"{provider} after"] += sent_tokens(*result.image.size, provider)
+
+    print("----------------------------------------")
+    print(f"{'folder':<40} {'pages':>6} {'masked':>7} {'trimmed':>8} {'ms/page':>8} "
+          + " ".join(f"{provider + ' tok':>20}" for provider in PROVIDERS))
+    total = defaultdict(float)
+    for name, folder in sorted(folders.items()) + [("total", total)]:
+        if name != "total":
+            for key, value in folder.items():
+                total[key] += value
+        savings = " ".join(f"{int(after):>11} ({1 - after / before:>5.1%})" for after, before in (
+            (folder[f"{provider} after"], folder[f"{provider} before"]) for provider in PROVIDERS))
+        print(f"{name:<40} {int(folder['pages']):>6} {int(folder['masked']):>7} {int(folder['trimmed']):>8} "
+              f"{folder['seconds'] / folder['pages'] * 1000:>8.1f} {savings}")
+    print("Tokens: estimated image tokens per folder after the cleanup (savings against the uncleaned page)")
+    print("----------------------------------------")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Throughput benchmark of the pipeline engine against the local mock server (mock_llm_server.py).
+No API costs and no network noise, so the numbers can be compared between commits.
+- Creates synthetic documents with PIL: multi-page PDFs with typewriter-like text lines
+  (--images writes JPEG pages instead, for machines without poppler)
+- Starts the mock server with the chosen latency distribution, 429/529 rates and canned answers
+  (plain text for transcription, JSON for NER)
+- Runs every scenario (provider x task) through the engine in a fresh process and measures
+  pages/s, wall and CPU time, peak memory (max RSS of that process) and the wall time per stage
+  (p50/p95 from the run trace)
+- Measures the CPU time per page of the local stages (rasterize, encode, parse, write) in a serial pass
+- Appends the results with the git commit to ../benchmarks/pipeline_results.jsonl and compares them
+  with the last result of another commit with the same settings
+
+    python benchmark_pipeline.py
+    python benchmark_pipeline.py --scenarios claude_transcription gemini_ner --pages 60 --latency-distribution lognormal
+    python benchmark_pipeline.py --error-rate 0.05 --overload-rate 0.02 --concurrency 16
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageDraw, ImageFont
+
+from image_encoding import PROVIDER_LONG_EDGE, EncodingOptions, encode_image
+from mock_llm_server import MockConfig, start_server
+from page_journal import atomic_write_text
+from pdf_pages import render_source
+from pipeline import Pipeline
+from providers import ClaudeProvider, GeminiProvider, OpenAIProvider
+from rate_limiter import RateLimit
+from run_trace import STAGES, percentile
+from tasks import NerTask, TranscriptionTask
+
+try:
+    import resource
+except ImportError:  # Windows: no peak memory
+    resource = None
+
+results_path = "../benchmarks/pipeline_results.jsonl"
+
+SCENARIOS = {
+    "claude_transcription": ("claude", "transcription"),
+    "openai_transcription": ("openai", "transcription"),
+    "gemini_transcription": ("gemini", "transcription"),
+    "gemini_ner": ("gemini", "ner"),
+}
+REGRESSION_THRESHOLD = 0.10  # Pages/s drop against the previous commit that is reported as regression
+
+WORDS = ("Bern", "Bundesrat", "Departement", "Botschaft", "Schweiz", "Gesandtschaft", "Verhandlung", "Abkommen",
+         "Minister", "Konferenz", "Handel", "Neutralität", "Genf", "Paris", "Washington", "Notiz", "vertraulich",
+         "der", "die", "das", "und", "mit", "für", "über", "nach", "von", "zu", "im", "am", "dass", "wird")
+TRANSCRIPTION_PROMPT = "Transkribiere den Text der Seite vollständig und ohne Kommentar."
+NER_PROMPT = "Extrahiere alle Personen und Orte der Seite als JSON mit den Schlüsseln persons, places und content."
+
+
+def canned_transcriptions(count: int = 5, seed: int = 1) -> tuple:
+    """Plain text answers of about one typewritten page."""
+    rng = random.Random(seed)
+    return tuple("\n".join(" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(35)) for _ in range(count))
+
+
+def canned_ner_answers(count: int = 5, seed: int = 1) -> tuple:
+    """NER answers in the schema of NerTask, half of them wrapped in a ```json fence like real answers."""
+    rng = random.Random(seed)
+    answers = []
+    for i in range(count):
+        answer = json.dumps({
+            "persons": [{"name": f"{rng.choice(('Max', 'Paul', 'Anna'))} {rng.choice(('Petitpierre', 'Stucki'))}",
+                         "role": "Minister"} for _ in range(rng.randint(2, 8))],
+            "places": [{"name": rng.choice(("Bern", "Genf", "Paris", "Washington"))} for _ in range(rng.randint(1, 6))],
+            "content": " ".join(rng.choice(WORDS) for _ in range(40)),
+        }, ensure_ascii=False, indent=2)
+        answers.append(f"```json\n{answer}\n```" if i % 2 else answer)
+    return tuple(answers)
+
+
+# Synthetic documents
+
+def synthetic_page(rng: random.Random, width: int = 1240, height: int = 1754) -> Image.Image:
+    """A4 page at 150 dpi with typewriter-like lines on slightly uneven paper."""
+    page = Image.effect_noise((width, height), 12).point(lambda v: 235 + v // 16).convert("RGB")
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default()
+    y = 120
+    while y < height - 150:
+        x = 110 + rng.randint(-4, 4)
+        line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 12)))
+        draw.text((x, y), line, fill=(30, 30, 30), font=font)
+        y += rng.randint(34, 40)
+    return page
+
+
+def make_documents(directory: str, pages: int, pages_per_document: int, images: bool, seed: int = 1):
+    """Write `pages` synthetic pages as PDFs (or JPEG files) to directory."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    doc_no = 0
+    while pages > 0:
+        count = min(pages, pages_per_document)
+        doc_pages = [synthetic_page(rng) for _ in range(count)]
+        doc_no += 1
+        if images:
+            for page_no, page in enumerate(doc_pages, 1):
+                page.save(os.path.join(directory, f"synthetic-{doc_no:03d}-{page_no}.jpg"), quality=85)
+        else:
+            doc_pages[0].save(os.path.join(directory, f"synthetic-{doc_no:03d}.pdf"), "PDF", resolution=150,
+                              save_all=True, append_images=doc_pages[1:])
+        pages -= count
+
+
+# One scenario (runs in its own process)
+
+def cpu_seconds() -> float:
+    """CPU time of this process and its finished child processes (pdftoppm)."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def peak_memory_mib() -> float | None:
+    """Max RSS of this process in MiB, None where the resource module is missing."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if os.uname().sysname == "Darwin" else peak / 1024  # Bytes on macOS, KiB elsewhere
+
+
+def build_provider(kind: str, base_url: str):
+    """Provider of the scenario pointed at the mock server."""
+    if kind == "claude":
+        return ClaudeProvider("mock-claude", base_url=base_url)
+    if kind == "openai":
+        return OpenAIProvider("mock-gpt", api_key="mock", base_url=f"{base_url}/v1")
+    return GeminiProvider("mock-gemini", base_url=base_url)
+
+
+def build_task(kind: str):
+    """Task of the scenario."""
+    return NerTask(NER_PROMPT) if kind == "ner" else TranscriptionTask(TRANSCRIPTION_PROMPT)
+
+
+def stage_cpu(pipeline: Pipeline, answers: tuple, limit: int) -> dict:
+    """CPU milliseconds per page of the local stages, measured serially on up to limit pages."""
+    totals = dict.fromkeys(("rasterize", "encode", "parse", "write"), 0.0)
+    jobs = pipeline.plan_jobs()[:limit]
+    for i, (path, page_no) in enumerate(jobs):
+        start = cpu_seconds()
+        image = render_source(path, page_no, pipeline.dpi)
+        totals["rasterize"] += cpu_seconds() - start
+        start = cpu_seconds()
+        encode_image(image, pipeline.encoding)
+        totals["encode"] += cpu_seconds() - start
+        start = cpu_seconds()
+        result = pipeline.task.parse_report(answers[i % len(answers)])[0]
+        totals["parse"] += cpu_seconds() - start
+        start = cpu_seconds()
+        atomic_write_text(os.path.join(pipeline.output_dir, f"cpu-{i}{pipeline.task.extension}"),
+                          pipeline.task.serialize(result))
+        totals["write"] += cpu_seconds() - start
+    return {stage: 1000 * seconds / max(1, len(jobs)) for stage, seconds in totals.items()}
+
+
+def run_scenario(scenario: str, base_url: str, input_dir: str, output_dir: str, settings: dict) -> dict:
+    """Run one scenario through the engine and return its metrics."""
+    for key in ("ANTHROPIC_API_KEY", "OPENAI_API_KEY", "GEMINI_API_KEY"):
+        os.environ[key] = "mock"  # Never send real keys, even to the local server
+    provider_kind, task_kind = SCENARIOS[scenario]
+    provider = build_provider(provider_kind, base_url)
+    pipeline = Pipeline(provider, build_task(task_kind), input_dir, output_dir,
+                        input_extensions=(".pdf", ".jpg"), dpi=settings["dpi"], concurrency=settings["concurrency"],
+                        max_retries=8, rate_limit=RateLimit(rpm=settings["rpm"]), use_cache=False, resume=False,
+                        encoding=EncodingOptions(max_long_edge=PROVIDER_LONG_EDGE[provider.name]))
+    cpu_start = cpu_seconds()
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = pipeline.run()
+    cpu = cpu_seconds() - cpu_start
+    records = pipeline.tracer.records
+    answers = canned_ner_answers() if task_kind == "ner" else canned_transcriptions()
+    with contextlib.redirect_stdout(io.StringIO()):
+        cpu_per_stage = stage_cpu(pipeline, answers, limit=settings["cpu_pages"])
+    stages = {}
+    for stage in STAGES:
+        values = [r[stage] for r in records if not r.get("cached")]
+        stages[stage] = {"p50": percentile(values, 50), "p95": percentile(values, 95),
+                         "cpu_ms_per_page": cpu_per_stage.get(stage)}
+    return {
+        "pages_done": stats.pages_done,
+        "pages_failed": stats.pages_failed,
+        "retries": stats.retries,
+        "rate_limited": stats.rate_limited,
+        "wall_seconds": stats.duration,
+        "pages_per_second": stats.pages_done / stats.duration if stats.duration else 0.0,
+        "cpu_seconds": cpu,
+        "peak_memory_mib": peak_memory_mib(),
+        "stages": stages,
+    }
+
+
+# Results
+
+def git_commit() -> tuple[str, bool]:
+    """Short hash of HEAD and whether tracked files are modified ("unknown" outside of git)."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                                    text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, dirty
+
+
+def load_results(path: str) -> list[dict]:
+    """Stored benchmark results, oldest first."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous_result(results: list[dict], record: dict) -> dict | None:
+    """Latest stored result of the same scenario and settings from another commit."""
+    for old in reversed(results):
+        if old["scenario"] == record["scenario"] and old["settings"] == record["settings"] \
+                and old["commit"] != record["commit"]:
+            return old
+    return None
+
+
+def print_results(records: list[dict], stored: list[dict]):
+    """Table of the scenarios, stage details and the comparison with the previous commit."""
+    print("----------------------------------------")
+    print(f"{'scenario':<22} {'pages/s':>8} {'wall s':>7} {'cpu s':>7} {'peak MiB':>9} {'failed':>6} "
+          f"{'retries':>7} {'vs. prev.':>16}")
+    for record in records:
+        metrics = record["metrics"]
+        peak = metrics["peak_memory_mib"]
+        previous = previous_result(stored, record)
+        comparison = "—"
+        if previous and previous["metrics"]["pages_per_second"]:
+            change = metrics["pages_per_second"] / previous["metrics"]["pages_per_second"] - 1
+            comparison = f"{change:+.1%} ({previous['commit']})"
+            if change < -REGRESSION_THRESHOLD:
+                comparison += " REGRESSION"
+        print(f"{record['scenario']:<22} {metrics['pages_per_second']:>8.2f} {metrics['wall_seconds']:>7.1f} "
+              f"{metrics['cpu_seconds']:>7.1f} {peak if peak is not None else float('nan'):>9.0f} "
+              f"{metrics['pages_failed']:>6} {metrics['retries']:>7} {comparison:>16}")
+    print()
+    print(f"{'scenario':<22} {'stage':<10} {'p50 s':>7} {'p95 s':>7} {'cpu ms/page':>12}")
+    for record in records:
+        for stage, values in record["metrics"]["stages"].items():
+            cpu = values["cpu_ms_per_page"]
+            print(f"{record['scenario']:<22} {stage:<10} {values['p50']:>7.3f} {values['p95']:>7.3f} "
+                  f"{cpu if cpu is not None else float('nan'):>12.1f}")
+    print("----------------------------------------")
+
+
+def main():
+    """Run the benchmark scenarios against the mock server and append the results."""
+    parser = argparse.ArgumentParser(description="Pipeline benchmark against the local mock server")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--pages-per-document", type=int, default=4)
+    parser.add_argument("--images", action="store_true", help="JPEG pages instead of PDFs (no poppler needed)")
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean response time of the mock in seconds")
+    parser.add_argument("--latency-distribution", choices=("fixed", "uniform", "lognormal"), default="lognormal")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of synthetic 429 answers")
+    parser.add_argument("--overload-rate", type=float, default=0.0, help="share of synthetic 529 answers")
+    parser.add_argument("--rpm", type=int, default=600, help="requests per minute of the mock server")
+    parser.add_argument("--cpu-pages", type=int, default=8, help="pages of the serial CPU-per-stage pass")
+    parser.add_argument("--no-store", action="store_true", help="do not append the results to " + results_path)
+    args = parser.parse_args()
+
+    settings = {key: getattr(args, key) for key in (
+        "pages", "pages_per_document", "images", "dpi", "concurrency", "latency", "latency_distribution",
+        "latency_sigma", "error_rate", "overload_rate", "rpm", "cpu_pages")}
+    commit, dirty = git_commit()
+    records = []
+    with tempfile.TemporaryDirectory() as workdir:
+        input_dir = os.path.join(workdir, "input")
+        make_documents(input_dir, args.pages, args.pages_per_document, args.images)
+        for scenario in args.scenarios:
+            answers = canned_ner_answers() if SCENARIOS[scenario][1] == "ner" else canned_transcriptions()
+            server = start_server(MockConfig(
+                latency=args.latency, latency_distribution=args.latency_distribution,
+                latency_sigma=args.latency_sigma, rpm=args.rpm, error_rate=args.error_rate,
+                overload_rate=args.overload_rate, responses=answers))
+            print(f"> {scenario} ...")
+            try:
+                # A fresh process per scenario: its peak memory is not inherited from the previous one
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    metrics = pool.submit(run_scenario, scenario, f"http://127.0.0.1:{server.server_port}",
+                                          input_dir, os.path.join(workdir, scenario), settings).result()
+            finally:
+                server.shutdown()
+            records.append({"scenario": scenario, "commit": commit, "dirty": dirty,
+                            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "settings": settings,
+                            "metrics": metrics})
+
+    stored = load_results(results_path)
+    print_results(records, stored)
+    if not args.no_store:
+        os.makedirs(os.path.dirname(results_path), exist_ok=True)
+        with open(results_path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"Results appended to {os.path.abspath(results_path)}")
+
+
+if __name__ == "__main__":
+    main()
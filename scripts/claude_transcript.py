@@ -1,53 +1,120 @@
 """
 Batch-Transkription von PDF-Seiten mit Anthropic Claude (Vision).
 - Liest PDFs aus input_dir
-- Rendert jede Seite als PNG (pdf2image)
-- Sendet Prompt + Bild (Base64) an Claude
-- Speichert Antwort pro Seite als .txt
-- Summiert Tokenverbrauch und schätzt Kosten
+- Rendert die Seiten aller PDFs parallel auf mehreren Kernen (pdf2image, siehe pdf_pages.py)
+- Kodiert die Seite gemäss IMAGE_ENCODING (image_encoding.py) und sendet Prompt + Bild (Base64) an Claude
+- Speichert Antwort pro Seite als .txt; mit STREAM_RESPONSES wächst sie schon während des Empfangs
+  in <Seite>.txt.part (partial_answer.py)
+- Summiert Tokenverbrauch und bucht die Kosten jeder Anfrage mit den Preisen aus pricing.py
+  (cost_ledger.py); BUDGET_DOLLARS stoppt den Versand, bevor das Budget überschritten würde
+- Der lange, statische PROMPT wird als cachebarer Block gesendet (PROMPT_CACHING, cache_control)
+- Bis zu MAX_CONCURRENT_REQUESTS Seiten gleichzeitig (1 = serielle Schleife), innerhalb von RATE_LIMIT
+  (rate_limiter.py); bei 429/529 wird mit Jitter gewartet statt die Seite zu verwerfen
+- Bereits beantwortete Anfragen kommen aus dem Antwort-Cache (llm_cache.py, USE_CACHE); optional werden fast
+  identische Seiten nur einmal gesendet (page_dedup.py, DEDUP_MAX_DISTANCE, standardmässig aus)
+- Leere Ränder werden abgeschnitten, bevor die Seite kodiert wird; optional wird der Stempel von dodis.ch
+  (QR-Code, Link) übermalt (page_cleanup.py, PAGE_CLEANUP)
+- Optional werden leere Seiten nicht gesendet, Seiten mit wenig Inhalt mit einem kurzen Prompt (page_content.py,
+  CONTENT_FILTER, standardmässig aus)
+- Fertige Seiten werden im Journal vermerkt; ein Neustart überspringt sie (page_journal.py, RESUME)
+- Nach dem Lauf kommen die neuen Ergebnisse mit Tokens und Latenz in den Parquet-Datensatz aller Läufe
+  (result_store.py, RESULT_STORE)
+- BATCH_MODE = True: alle Seiten gehen als Message Batches an Claude (halber Preis, Antworten innert 24 h,
+  batch_pipeline.py); die Ergebnisse landen in denselben Dateien pro Seite
+Die eigentliche Schleife steckt in pipeline.py; dieses Skript konfiguriert sie nur.
 """
 
-import base64
-import json
 import os
-import re
-import time
-from io import BytesIO
 
-from PIL import Image
 from dotenv import load_dotenv
-from pdf2image import convert_from_path
-from anthropic import Anthropic
+
+from batch_pipeline import BatchPipeline
+from image_encoding import PROVIDER_LONG_EDGE, EncodingOptions
+from page_cleanup import CleanupOptions
+from pipeline import Pipeline
+from providers import ClaudeProvider
+from rate_limiter import default_limit
+from tasks import TranscriptionTask
 
 load_dotenv()
 
 # Verzeichnisse
 input_dir = "../pdf_data_transcript/fraktur"
 output_dir = "../answers/anthropic_transcript"
-os.makedirs(output_dir, exist_ok=True)
-
-# Optional: Ausgabeordner leeren
-for root, _, filenames in os.walk(output_dir):
-    for filename in filenames:
-        try:
-            os.remove(os.path.join(root, filename))
-        except Exception:
-            pass
-
-# API-Client
-api_key = os.getenv("ANTHROPIC_API_KEY") or os.getenv("CLAUDE_API_KEY")
-if not api_key:
-    raise RuntimeError("Kein API-Key gefunden. Bitte ANTHROPIC_API_KEY oder CLAUDE_API_KEY in .env setzen.")
-client = Anthropic(api_key=api_key)
 
 # Modell & Parameter
 MODEL_NAME = "claude-sonnet-4-5-20250929"  
 TEMPERATURE = 0.5
 MAX_OUTPUT_TOKENS = 8192  
-
-# Token-/Kosten-Tracking (Dollar pro 1 Mio. Tokens)
-input_cost_per_mio_in_dollars = 3.00
-output_cost_per_mio_in_dollars = 15.00
+DPI = 300  # Auflösung beim Rendern der Seiten (300 meist sinnvoll)
+RENDER_WORKERS = os.cpu_count()  # Anzahl Seiten, die gleichzeitig gerendert werden
+
+# Bildkodierung: Claude verkleinert grössere Bilder ohnehin auf 1568 px an der langen Kante.
+# Mögliche Formate: PNG, JPEG, WEBP (quality), grayscale=True spart weitere Bytes.
+IMAGE_ENCODING = EncodingOptions(format="PNG", grayscale=False, max_long_edge=PROVIDER_LONG_EDGE["anthropic"])
+
+# Nebenläufigkeit: bis zu MAX_CONCURRENT_REQUESTS Anfragen gleichzeitig (1 = nacheinander)
+MAX_CONCURRENT_REQUESTS = 8
+
+# Prompt-Caching: PROMPT wird mit cache_control gesendet; folgende Seiten lesen ihn aus dem Cache
+# (10 % des Input-Preises). Der Cache lebt 5 Minuten ab der letzten Nutzung.
+PROMPT_CACHING = True
+
+# Rate-Limit des Modells (Anfragen und Tokens pro Minute). Die Limits aus den Antwort-Headern
+# der API haben Vorrang; anpassen, falls das Konto in einer höheren Stufe ist. Für Modelle, die nicht in
+# rate_limiter.DEFAULT_LIMITS stehen, gilt mit einer Warnung das niedrigste Limit der Tabelle.
+RATE_LIMIT = default_limit(MODEL_NAME)
+
+# Batch-Modus für Nachtläufe über das ganze Korpus: Message Batches API zum halben Preis.
+# Abgeschickte Batches stehen in output_dir/.batches.json; ein Neustart fragt sie weiter ab, statt neu zu senden.
+BATCH_MODE = False
+BATCH_POLL_INTERVAL = 60  # Sekunden zwischen zwei Statusabfragen
+
+# Streaming: die Transkription wird während des Empfangs an output_dir/<Seite>.txt.part angehängt
+# (Fortschritt mit tail -f verfolgen). Ein abgebrochener Lauf setzt die Seite beim Neustart dort fort.
+# Im Batch-Modus ohne Wirkung. Standardmässig aus: jede Antwort wird wie bisher am Stück empfangen.
+STREAM_RESPONSES = False
+
+# Fast identische Seiten (Kopien von Dokumenten, wiederholte Deckblätter): pro Gruppe wird nur eine Seite
+# gesendet, ihr Ergebnis wird für die anderen übernommen (page_dedup.py). Abstand in Bits des 256-Bit-
+# Wahrnehmungshashs; verschiedene Seiten des Korpus liegen mindestens 38 Bits auseinander. Standardmässig aus
+# (None): eine falsch zusammengefasste Seite (Formulare, fast leere Seiten mit gleichem Layout) bekäme ohne
+# Fehlermeldung den Text einer anderen. Beim Einschalten (z.B. 16) dedup_report.json im Ausgabeordner prüfen.
+# Im Batch-Modus ohne Wirkung.
+DEDUP_MAX_DISTANCE = None
+
+# Seitenbereinigung vor dem Kodieren (page_cleanup.py): leere Ränder werden abgeschnitten, das spart Bild-Tokens.
+# mask=True übermalt zusätzlich den Stempel von dodis.ch (QR-Code unten rechts auf Seite 1, Link oben rechts auf
+# jeder Seite) mit der Papierfarbe. Die Stempel werden nicht erkannt, sondern an festen Positionen übermalt; Text
+# des Dokuments in diesen Ecken (Briefkopf) ginge verloren. Deshalb aus; die Anweisungen im PROMPT halten die Links
+# aus der Transkription. None = aus.
+PAGE_CLEANUP = CleanupOptions(mask=False, trim=True)
+
+# Leere und fast leere Seiten (Rückseiten, Trennblätter, nur Seitenzahl oder Stempel): gemessen wird der Anteil
+# der Seite, der mit Text bedeckt ist (page_content.py). Unter blank_area wird die Seite nicht gesendet und
+# eine leere .txt geschrieben, unter sparse_area mit einem kurzen Prompt gesendet. Übersprungene Seiten stehen
+# in der Ausgabe, in der Zusammenfassung und im Trace (content, text_area). Standardmässig aus (None): der Korpus
+# hat keine leeren Seiten, und blasse Scans wie dodis-55544 liegen nahe an der Schwelle. Einschalten mit
+# CONTENT_FILTER = ContentThresholds() (aus page_content.py).
+CONTENT_FILTER = None
+
+# Ergebnis-Speicher: nach dem Lauf werden die neuen .txt-Dateien mit Tokens und Latenz aus dem Trace an den
+# Parquet-Datensatz aller Läufe angehängt (result_store.py, partitioniert nach Task/Modell/Lauf). None = aus.
+RESULT_STORE = "../answers/result_store"
+
+# Antwort-Cache: identische Anfragen (Modell, Prompt, Parameter, Bild) werden nicht erneut gesendet.
+# USE_CACHE = False umgeht den Cache.
+USE_CACHE = True
+
+# Fortsetzen: Seiten, die laut Journal schon fertig sind, werden übersprungen.
+# RESUME = False verarbeitet alle Seiten neu.
+RESUME = True
+
+# Kosten: Preise pro Modell aus der versionierten Preistabelle (pricing.py). Jede Anfrage landet im
+# Kostenbuch output_dir/.cost_ledger.jsonl, die Kosten pro Dokument und Ordner in output_dir/cost_report.json.
+# BUDGET_DOLLARS: harte Obergrenze pro Lauf in Dollar (None = kein Limit). Nicht gesendete Seiten
+# holt ein späterer Lauf nach.
+BUDGET_DOLLARS = None
 
 
 PROMPT = """
@@ -80,146 +147,36 @@ Nun atme tief durch und gehe Schritt für Schritt vor.
 """
 
 
-# Hilfsfunktionen
-
-def pil_to_base64_png(img: Image.Image) -> str:
-    """Wandelt ein PIL-Image in Base64(PNG) um."""
-    buf = BytesIO()
-    img.save(buf, format="PNG")
-    return base64.b64encode(buf.getvalue()).decode("utf-8")
-
-
-def extract_text_from_response(resp) -> str:
-    """
-    Extrahiert Text aus der Anthropic-Response.
-    resp.content ist eine Liste von Content-Blocks (meist Text).
-    """
-    text_parts = []
-    try:
-        # v1 SDK: content = [TextBlock(type='text', text='...'), ...]
-        for block in (resp.content or []):
-            # Bei SDK-Objekten:
-            txt = getattr(block, "text", None)
-            if txt:
-                text_parts.append(txt)
-            # Fallback: falls dicts
-            elif isinstance(block, dict):
-                t = block.get("text")
-                if t:
-                    text_parts.append(t)
-    except Exception:
-        pass
-    return "".join(text_parts).strip()
-
-
-def get_usage_tokens(resp) -> tuple[int, int]:
-    """
-    Liefert (input_tokens, output_tokens), wenn vorhanden.
-    """
-    in_toks = 0
-    out_toks = 0
-    try:
-        in_toks = int(getattr(resp.usage, "input_tokens", 0) or 0)
-        out_toks = int(getattr(resp.usage, "output_tokens", 0) or 0)
-    except Exception:
-        pass
-    return in_toks, out_toks
-
-
-def send_page_to_claude(image: Image.Image, prompt: str) -> tuple[str, int, int]:
-    """
-    Sendet eine Seite (PIL.Image) + Prompt an Claude.
-    Gibt (antwort_text, input_tokens, output_tokens) zurück.
-    """
-    image_b64 = pil_to_base64_png(image)
-    resp = client.messages.create(
-        model=MODEL_NAME,
-        temperature=TEMPERATURE,
-        max_tokens=MAX_OUTPUT_TOKENS,
-        messages=[{
-            "role": "user",
-            "content": [
-                {"type": "text", "text": prompt},
-                {
-                    "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": "image/png",
-                        "data": image_b64,
-                    },
-                },
-            ],
-        }],
+def build_pipeline() -> Pipeline:
+    """Konfiguriert die Pipeline für die Claude-Transkription (synchron oder als Message Batches)."""
+    batch_options = {"poll_interval": BATCH_POLL_INTERVAL} if BATCH_MODE else {}
+    pipeline_class = BatchPipeline if BATCH_MODE else Pipeline
+    return pipeline_class(
+        ClaudeProvider(MODEL_NAME, temperature=TEMPERATURE, max_tokens=MAX_OUTPUT_TOKENS,
+                       cache_prompt=PROMPT_CACHING),
+        TranscriptionTask(PROMPT),
+        input_dir=input_dir,
+        output_dir=output_dir,
+        dpi=DPI,
+        render_workers=RENDER_WORKERS,
+        encoding=IMAGE_ENCODING,
+        concurrency=MAX_CONCURRENT_REQUESTS,
+        stream=STREAM_RESPONSES,
+        dedup_distance=DEDUP_MAX_DISTANCE,
+        cleanup=PAGE_CLEANUP,
+        content_filter=CONTENT_FILTER,
+        result_store=RESULT_STORE,
+        rate_limit=RATE_LIMIT,
+        use_cache=USE_CACHE,
+        resume=RESUME,
+        budget_dollars=BUDGET_DOLLARS,
+        **batch_options,
     )
-    answer_text = extract_text_from_response(resp)
-    in_toks, out_toks = get_usage_tokens(resp)
-    return answer_text, in_toks, out_toks
-
 
-# Hauptlogik
 
 def main():
-    start_time = time.time()
-    total_files = 0
-    total_in_tokens = 0
-    total_out_tokens = 0
-
-    print("----------------------------------------")
-    print(f"Suche PDFs in: {os.path.abspath(input_dir)}")
-
-    for root, _, filenames in os.walk(input_dir):
-        for filename in filenames:
-            if not filename.lower().endswith(".pdf"):
-                continue
-
-            total_files += 1
-            pdf_path = os.path.join(root, filename)
-            print("----------------------------------------")
-            print(f"> Verarbeite PDF ({total_files}): {filename}")
-
-            # PDF -> Bilder (DPI ggf. erhöhen für bessere Erkennung)
-            try:
-                images = convert_from_path(pdf_path, dpi=300)  # dpi=300 meist sinnvoll
-            except Exception as e:
-                print(f"❌ Fehler beim Konvertieren von {filename}: {e}")
-                continue
-
-            # Jede Seite senden
-            for i, image in enumerate(images):
-                print(f"> Sende Seite {i+1} an Claude...", end=" ", flush=True)
-                try:
-                    answer_text, in_toks, out_toks = send_page_to_claude(image, PROMPT)
-                    total_in_tokens += in_toks
-                    total_out_tokens += out_toks
-
-                    # Ergebnis speichern
-                    base_name = os.path.splitext(filename)[0]
-                    out_path = os.path.join(output_dir, f"{base_name}_page_{i+1}.txt")
-                    with open(out_path, "w", encoding="utf-8") as f:
-                        f.write(answer_text or "")
-
-                    print("Done.")
-                except Exception as e:
-                    print(f"\n❌ Fehler bei Seite {i+1} von {filename}: {e}")
-
-    # Zusammenfassung
-    end_time = time.time()
-    duration = end_time - start_time
-
-    print("----------------------------------------")
-    print(f"Total processing time: {duration:.2f} seconds")
-    print(f"Total token cost (in/out): {total_in_tokens} / {total_out_tokens}")
-
-    if total_files > 0:
-        avg_out = total_out_tokens / total_files
-        print(f"Average output tokens per file: {avg_out:.2f}")
-    else:
-        print("No files were processed — check input directory or file types.")
-
-    total_in_cost = total_in_tokens / 1e6 * input_cost_per_mio_in_dollars
-    total_out_cost = total_out_tokens / 1e6 * output_cost_per_mio_in_dollars
-    print(f"Estimated cost (in/out): ${total_in_cost:.2f} / ${total_out_cost:.2f}")
-    print("----------------------------------------")
+    """Transkribiert alle Seiten von input_dir mit den Einstellungen oben."""
+    build_pipeline().run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,179 @@
+"""Cost ledger and dollar budget of pipeline runs.
+
+Every answered request is appended to <output_dir>/.cost_ledger.jsonl with its tokens, the price
+version (pricing.py) and its cost. From the ledger the engine
+- projects the spend of the pages still queued (mean cost per page so far x pages left),
+- enforces a hard dollar cap per run (budget): the cost of a request is reserved before it is
+  dispatched, with the output limit as worst case. If the reservation does not fit, dispatch pauses
+  until the requests in flight have settled (they usually cost less than reserved) and stops when
+  nothing is in flight any more. Pages that were not sent stay out of the journal, so a later run
+  with a larger budget continues with them,
+- writes cost_report.json with the spend per document and per folder over all runs of the output folder.
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict
+
+from page_journal import atomic_write_text
+from pricing import CURRENT_PRICE_VERSION, Price
+
+LEDGER_FILENAME = ".cost_ledger.jsonl"
+REPORT_FILENAME = "cost_report.json"
+DEFAULT_OUTPUT_RESERVATION = 4096  # Output tokens reserved per request if the provider sets no limit
+
+
+class BudgetExceeded(RuntimeError):
+    """Dispatching the request would exceed the budget of the run."""
+
+
+class CostLedger:  # pylint: disable=too-many-instance-attributes
+    """Per-request costs of a run, the budget reservations and the cost report of the output folder."""
+
+    def __init__(self, output_dir: str, model: str, price: Price, price_version: str = CURRENT_PRICE_VERSION,
+                 price_factor: float = 1.0, budget: float = None):
+        self.path = os.path.join(output_dir, LEDGER_FILENAME)
+        self.report_path = os.path.join(output_dir, REPORT_FILENAME)
+        self.model = model
+        self.price = price
+        self.price_version = price_version
+        self.price_factor = price_factor
+        self.budget = budget
+        self.spent = 0.0     # Dollars of this run
+        self.pages = 0       # Pages charged in this run
+        self.documents = set()  # (folder, doc) of the documents charged in this run
+        self.requests = 0
+        self.reserved = 0.0  # Dollars reserved for requests in flight
+        self.stopped = False
+        self._settled = None  # asyncio.Event, created in the running event loop
+
+    def cost(self, input_tokens: int, output_tokens: int, cache_read_tokens: int = 0,
+             cache_write_tokens: int = 0) -> float:
+        """Dollars for the tokens of a request."""
+        return (input_tokens * self.price.input + output_tokens * self.price.output
+                + cache_read_tokens * self.price.cache_read
+                + cache_write_tokens * self.price.cache_write) / 1e6 * self.price_factor
+
+    def estimate(self, input_tokens: int, max_output_tokens: int | None) -> float:
+        """Worst-case dollars of a request that is about to be sent."""
+        return self.cost(input_tokens, max_output_tokens or DEFAULT_OUTPUT_RESERVATION)
+
+    def charge(self, doc_name: str, page_no: int | None, pages: int, folder: str, response) -> float:
+        """Record the cost of an answered request; returns the cost."""
+        cost = self.cost(response.input_tokens, response.output_tokens,
+                         response.cache_read_tokens, response.cache_write_tokens)
+        self.spent += cost
+        self.pages += pages
+        self.documents.add((folder, doc_name))
+        self.requests += 1
+        record = {
+            "time": time.time(), "doc": doc_name, "page": page_no, "pages": pages, "folder": folder,
+            "model": self.model, "price_version": self.price_version, "price_factor": self.price_factor,
+            "input_tokens": response.input_tokens, "output_tokens": response.output_tokens,
+            "cache_read_tokens": response.cache_read_tokens, "cache_write_tokens": response.cache_write_tokens,
+            "cost": cost,
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return cost
+
+    # Budget
+
+    def try_reserve(self, amount: float) -> bool:
+        """Reserve amount dollars if it fits into the budget."""
+        if self.budget is None:
+            return True
+        if self.stopped or self.spent + self.reserved + amount > self.budget:
+            return False
+        self.reserved += amount
+        return True
+
+    async def reserve(self, amount: float):
+        """Reserve amount dollars; waits for requests in flight, raises BudgetExceeded if it never fits."""
+        while not self.try_reserve(amount):
+            if self.stopped or self.reserved <= 0:
+                self.stop()
+                raise BudgetExceeded(f"Budget of ${self.budget:.2f} reached")
+            if self._settled is None:
+                self._settled = asyncio.Event()
+            self._settled.clear()
+            await self._settled.wait()
+
+    def release(self, amount: float):
+        """Return a reservation (after the request was charged or has failed)."""
+        if self.budget is None:
+            return
+        self.reserved = max(0.0, self.reserved - amount)
+        if self._settled is not None:
+            self._settled.set()
+
+    def stop(self):
+        """Stop dispatching for the rest of the run."""
+        if not self.stopped:
+            self.stopped = True
+            print(f"> Budget of ${self.budget:.2f} reached (${self.spent:.2f} spent, ${self.reserved:.2f} in flight): "
+                  "no further requests are sent")
+        if self._settled is not None:
+            self._settled.set()
+
+    def cost_per_page(self) -> float:
+        """Mean dollars per charged page of this run."""
+        return self.spent / self.pages if self.pages else 0.0
+
+    def projection(self, pages_left: int) -> float:
+        """Projected spend of the run: spent so far plus the mean cost of the pages left."""
+        return self.spent + self.cost_per_page() * max(0, pages_left)
+
+    # Report
+
+    def load(self) -> list[dict]:
+        """All records of the ledger (all runs of the output folder)."""
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # Torn last line of an interrupted run
+        return records
+
+    def write_report(self) -> str | None:
+        """Write the spend per document and per folder of the whole ledger; returns the path."""
+        records = self.load()
+        if not records:
+            return None
+        documents = defaultdict(lambda: {"folder": "", "pages_charged": 0, "requests": 0, "input_tokens": 0,
+                                         "output_tokens": 0, "cost": 0.0})
+        for record in records:
+            document = documents[os.path.join(record.get("folder") or "", record["doc"])]
+            document["folder"] = record.get("folder") or ""
+            document["pages_charged"] += record["pages"]
+            document["requests"] += 1
+            document["input_tokens"] += (record["input_tokens"] + record["cache_read_tokens"]
+                                         + record["cache_write_tokens"])
+            document["output_tokens"] += record["output_tokens"]
+            document["cost"] += record["cost"]
+        folders = defaultdict(lambda: {"documents": 0, "pages_charged": 0, "cost": 0.0})
+        for document in documents.values():
+            folder = folders[document["folder"]]
+            folder["documents"] += 1
+            folder["pages_charged"] += document["pages_charged"]
+            folder["cost"] += document["cost"]
+        for folder in folders.values():
+            folder["cost_per_page"] = folder["cost"] / folder["pages_charged"] if folder["pages_charged"] else 0.0
+            folder["cost_per_document"] = folder["cost"] / folder["documents"]
+        report = {
+            "models": sorted({r["model"] for r in records}),
+            "price_versions": sorted({r["price_version"] for r in records}),
+            "total_cost": sum(r["cost"] for r in records),
+            "requests": len(records),
+            "folders": dict(sorted(folders.items())),
+            "documents": dict(sorted(documents.items())),
+        }
+        atomic_write_text(self.report_path, json.dumps(report, indent=2, ensure_ascii=False))
+        return self.report_path
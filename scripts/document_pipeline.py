@@ -0,0 +1,139 @@
+"""Whole-document mode of the pipeline engine (Gemini Files API).
+
+The per-page mode renders every page and sends it with the full prompt, so the prompt is paid once
+per page and entities that continue on the next page are split. DocumentPipeline uploads each PDF
+once through the Files API and asks for the entities of the whole document in a single request
+(DocumentNerTask adds page attribution to the prompt). The answer is written
+- as <doc>.json (whole document, cross-page entities together) and
+- split into the usual <doc>_page_<n>.json files, which are recorded in the journal,
+so evaluation and resume work the same as for the per-page mode. Documents are processed as a whole:
+if any page is missing, the document is sent again.
+"""
+
+import asyncio
+import os
+import time
+from typing import NamedTuple
+
+from cost_ledger import BudgetExceeded
+from llm_cache import ResponseCache
+from page_journal import atomic_write_text
+from pdf_pages import get_page_count, iter_pdf_files
+from pipeline import Pipeline
+from run_trace import PageTrace
+from tasks import TaskParseError
+
+GEMINI_TOKENS_PER_PDF_PAGE = 258  # Image tokens per document page; the extracted text comes on top
+
+
+def read_bytes(path: str) -> bytes:
+    """Content of a file (for the cache key)."""
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class UploadedDocument(NamedTuple):
+    """A document uploaded through the Files API."""
+    file: object
+    page_count: int
+
+
+class DocumentPipeline(Pipeline):
+    """Pipeline that sends every PDF as one document instead of one image per page.
+
+    Needs a GeminiProvider (upload, send_document) and a DocumentNerTask (split_pages).
+    """
+
+    def plan_jobs(self) -> list[tuple[str, int]]:
+        """(path, page_count) of every PDF with at least one pending page."""
+        jobs = []
+        for filename, path in iter_pdf_files(self.input_dir):
+            self.stats.files += 1
+            self.register_document(filename, path)
+            try:
+                page_count = get_page_count(path)
+            except Exception as e:  # pylint: disable=broad-except
+                print(f"❌ Fehler beim Lesen von {filename}: {e}")
+                continue
+            pending = [n for n in range(1, page_count + 1) if not (self.resume and self.is_done(filename, n))]
+            print(f"> File ({self.stats.files}): {filename} — {len(pending)} of {page_count} pages pending")
+            if pending:
+                jobs.append((path, page_count))
+                self.stats.pages_planned += page_count
+            else:
+                self.stats.pages_skipped += page_count
+        return jobs
+
+    def estimate_input_tokens(self, prompt: str, encoded) -> int:
+        """Rough input tokens of a document request."""
+        if encoded is None:
+            return super().estimate_input_tokens(prompt, encoded)
+        return len(prompt) // 3 + encoded.page_count * GEMINI_TOKENS_PER_PDF_PAGE * 2
+
+    async def send_request(self, prompt: str, encoded):
+        """One request with the whole uploaded document (text-only requests as usual)."""
+        if encoded is None:
+            return await super().send_request(prompt, encoded)
+        return await self.provider.send_document(prompt, encoded.file)
+
+    async def answer_document(self, path: str, prompt: str, page_count: int, trace: PageTrace) -> str:
+        """Answer text for a whole document (from the cache or after uploading it)."""
+        data = await asyncio.to_thread(read_bytes, path)
+        trace.payload_bytes = len(data)
+        key = ResponseCache.make_key(self.provider.model, prompt, self.provider.cache_params(), data)
+        cached = self.cache.get(key)
+        if cached is not None:
+            trace.cached = True
+            return cached["text"]
+        start = time.perf_counter()
+        uploaded = await self.provider.upload(path)
+        trace.encode = time.perf_counter() - start
+        try:
+            response = await self.send_with_retries(prompt, UploadedDocument(uploaded, page_count), trace)
+        finally:
+            await self.provider.delete_upload(uploaded)
+        self.record_response(key, response)
+        return response.text
+
+    def write_document(self, doc_name: str, result: dict, page_count: int):
+        """Write <doc>.json and the per-page files (which are recorded in the journal)."""
+        atomic_write_text(self.output_path(doc_name, None), self.task.serialize(result))
+        for page_no, page_result in self.task.split_pages(result, page_count).items():
+            self.write_result(doc_name, page_no, page_result)
+
+    async def process_document(self, path: str, page_count: int):
+        """Upload → send → parse → write for one document."""
+        doc_name = os.path.basename(path)
+        trace = self.new_trace(doc_name, None, pages=page_count)
+        try:
+            text = await self.answer_document(path, self.task.prompt_for(doc_name, None), page_count, trace)
+            result = await self.parse_answer(text, trace)
+            start = time.perf_counter()
+            await asyncio.to_thread(self.write_document, doc_name, result, page_count)
+            trace.write = time.perf_counter() - start
+        except BudgetExceeded as e:
+            self.skip_over_budget(trace, e)
+            return
+        except TaskParseError as e:
+            self.fail_page(trace, f"> {doc_name}: {e}", e, status="failed")
+            return
+        except Exception as e:  # pylint: disable=broad-except
+            self.fail_page(trace, f"❌ Fehler bei {doc_name}: {e}", e)
+            return
+        self.stats.pages_done += page_count
+        self.tracer.write(trace)
+        print(f"> {doc_name} ({page_count} pages) ... Done."
+              + (f" (repaired: {', '.join(trace.repairs)})" if trace.repairs else ""))
+
+    async def run_async(self):
+        """Process up to `concurrency` documents at the same time."""
+        jobs = await asyncio.to_thread(self.plan_jobs)
+        print("----------------------------------------")
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_one(path: str, page_count: int):
+            async with semaphore:
+                if not self.ledger.stopped:
+                    await self.process_document(path, page_count)
+
+        await asyncio.gather(*(run_one(path, page_count) for path, page_count in jobs))
@@ -0,0 +1,322 @@
+"""Queryable index of the entities in the NER results.
+
+answers/google_ner holds hundreds of <doc>_page_<n>.json files. Finding the documents that mention a
+person or the places near a town used to mean parsing all of them. The index keeps the postings
+entity -> document/page/mentions of all result files in one SQLite file:
+- every person and place with name, normalized name, confidence, geo coordinates and mentions,
+- the words of name and normalized name (casefolded, without diacritics) as an inverted index, so
+  "reynold" finds "Gonzague de Reynold" as well as "de Reynold, Gonzague" and "Dr.Reynold",
+- path, size and mtime of every indexed file: build only parses new or changed files and drops the
+  entities of deleted ones, so it can run after every NER run (or while one is running).
+Answers stored as {"error": ..., "raw_text": ...} are read with the NER parser, like in the result store.
+
+    python entity_index.py build                               # index ../answers/google_ner (incremental)
+    python entity_index.py build ../answers/other_ner --rebuild
+    python entity_index.py find "Gonzague de Reynold"
+    python entity_index.py find feldk --type place --prefix
+    python entity_index.py near Feldkirch --km 20
+    python entity_index.py stats
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+
+from result_store import ner_result
+
+DEFAULT_INDEX_PATH = "../answers/entity_index.sqlite"
+DEFAULT_NER_DIR = "../answers/google_ner"
+KINDS = {"persons": "person", "places": "place"}
+PAGE_FILE = re.compile(r"^(?P<doc>.+)_page_(?P<page>\d+)\.json$")  # <doc>.json of the document mode is split too
+EARTH_RADIUS_KM = 6371.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, folder TEXT NOT NULL, doc TEXT NOT NULL,
+    page INTEGER NOT NULL, size INTEGER NOT NULL, mtime REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS entities (
+    id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL REFERENCES files (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL, name TEXT NOT NULL, normalized TEXT, name_key TEXT NOT NULL, normalized_key TEXT,
+    confidence REAL, lat REAL, lon REAL, mentions TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT NOT NULL, entity_id INTEGER NOT NULL REFERENCES entities (id) ON DELETE CASCADE,
+    PRIMARY KEY (term, entity_id)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_entities_file ON entities (file_id);
+CREATE INDEX IF NOT EXISTS idx_entities_name ON entities (name_key);
+CREATE INDEX IF NOT EXISTS idx_entities_normalized ON entities (normalized_key);
+CREATE INDEX IF NOT EXISTS idx_entities_geo ON entities (lat, lon) WHERE lat IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_terms_entity ON terms (entity_id);
+"""
+
+
+def fold(text: str) -> str:
+    """Search key of a name: casefolded, without diacritics and punctuation, single spaces."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^\w]+", " ", text).split())
+
+
+def number(value) -> float | None:
+    """Float of a JSON value, None if it is not a number."""
+    try:
+        result = float(value)
+    except (TypeError, ValueError):
+        return None
+    return result if math.isfinite(result) else None
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance (haversine)."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class EntityIndex:
+    """SQLite index of the persons and places of NER result files."""
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        """Close the database."""
+        self._conn.close()
+
+    # Building
+
+    def reset(self):
+        """Forget all indexed files (--rebuild)."""
+        with self._conn:
+            self._conn.execute("DELETE FROM files")
+
+    def update(self, ner_dir: str) -> dict:
+        """Index new and changed result files below ner_dir and drop deleted ones; returns counters."""
+        counts = {"indexed": 0, "unchanged": 0, "removed": 0, "invalid": 0}
+        root = os.path.abspath(ner_dir)
+        known = {path: (file_id, size, mtime) for file_id, path, size, mtime in self._conn.execute(
+            "SELECT id, path, size, mtime FROM files WHERE path LIKE ? ESCAPE '\\'",
+            (root.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + os.sep + "%",))}
+        seen = set()
+        with self._conn:
+            for folder, _, filenames in os.walk(root):
+                for filename in sorted(filenames):
+                    match = PAGE_FILE.match(filename)
+                    if match is None:
+                        continue
+                    path = os.path.join(folder, filename)
+                    seen.add(path)
+                    stat = os.stat(path)
+                    if path in known and known[path][1:] == (stat.st_size, stat.st_mtime):
+                        counts["unchanged"] += 1
+                        continue
+                    if path in known:
+                        self._conn.execute("DELETE FROM files WHERE id = ?", (known[path][0],))
+                    if self.add_file(path, os.path.relpath(folder, root), match["doc"], int(match["page"]), stat):
+                        counts["indexed"] += 1
+                    else:
+                        counts["invalid"] += 1
+            for path in known.keys() - seen:
+                self._conn.execute("DELETE FROM files WHERE id = ?", (known[path][0],))
+                counts["removed"] += 1
+        return counts
+
+    def add_file(self, path: str, folder: str, doc: str, page: int, stat: os.stat_result) -> bool:
+        """Index one result file; False if it is not a readable NER result (it is indexed without entities)."""
+        file_id = self._conn.execute(
+            "INSERT INTO files (path, folder, doc, page, size, mtime) VALUES (?, ?, ?, ?, ?, ?)",
+            (path, folder, doc, page, stat.st_size, stat.st_mtime)).lastrowid
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, UnicodeDecodeError, json.JSONDecodeError):
+            return False
+        data = ner_result(data)
+        if not isinstance(data, dict):
+            return False
+        for key, kind in KINDS.items():
+            entities = data.get(key)
+            for entity in entities if isinstance(entities, list) else []:
+                if isinstance(entity, dict) and isinstance(entity.get("name"), str) and entity["name"].strip():
+                    self.add_entity(file_id, kind, entity)
+        return True
+
+    def add_entity(self, file_id: int, kind: str, entity: dict):
+        """Insert one person or place with its search terms."""
+        name = entity["name"].strip()
+        normalized = entity.get("normalized") if isinstance(entity.get("normalized"), str) else None
+        normalized = normalized.strip() or None if normalized else None
+        geo = entity.get("geo") if isinstance(entity.get("geo"), dict) else {}
+        lat, lon = number(geo.get("lat")), number(geo.get("lon"))
+        if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            lat = lon = None
+        mentions = entity.get("mentions") if isinstance(entity.get("mentions"), list) else []
+        name_key, normalized_key = fold(name), fold(normalized) if normalized else None
+        entity_id = self._conn.execute(
+            "INSERT INTO entities (file_id, kind, name, normalized, name_key, normalized_key, confidence, lat, lon, "
+            "mentions) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (file_id, kind, name, normalized, name_key, normalized_key, number(entity.get("confidence")), lat, lon,
+             json.dumps([m for m in mentions if isinstance(m, dict)], ensure_ascii=False))).lastrowid
+        terms = set(name_key.split()) | set((normalized_key or "").split())
+        self._conn.executemany("INSERT OR IGNORE INTO terms (term, entity_id) VALUES (?, ?)",
+                               [(term, entity_id) for term in terms])
+
+    # Queries
+
+    def find(self, query: str, kind: str = None, exact: bool = False, prefix: bool = False) -> list[dict]:
+        """Postings of the entities matching query, one per result file.
+
+        Default: every word of the query is a word of the name or the normalized name. prefix: the last
+        word may be the start of a word. exact: the whole name or normalized name equals the query.
+        """
+        key = fold(query)
+        if not key:
+            return []
+        if exact:
+            where, params = "(e.name_key = ? OR e.normalized_key = ?)", [key, key]
+        else:
+            words = key.split()
+            clauses, params = [], []
+            for i, word in enumerate(words):
+                if prefix and i == len(words) - 1:
+                    # Range on the primary key instead of LIKE, so the lookup uses the index
+                    clauses.append("e.id IN (SELECT entity_id FROM terms WHERE term >= ? AND term < ?)")
+                    params += [word, word + "\U0010ffff"]
+                else:
+                    clauses.append("e.id IN (SELECT entity_id FROM terms WHERE term = ?)")
+                    params.append(word)
+            where = " AND ".join(clauses)
+        if kind is not None:
+            where += " AND e.kind = ?"
+            params.append(kind)
+        rows = self._conn.execute(
+            "SELECT e.kind, e.name, e.normalized, e.confidence, e.lat, e.lon, e.mentions, f.folder, f.doc, f.page, "
+            f"f.path FROM entities e JOIN files f ON f.id = e.file_id WHERE {where} ORDER BY f.doc, f.page, f.folder",
+            params).fetchall()
+        columns = ("kind", "name", "normalized", "confidence", "lat", "lon", "mentions", "folder", "doc", "page",
+                   "path")
+        postings = [dict(zip(columns, row)) for row in rows]
+        for posting in postings:
+            posting["mentions"] = json.loads(posting["mentions"])
+        return postings
+
+    def near(self, place: str, km: float) -> tuple[tuple[float, float] | None, list[dict]]:
+        """Places within km of a place of the index: (centre, places sorted by distance).
+
+        The centre is the mean of the coordinates the model gave for the place. The bounding box of the
+        circle is looked up through the (lat, lon) index; only its few rows are measured exactly.
+        """
+        key = fold(place)
+        row = self._conn.execute(
+            "SELECT avg(lat), avg(lon) FROM entities WHERE kind = 'place' AND lat IS NOT NULL "
+            "AND (name_key = ? OR normalized_key = ?)", (key, key)).fetchone()
+        if row[0] is None:
+            return None, []
+        lat, lon = row
+        dlat = math.degrees(km / EARTH_RADIUS_KM)
+        dlon = 180.0 if abs(lat) + dlat >= 90 else math.degrees(km / (EARTH_RADIUS_KM * math.cos(math.radians(lat))))
+        rows = self._conn.execute(
+            "SELECT coalesce(e.normalized, e.name), e.lat, e.lon, f.folder, f.doc, f.page FROM entities e "
+            "JOIN files f ON f.id = e.file_id "
+            "WHERE e.kind = 'place' AND e.lat BETWEEN ? AND ? AND e.lon BETWEEN ? AND ?",
+            (lat - dlat, lat + dlat, lon - dlon, lon + dlon)).fetchall()
+        places = {}
+        for name, place_lat, place_lon, folder, doc, page in rows:
+            distance = distance_km(lat, lon, place_lat, place_lon)
+            if distance > km:
+                continue
+            entry = places.setdefault(fold(name), {"name": name, "distance_km": distance, "pages": set()})
+            entry["distance_km"] = min(entry["distance_km"], distance)
+            entry["pages"].add((folder, doc, page))
+        return (lat, lon), sorted(places.values(), key=lambda entry: (entry["distance_km"], entry["name"]))
+
+    def stats(self) -> dict:
+        """Number of files, documents, entities and distinct names in the index."""
+        query = self._conn.execute
+        return {
+            "files": query("SELECT count(*) FROM files").fetchone()[0],
+            "documents": query("SELECT count(DISTINCT doc) FROM files").fetchone()[0],
+            "persons": query("SELECT count(*) FROM entities WHERE kind = 'person'").fetchone()[0],
+            "places": query("SELECT count(*) FROM entities WHERE kind = 'place'").fetchone()[0],
+            "places with coordinates": query("SELECT count(*) FROM entities WHERE lat IS NOT NULL").fetchone()[0],
+            "distinct names": query("SELECT count(DISTINCT coalesce(normalized_key, name_key)) FROM entities")
+            .fetchone()[0],
+        }
+
+
+def print_postings(postings: list[dict]):
+    """Postings grouped by entity name and document."""
+    groups = {}
+    for posting in postings:
+        label = posting["name"] + (f" ({posting['normalized']})" if posting["normalized"] not in (None, posting["name"])
+                                   else "")
+        groups.setdefault((posting["kind"], label), {}).setdefault((posting["folder"], posting["doc"]), []).append(
+            (posting["page"], len(posting["mentions"])))
+    for (kind, label), documents in sorted(groups.items()):
+        print(f"{kind} {label}: {len(documents)} documents")
+        for (folder, doc), pages in sorted(documents.items()):
+            listed = ", ".join(f"p.{page}" + (f" ({mentions}x)" if mentions > 1 else "") for page, mentions in pages)
+            print(f"    {folder}/{doc}: {listed}")
+
+
+def main():
+    """Command line: build the index, find entities or places near a place."""
+    parser = argparse.ArgumentParser(description="Index of the persons and places in the NER results")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="SQLite file of the index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="index new and changed result files (incremental)")
+    build.add_argument("ner_dirs", nargs="*", default=[DEFAULT_NER_DIR])
+    build.add_argument("--rebuild", action="store_true", help="drop the index and parse every file again")
+    find = commands.add_parser("find", help="documents and pages that mention an entity")
+    find.add_argument("query")
+    find.add_argument("--type", choices=sorted(KINDS.values()))
+    find.add_argument("--exact", action="store_true", help="the whole name must match")
+    find.add_argument("--prefix", action="store_true", help="the last word may be the start of a word")
+    near = commands.add_parser("near", help="places within a distance of a place")
+    near.add_argument("place")
+    near.add_argument("--km", type=float, default=25.0)
+    commands.add_parser("stats", help="size of the index")
+    args = parser.parse_args()
+
+    index = EntityIndex(args.index)
+    start = time.perf_counter()
+    try:
+        if args.command == "build":
+            if args.rebuild:
+                index.reset()
+            for ner_dir in args.ner_dirs:
+                counts = index.update(ner_dir)
+                print(f"> {ner_dir}: " + ", ".join(f"{count} {label}" for label, count in counts.items()))
+        elif args.command == "find":
+            postings = index.find(args.query, args.type, args.exact, args.prefix)
+            print_postings(postings)
+            print(f"{len(postings)} postings")
+        elif args.command == "near":
+            centre, places = index.near(args.place, args.km)
+            if centre is None:
+                print(f"No coordinates for {args.place} in the index.")
+            else:
+                print(f"Places within {args.km:g} km of {args.place} ({centre[0]:.4f}, {centre[1]:.4f}):")
+                for entry in places:
+                    documents = len({(folder, doc) for folder, doc, _ in entry["pages"]})
+                    print(f"    {entry['distance_km']:>6.1f} km  {entry['name']}: {documents} documents, "
+                          f"{len(entry['pages'])} pages")
+        else:
+            for label, count in index.stats().items():
+                print(f"{label}: {count}")
+    finally:
+        index.close()
+    print(f"({(time.perf_counter() - start) * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Precision, recall and F1 of NER results against a reference (another run or gold annotations).
+
+The reference and the predictions are folders of <doc>_page_<n>.json files with the persons/places
+schema of the NER prompt (gold annotations are written in the same schema). The pages of the reference
+define the evaluation: a page without a prediction counts as a page without entities, predicted pages
+without a reference are only counted. Entities are matched per page and type, one to one:
+- exact: the names are equal,
+- normalized: the normalized names (the name if there is none), casefolded and without diacritics and
+  punctuation, are equal (entity_index.fold),
+- overlap: the mention offsets overlap. The spans of both sides are swept in the order of their start;
+  of the overlapping pairs, the entities sharing the most characters are matched first. Entities
+  without offsets cannot match in this mode.
+Documents are evaluated in parallel processes. Results stored as {"error": ..., "raw_text": ...} are
+read with the NER parser, like in the result store.
+
+    python evaluate_ner.py "../answers/google_ner/Test Results" "../answers/google_ner/Schreibmaschine Results"
+    python evaluate_ner.py ../gold_ner ../answers/google_ner --match overlap --by-folder
+    python evaluate_ner.py ../gold_ner ../answers/google_ner --report ner_scores.json
+"""
+
+import argparse
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from entity_index import fold
+from result_store import RESULT_FILE, entity_rows, result_files
+
+KINDS = ("person", "place")
+MATCH_MODES = ("exact", "normalized", "overlap")
+COUNTS = ("reference", "predicted", "tp", "fp", "fn")
+
+
+def read_entities(path: str | None) -> list[dict]:
+    """Persons and places of a result file; none for a missing or unreadable file."""
+    if path is None:
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return entity_rows(json.load(f))
+    except (OSError, UnicodeDecodeError, json.JSONDecodeError):
+        return []
+
+
+def match_keys(reference: list[str], predicted: list[str]) -> int:
+    """Matches between two lists of keys (each key matches at most once)."""
+    return sum((Counter(reference) & Counter(predicted)).values())
+
+
+def overlapping_spans(reference: list[tuple[int, int, int]], predicted: list[tuple[int, int, int]]) -> Counter:
+    """Characters shared by each pair of (reference entity, predicted entity) with overlapping spans.
+
+    Spans are (start, end, entity). Sweep over the spans of both sides sorted by start: a new span overlaps
+    exactly the spans of the other side that are still open, i.e. end after its start.
+    """
+    shared = Counter()
+    events = sorted([(start, end, 0, entity) for start, end, entity in reference]
+                    + [(start, end, 1, entity) for start, end, entity in predicted])
+    open_spans = ([], [])
+    for start, end, side, entity in events:
+        other = [(other_end, other_entity) for other_end, other_entity in open_spans[1 - side] if other_end > start]
+        open_spans = (other, open_spans[1]) if side else (open_spans[0], other)
+        for other_end, other_entity in other:
+            shared[(entity, other_entity) if side == 0 else (other_entity, entity)] += min(end, other_end) - start
+        open_spans[side].append((end, entity))
+    return shared
+
+
+def match_overlap(reference: list[dict], predicted: list[dict]) -> int:
+    """One-to-one matches of entities by overlapping mentions, largest overlap first."""
+    def spans(entities):
+        return [(m["start"], m["end"], i) for i, entity in enumerate(entities) for m in entity["mentions"]
+                if m["end"] > m["start"]]
+    shared = overlapping_spans(spans(reference), spans(predicted))
+    used_reference, used_predicted = set(), set()
+    for (ref, pred), _ in sorted(shared.items(), key=lambda item: -item[1]):
+        if ref not in used_reference and pred not in used_predicted:
+            used_reference.add(ref)
+            used_predicted.add(pred)
+    return len(used_reference)
+
+
+def page_counts(reference: list[dict], predicted: list[dict], mode: str) -> dict[str, Counter]:
+    """Counts per entity type of one page."""
+    counts = {}
+    for kind in KINDS:
+        ref = [entity for entity in reference if entity["kind"] == kind]
+        pred = [entity for entity in predicted if entity["kind"] == kind]
+        if mode == "overlap":
+            tp = match_overlap(ref, pred)
+        elif mode == "normalized":
+            tp = match_keys([fold(e["normalized"] or e["name"]) for e in ref],
+                            [fold(e["normalized"] or e["name"]) for e in pred])
+        else:
+            tp = match_keys([e["name"].strip() for e in ref], [e["name"].strip() for e in pred])
+        counts[kind] = Counter(reference=len(ref), predicted=len(pred), tp=tp, fp=len(pred) - tp, fn=len(ref) - tp)
+    return counts
+
+
+def evaluate_document(pages: list[tuple[str, str | None]], mode: str) -> dict[str, Counter]:
+    """Counts per entity type of the (reference, prediction) result files of one document."""
+    total = {kind: Counter() for kind in KINDS}
+    for reference_path, predicted_path in pages:
+        for kind, counts in page_counts(read_entities(reference_path), read_entities(predicted_path), mode).items():
+            total[kind].update(counts)
+    return total
+
+
+def scores(counts: Counter) -> tuple[float, float, float]:
+    """Precision, recall and F1 of a count; 0 where undefined."""
+    precision = counts["tp"] / counts["predicted"] if counts["predicted"] else 0.0
+    recall = counts["tp"] / counts["reference"] if counts["reference"] else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+
+def evaluate(reference_dir: str, predicted_dir: str, mode: str = "normalized", workers: int = None) -> dict:
+    """Counts per document and entity type; the documents are evaluated in parallel processes."""
+    reference = result_files(reference_dir, ".json", pages_only=True)
+    predicted = result_files(predicted_dir, ".json", pages_only=True)
+    documents = defaultdict(list)
+    for relative in sorted(reference):
+        doc = RESULT_FILE.match(os.path.basename(relative))["doc"]
+        documents[os.path.join(os.path.dirname(relative), doc)].append((reference[relative], predicted.get(relative)))
+    names = list(documents)
+    if (workers or os.cpu_count()) > 1 and len(names) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(names) // (4 * (workers or os.cpu_count())))
+            results = list(pool.map(evaluate_document, documents.values(), [mode] * len(names), chunksize=chunksize))
+    else:
+        results = [evaluate_document(pages, mode) for pages in documents.values()]
+    return {
+        "documents": dict(zip(names, results)),
+        "pages": len(reference),
+        "pages_missing": sum(1 for relative in reference if relative not in predicted),
+        "pages_extra": sum(1 for relative in predicted if relative not in reference),
+    }
+
+
+def total_counts(documents: dict[str, dict[str, Counter]]) -> dict[str, Counter]:
+    """Counts per entity type and over all types."""
+    total = {kind: Counter() for kind in (*KINDS, "all")}
+    for counts in documents.values():
+        for kind in KINDS:
+            total[kind].update(counts[kind])
+            total["all"].update(counts[kind])
+    return total
+
+
+def score_table(rows: list[tuple[str, Counter]]) -> list[str]:
+    """Lines of a table with counts, precision, recall and F1."""
+    lines = [f"{'':<40} {'ref':>6} {'pred':>6} {'tp':>6} {'fp':>6} {'fn':>6} {'P':>7} {'R':>7} {'F1':>7}"]
+    for name, counts in rows:
+        precision, recall, f1 = scores(counts)
+        lines.append(f"{name:<40} " + " ".join(f"{counts[key]:>6}" for key in COUNTS)
+                     + f" {precision:>7.3f} {recall:>7.3f} {f1:>7.3f}")
+    return lines
+
+
+def main():
+    """Command line: evaluate a result folder against a reference and print the scores."""
+    parser = argparse.ArgumentParser(description="Precision, recall and F1 of NER results against a reference")
+    parser.add_argument("reference_dir", help="gold annotations or the results of a reference run")
+    parser.add_argument("predicted_dir", help="results to evaluate")
+    parser.add_argument("--match", choices=MATCH_MODES, default="normalized")
+    parser.add_argument("--by-folder", action="store_true", help="scores per folder of the reference")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores, 1: serial)")
+    parser.add_argument("--report", help="write the counts per document and type to this JSON file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = evaluate(args.reference_dir, args.predicted_dir, args.match, args.workers)
+    seconds = time.perf_counter() - start
+    if not result["pages"]:
+        print("No result files found in the reference — check the directory.")
+        return
+    print("----------------------------------------")
+    print(f"{args.predicted_dir} against {args.reference_dir} ({args.match} match)")
+    print(f"Pages: {result['pages']} ({result['pages_missing']} without prediction, "
+          f"{result['pages_extra']} predicted pages without reference), {seconds:.2f} s")
+    total = total_counts(result["documents"])
+    print("\n".join(score_table([(kind, total[kind]) for kind in (*KINDS, "all")])))
+    if args.by_folder:
+        folders = defaultdict(lambda: {kind: Counter() for kind in KINDS})
+        for name, counts in result["documents"].items():
+            for kind in KINDS:
+                folders[os.path.dirname(name) or "."][kind].update(counts[kind])
+        print("\n".join(score_table([(f"{folder} {kind}", counts[kind])
+                                     for folder, counts in sorted(folders.items()) for kind in KINDS])[1:]))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"match": args.match, **{key: result[key] for key in ("pages", "pages_missing", "pages_extra")},
+                       "total": {kind: dict(counts) for kind, counts in total.items()},
+                       "documents": {name: {kind: dict(c) for kind, c in counts.items()}
+                                     for name, counts in result["documents"].items()}},
+                      f, indent=4, ensure_ascii=False)
+        print(f"Report: {args.report}")
+    print("----------------------------------------")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""Character and word error rates (CER/WER) of transcriptions against a reference.
+
+The reference is a folder of <doc>_page_<n>.txt files with ground-truth transcriptions or the results
+of another model (e.g. ../answers/google_transcript against ../answers/anthropic_transcript). Pages are
+matched by their path below the folders, or by the file name if the folders are structured differently
+(the Gemini results are split by script type, the Claude results are not). The pages of the reference
+define the evaluation: a missing prediction counts as an empty transcription.
+
+CER = edit distance of the characters / characters of the reference, WER the same over words. The edit
+distance is Myers' bit-parallel algorithm (in Hyyrö's formulation for the Levenshtein distance): the
+longer sequence is the bit pattern, held in one Python integer, so one step per element of the shorter
+sequence does a whole column of the dynamic programming table. Pages are evaluated in a process pool.
+
+Before the comparison both texts are normalized (TextNormalization): Unicode NFC and whitespace always;
+optionally long s (ſ -> s), umlauts (ä, a with a combining e, ae -> ae), hyphenation at line ends
+(Ver-/Ver¬/Ver⸗ + line break + handlung -> Verhandlung), case and punctuation. The report lists the
+rates per script type (the top folder of the reference, e.g. Fraktur-LLM-Results) and in total.
+
+    python evaluate_transcript.py ../gold_transcript ../answers/google_transcript --long-s --hyphenation
+    python evaluate_transcript.py ../answers/google_transcript ../answers/anthropic_transcript --all --worst 10
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+
+from result_store import result_files
+
+UMLAUTS = {"ä": "ae", "ö": "oe", "ü": "ue", "Ä": "Ae", "Ö": "Oe", "Ü": "Ue"}
+COMBINING_E = "\u0364"  # Small e above a vowel: the umlaut of Fraktur prints in some transcriptions
+HYPHENATION = re.compile(r"(\w)[-\u00ad\u2010\u2011\u00ac\u2e17=]\s*\n\s*(\w)")
+
+
+@dataclass
+class TextNormalization:
+    """What is normalized in both texts before the comparison."""
+    long_s: bool = False        # ſ -> s
+    umlauts: bool = False       # ä/a + combining e -> ae (both spellings of the umlaut compare equal)
+    hyphenation: bool = False   # Words hyphenated at the end of a line are joined
+    case: bool = False          # Compare casefolded
+    punctuation: bool = False   # Drop punctuation
+
+
+def normalize(text: str, options: TextNormalization) -> str:
+    """Normalized text; whitespace runs become one space."""
+    text = unicodedata.normalize("NFC", text)
+    if options.hyphenation:
+        text = HYPHENATION.sub(r"\1\2", text)
+    if options.long_s:
+        text = text.replace("ſ", "s")
+    if options.umlauts:
+        for vowel in "aouAOU":
+            text = text.replace(vowel + COMBINING_E, UMLAUTS[unicodedata.normalize("NFC", vowel + "\u0308")])
+        text = "".join(UMLAUTS.get(char, char) for char in text)
+    if options.case:
+        text = text.casefold()
+    if options.punctuation:
+        text = "".join(char for char in text if not unicodedata.category(char).startswith("P"))
+    return " ".join(text.split())
+
+
+def edit_distance(a, b) -> int:
+    """Levenshtein distance of two sequences (strings or lists of hashable elements), bit-parallel."""
+    # Common prefix and suffix cost nothing
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a, end_b = end_a - 1, end_b - 1
+    a, b = a[start:end_a], b[start:end_b]
+    if len(a) < len(b):
+        a, b = b, a  # The longer one is the bit pattern: fewer steps in Python, longer integers in C
+    if not b:
+        return len(a)
+    peq = {}
+    for i, element in enumerate(a):
+        peq[element] = peq.get(element, 0) | 1 << i
+    mask, last = (1 << len(a)) - 1, 1 << (len(a) - 1)
+    pv, mv, score = mask, 0, len(a)
+    for element in b:
+        eq = peq.get(element, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & mask
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = (ph << 1) | 1
+        mh <<= 1
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv
+    return score
+
+
+def read_text(path: str | None) -> str:
+    """Content of a transcription; empty for a missing file."""
+    if path is None:
+        return ""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def evaluate_page(reference_path: str, predicted_path: str | None, options: TextNormalization) -> dict:
+    """Character and word counts and edit distances of one page."""
+    reference = normalize(read_text(reference_path), options)
+    predicted = normalize(read_text(predicted_path), options)
+    reference_words = reference.split()
+    return {
+        "chars": len(reference), "char_errors": edit_distance(reference, predicted),
+        "words": len(reference_words), "word_errors": edit_distance(reference_words, predicted.split()),
+        "missing": predicted_path is None,
+    }
+
+
+def evaluate_pages(pages: list[tuple[str, str | None]], options: TextNormalization) -> list[dict]:
+    """evaluate_page for a chunk of pages (one task of the process pool)."""
+    return [evaluate_page(reference_path, predicted_path, options) for reference_path, predicted_path in pages]
+
+
+def pair_pages(reference_dir: str, predicted_dir: str) -> tuple[dict[str, tuple[str, str | None]], int]:
+    """Relative path of the reference -> (reference, prediction) and the number of unused predictions."""
+    reference, predicted = result_files(reference_dir, ".txt"), result_files(predicted_dir, ".txt")
+    by_name = defaultdict(list)
+    for relative, path in predicted.items():
+        by_name[os.path.basename(relative)].append(path)
+    pairs, used = {}, set()
+    for relative, path in sorted(reference.items()):
+        candidates = by_name[os.path.basename(relative)]
+        match = predicted.get(relative) or (candidates[0] if len(candidates) == 1 else None)
+        pairs[relative] = (path, match)
+        used.add(match)
+    return pairs, len(set(predicted.values()) - used)
+
+
+def evaluate(reference_dir: str, predicted_dir: str, options: TextNormalization = None,
+             workers: int = None) -> tuple[dict[str, dict], int]:
+    """Counts per page of the reference and the number of predictions without a reference."""
+    options = options or TextNormalization()
+    pairs, extra = pair_pages(reference_dir, predicted_dir)
+    names, pages = list(pairs), list(pairs.values())
+    workers = workers or os.cpu_count()
+    if workers > 1 and len(pages) > 1:
+        size = max(1, len(pages) // (4 * workers))
+        chunks = [pages[i:i + size] for i in range(0, len(pages), size)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = [page for chunk in pool.map(evaluate_pages, chunks, [options] * len(chunks)) for page in chunk]
+    else:
+        results = evaluate_pages(pages, options)
+    return dict(zip(names, results)), extra
+
+
+def rate_table(groups: list[tuple[str, list[dict]]]) -> list[str]:
+    """Lines of a table with pages, characters, CER, words and WER per group."""
+    lines = [f"{'':<40} {'pages':>6} {'missing':>8} {'chars':>8} {'CER':>7} {'words':>7} {'WER':>7}"]
+    for name, pages in groups:
+        chars, words = sum(p["chars"] for p in pages), sum(p["words"] for p in pages)
+        cer = sum(p["char_errors"] for p in pages) / chars if chars else 0.0
+        wer = sum(p["word_errors"] for p in pages) / words if words else 0.0
+        lines.append(f"{name:<40} {len(pages):>6} {sum(p['missing'] for p in pages):>8} {chars:>8} {cer:>7.2%} "
+                     f"{words:>7} {wer:>7.2%}")
+    return lines
+
+
+def main():
+    """Command line: evaluate a transcription folder against a reference and print the error rates."""
+    parser = argparse.ArgumentParser(description="CER/WER of transcriptions against a reference")
+    parser.add_argument("reference_dir", help="ground-truth transcriptions or the results of a reference model")
+    parser.add_argument("predicted_dir", help="transcriptions to evaluate")
+    parser.add_argument("--long-s", action="store_true", help="ſ counts as s")
+    parser.add_argument("--umlauts", action="store_true", help="ä, a with combining e and ae count as the same")
+    parser.add_argument("--hyphenation", action="store_true", help="join words hyphenated at line ends")
+    parser.add_argument("--case", action="store_true", help="ignore case")
+    parser.add_argument("--punctuation", action="store_true", help="ignore punctuation")
+    parser.add_argument("--all", action="store_true", help="all of the normalizations above")
+    parser.add_argument("--worst", type=int, default=0, help="list the N pages with the highest CER")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores, 1: serial)")
+    parser.add_argument("--report", help="write the counts per page to this JSON file")
+    args = parser.parse_args()
+    options = TextNormalization(*(args.all or getattr(args, name) for name in
+                                  ("long_s", "umlauts", "hyphenation", "case", "punctuation")))
+
+    start = time.perf_counter()
+    pages, extra = evaluate(args.reference_dir, args.predicted_dir, options, args.workers)
+    seconds = time.perf_counter() - start
+    if not pages:
+        print("No transcriptions found in the reference — check the directory.")
+        return
+    print("----------------------------------------")
+    print(f"{args.predicted_dir} against {args.reference_dir}")
+    print(f"Normalization: {', '.join(name for name, on in asdict(options).items() if on) or 'whitespace only'}; "
+          f"{extra} predicted pages without reference, {seconds:.2f} s")
+    script_types = defaultdict(list)
+    for relative, page in pages.items():
+        script_types[relative.split(os.sep)[0] if os.sep in relative else "."].append(page)
+    print("\n".join(rate_table(sorted(script_types.items()) + [("total", list(pages.values()))])))
+    if args.worst:
+        print("Highest CER:")
+        ranked = sorted(pages.items(), key=lambda item: -item[1]["char_errors"] / max(1, item[1]["chars"]))
+        for relative, page in ranked[:args.worst]:
+            print(f"  {page['char_errors'] / max(1, page['chars']):>7.2%}  {relative}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"normalization": asdict(options), "pages": pages}, f, indent=4, ensure_ascii=False)
+        print(f"Report: {args.report}")
+    print("----------------------------------------")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,112 @@
-import json
+"""
+This script uses the Google Gemini API for named entity recognition on PDF files.
+Every page is rendered, sent to Gemini together with the NER prompt, and the JSON answer
+(persons, places, content) is saved as <doc>_page_<n>.json.
+With DOCUMENT_MODE = True every PDF is instead uploaded once through the Gemini Files API and the
+entities of the whole document are extracted in one request, with the pages they occur on
+(document_pipeline.py). The answer is saved as <doc>.json and split into the same per-page files.
+Optionally, pages that are already transcribed (TRANSCRIPT_DIRS) are sent as text instead of the image, so the
+mention offsets refer to the transcription; only the other pages are rendered (transcript_pipeline.py).
+The offsets of these pages are recomputed locally from the entity names (mention_alignment.py).
+benchmark_ner_text_input.py compares the tokens and latency of both inputs.
+benchmark_gemini_ner_modes.py compares both modes.
+The loop itself lives in pipeline.py; this script only configures it.
+"""
+
 import os
-import re
-import time
-from pdf2image import convert_from_path
+
 from dotenv import load_dotenv
-import google.generativeai as genai
+
+from document_pipeline import DocumentPipeline
+from image_encoding import PROVIDER_LONG_EDGE, EncodingOptions
+from page_cleanup import CleanupOptions
+from pipeline import Pipeline
+from providers import GeminiProvider
+from rate_limiter import default_limit
+from tasks import DocumentNerTask, NerTask, TextNerTask
+from transcript_pipeline import TranscriptPipeline
 
 # Setup 
 load_dotenv()
 
-# Save the start time, set the image and output directories
-start_time = time.time()
-total_files = 0
-total_in_tokens = 0
-total_out_tokens = 0
-input_cost_per_mio_in_dollars = 2.5
-output_cost_per_mio_in_dollars = 10
+# Costs: prices per model come from the versioned price table (pricing.py). Every request is booked in
+# output_dir/.cost_ledger.jsonl; the spend per document and folder is written to output_dir/cost_report.json.
+# BUDGET_DOLLARS: hard cap per run in dollars (None = no cap). Pages that are not sent are picked up by a later run.
+BUDGET_DOLLARS = None
 
 input_directory = "../pdf_data_ner/schreibmaschine"
 output_directory = "../answers/google_ner"
 
-# Gemini API setup
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError("GEMINI_API_KEY nicht gefunden. Bitte .env Datei prüfen!")
-
-genai.configure(api_key=api_key)
-model = genai.GenerativeModel("gemini-2.5-flash")
+# Whole-document mode: one request per PDF (Files API) instead of one request per page image.
+# Keeps entities that span page breaks together and sends the prompt only once per document.
+DOCUMENT_MODE = False
+
+# Text input: pages with a transcription are sent as text instead of the page image. Far fewer input tokens, and the
+# start/end offsets of the mentions refer to the transcription. A folder must mirror input_directory: page n of
+# <folder>/<doc>.pdf is <folder>/<doc>_page_<n>.txt in it, e.g. ("../answers/google_transcript/Spezialfaelle",) for
+# the PDFs of that run. Pages without a transcription are sent as images. Not used in the whole-document mode.
+# Off by default (empty): the images are sent.
+TRANSCRIPT_DIRS = ()
+
+# Mention alignment of the text input (mention_alignment.py): the offsets of the mentions are recomputed from the
+# entity names in the transcription, since the offsets of the model are often wrong. With OMIT_OFFSETS the model is
+# told to leave the mentions out (fewer output tokens); they are then always computed locally.
+ALIGN_MENTIONS = True
+OMIT_OFFSETS = False
+
+# Rendering: resolution and number of pages rendered at the same time
+DPI = 200
+RENDER_WORKERS = os.cpu_count()
+
+# Gemini model and number of requests sent at the same time
+model_name = "gemini-2.5-flash"
+CONCURRENCY = 4
+
+# Context caching: the prompt is uploaded once as a cached context and every request only carries the page.
+# Falls back to sending the prompt with every page if the model does not accept the cache.
+PROMPT_CACHING = True
+
+# Requests and tokens per minute of the model; 429 answers pause all requests with jittered backoff.
+# Raise it if your project has a higher quota tier. Models that are not in rate_limiter.DEFAULT_LIMITS get the
+# lowest limit of the table (with a warning).
+RATE_LIMIT = default_limit(model_name)
+
+# Page image encoding (PNG, JPEG or WEBP with quality, grayscale, downscaling to the long-edge limit)
+IMAGE_ENCODING = EncodingOptions(format="PNG", grayscale=False, max_long_edge=PROVIDER_LONG_EDGE["gemini"])
+
+# Near-identical pages (copies of documents, repeated cover pages): only one page per cluster is sent and its
+# result is copied to the others. Distance in bits of the 256-bit perceptual hash (page_dedup.py); distinct pages
+# of the corpus differ in 38 bits or more. Not used in the whole-document mode. Off by default (None): a page that is
+# merged by mistake (forms, sparse pages with the same layout) silently gets the entities of another page. When
+# enabling it (e.g. 16), review dedup_report.json in the output folder.
+DEDUP_MAX_DISTANCE = None
+
+# Page cleanup before encoding (page_cleanup.py): empty margins are cropped, which saves image tokens. mask=True
+# also paints over the dodis.ch stamp (QR code bottom right on page 1, link top right on every page). The stamp is
+# not detected but masked at fixed positions, so text of the document in these corners (letterheads) would be lost;
+# masking is therefore off. None = off. Not used in the whole-document mode.
+PAGE_CLEANUP = CleanupOptions(mask=False, trim=True)
+
+# Blank pages (blank backs, separator pages): the share of the page covered by text is measured (page_content.py).
+# Below blank_area the page is not sent and {"persons": [], "places": [], "content": []} is written; skipped pages
+# are printed, listed in the summary and traced (content, text_area). NER has no short prompt, so low-content pages
+# get the full prompt. Not used in the whole-document mode. Off by default (None): the corpus has no blank pages
+# and faded scans such as dodis-55544 are close to the threshold. Enable with
+# CONTENT_FILTER = ContentThresholds() (from page_content.py).
+CONTENT_FILTER = None
+
+# Result store: after the run the new result files are appended, with their entities and the tokens and latency
+# from the trace, to the Parquet dataset of all runs (result_store.py, partitioned by task/model/run). None = off.
+RESULT_STORE = "../answers/result_store"
+
+# Response cache: identical requests (model, prompt, encoded page image) are answered from disk.
+# The raw answer is cached, so pages whose JSON fails to parse are not billed again either.
+# Set USE_CACHE = False to bypass it.
+USE_CACHE = True
+
+# Resume: pages recorded in the journal of output_directory (same model and prompt) are skipped.
+# Pages whose answer could not be parsed are not recorded and will be processed again.
+RESUME = True
 
 prompt = """Als erfahrener Sprachwissenschaftler mit dem Gebiet "Named Entity Recognition" (NER) und als Experte für historische Texte sollst du Texte aus der Zeit der 
 Vorarlberger Frage in der Schweiz um 1918 für die maschinelle Weiterverarbeitung auswerten.
@@ -102,83 +182,45 @@ Falls du Fehler bei der Befolgung der Anweisungen machst, drohen dir gravierende
 Nun atme tief durch und gehe ruhig, aber genau vor.
 """
 
-# Process each PDF in the input directory
-for root, _, filenames in os.walk(input_directory):
-    for filename in filenames:
-        if not filename.lower().endswith(".pdf"):
-            continue
-
-        total_files += 1
-        pdf_path = os.path.join(root, filename)
-        print("----------------------------------------")
-        print(f"> Processing PDF ({total_files}): {filename}")
-
-        # Convert PDF to images
-        try:
-            images = convert_from_path(pdf_path)
-        except Exception as e:
-            print(f"❌ Fehler beim Konvertieren von {filename}: {e}")
-            continue
-
-        # Process each page as image
-        for i, image in enumerate(images):
-            print(f"> Sending page {i+1} to Gemini...", end=" ")
-            print("> Sending the image to the API and requesting answer...", end=" ")
-
-            try:
-                answer = model.generate_content(
-                    [prompt, image],
-                    request_options={"timeout": 600}
-                )
-
-                answer_text = answer.text or ""
-                total_in_tokens += answer.usage_metadata.prompt_token_count
-                total_out_tokens += answer.usage_metadata.candidates_token_count
-                print(" Done.")
-
-            except Exception as e:
-                print(f"\n❌ Fehler bei Seite {i+1} von {filename}: {e}")
-                continue
-
-            print("> Processing the answer...")
-
-            # Optional: JSON aus ```json ... ``` extrahieren, falls das Modell trotzdem Codefences nutzt
-            pattern = r"```\s*json(.*?)\s*```"
-            match = re.search(pattern, answer_text, re.DOTALL)
-            if match:
-                answer_text_clean = match.group(1).strip()
-            else:
-                answer_text_clean = answer_text.strip()
-
-            # Parse the JSON content into a Python object
-            try:
-                answer_data = json.loads(answer_text_clean)
-            except json.JSONDecodeError as e:
-                print(f"> Failed to parse JSON on page {i+1}: {e}")
-                continue
-
-            # Create the answers directory if it doesn't exist
-            os.makedirs(output_directory, exist_ok=True)
-
-            # Save the answer to a JSON file
-            base_name = os.path.splitext(filename)[0]
-            out_path = os.path.join(output_directory, f"{base_name}_page_{i+1}.json")
-            with open(out_path, "w", encoding="utf-8") as json_file:
-                json.dump(answer_data, json_file, indent=4, ensure_ascii=False)
-
-            print("> Processing the answer... Done.")
-
-# Calculate and print the total processing time
-end_time = time.time()
-total_time = end_time - start_time
-print("----------------------------------------")
-print(f"Total processing time: {total_time:.2f} seconds")
-print(f"Total token cost (in/out): {total_in_tokens} / {total_out_tokens}")
-if total_files > 0:
-    print(f"Average token cost per image: {total_out_tokens / total_files}")
-print(
-    f"Total cost (in/out): "
-    f"${total_in_tokens / 1e6 * input_cost_per_mio_in_dollars:.2f} / "
-    f"${total_out_tokens / 1e6 * output_cost_per_mio_in_dollars:.2f}"
-)
-print("----------------------------------------")
+
+def build_pipeline(document_mode: bool = DOCUMENT_MODE, input_dir: str = input_directory,
+                   output_dir: str = output_directory, use_cache: bool = USE_CACHE, resume: bool = RESUME,
+                   transcript_dirs: tuple[str, ...] = TRANSCRIPT_DIRS) -> Pipeline:
+    """Pipeline for the per-page mode (text input where there is a transcription) or the whole-document mode."""
+    options, task_options = {}, {}
+    if document_mode:
+        pipeline_class, task_class = DocumentPipeline, DocumentNerTask
+    elif transcript_dirs:
+        pipeline_class, task_class = TranscriptPipeline, TextNerTask
+        options.update(transcript_dirs=list(transcript_dirs), align=ALIGN_MENTIONS)
+        task_options["omit_offsets"] = OMIT_OFFSETS
+    else:
+        pipeline_class, task_class = Pipeline, NerTask
+    return pipeline_class(
+        GeminiProvider(model_name, cache_prompt=PROMPT_CACHING),
+        task_class(prompt, **task_options),
+        input_dir=input_dir,
+        output_dir=output_dir,
+        dpi=DPI,
+        render_workers=RENDER_WORKERS,
+        encoding=IMAGE_ENCODING,
+        concurrency=CONCURRENCY,
+        dedup_distance=DEDUP_MAX_DISTANCE,
+        cleanup=PAGE_CLEANUP,
+        content_filter=CONTENT_FILTER,
+        result_store=RESULT_STORE,
+        rate_limit=RATE_LIMIT,
+        use_cache=use_cache,
+        resume=resume,
+        budget_dollars=BUDGET_DOLLARS,
+        **options,
+    )
+
+
+def main():
+    """Run NER over input_directory with the settings above."""
+    build_pipeline().run()
+
+
+if __name__ == "__main__":
+    main()
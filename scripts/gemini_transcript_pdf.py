@@ -1,68 +1,93 @@
 """
 This script uses the Google Gemini API to process PDF files.
-It converts each PDF page into an image, sends it to Gemini for transcription,
-and saves the extracted text as .txt files.
+It converts each PDF page into an image (pages are rendered in parallel, see pdf_pages.py),
+sends it to Gemini for transcription, and saves the extracted text as .txt files.
+The loop itself lives in pipeline.py; this script only configures it.
 """
 
 import os
-import time
-from pdf2image import convert_from_path
+
 from dotenv import load_dotenv
-import google.generativeai as genai
+
+from image_encoding import PROVIDER_LONG_EDGE, EncodingOptions
+from page_cleanup import CleanupOptions
+from pipeline import Pipeline
+from providers import GeminiProvider
+from rate_limiter import default_limit
+from tasks import TranscriptionTask
 
 # Setup 
 load_dotenv()
 
-start_time = time.time()
-total_files = 0
-total_in_tokens = 0
-total_out_tokens = 0
-input_cost_per_mio_in_dollars = 2.5
-output_cost_per_mio_in_dollars = 10
+# Costs: prices per model come from the versioned price table (pricing.py). Every request is booked in
+# output_dir/.cost_ledger.jsonl; the spend per document and folder is written to output_dir/cost_report.json.
+# BUDGET_DOLLARS: hard cap per run in dollars (None = no cap). Pages that are not sent are picked up by a later run.
+BUDGET_DOLLARS = None
 
 # Change input directory to the specific folder
 
 input_dir = "../pdf_data_transcript/spezial"
 output_dir = "../answers/google_transcript"
-os.makedirs(output_dir, exist_ok=True)
-
-# Gemini API setup
-api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
-    raise ValueError("GEMINI_API_KEY nicht gefunden. Bitte .env Datei prüfen!")
-
-genai.configure(api_key=api_key)
-model = genai.GenerativeModel("gemini-2.5-flash")
-
-
-'''
-# Clear output directory (optional) 
-for root, _, filenames in os.walk(output_dir):
-    for filename in filenames:
-        os.remove(os.path.join(root, filename))
-'''
-
-
-# Process PDFs 
-for root, _, filenames in os.walk(input_dir):
-    for filename in filenames:
-        if filename.lower().endswith(".pdf"):
-            total_files += 1
-            pdf_path = os.path.join(root, filename)
-            print("----------------------------------------")
-            print(f"> Processing PDF ({total_files}): {filename}")
-
-            # Convert PDF to images
-            try:
-                images = convert_from_path(pdf_path)
-            except Exception as e:
-                print(f"❌ Fehler beim Konvertieren von {filename}: {e}")
-                continue
-
-            # Process each page as image
-            for i, image in enumerate(images):
-                print(f"> Sending page {i+1} to Gemini...", end=" ")
-                prompt = (
+
+# Rendering: resolution and number of pages rendered at the same time
+DPI = 200
+RENDER_WORKERS = os.cpu_count()
+
+# Gemini model and number of requests sent at the same time
+model_name = "gemini-2.5-flash"
+CONCURRENCY = 4
+
+# Context caching: the prompt is uploaded once as a cached context and every request only carries the page.
+# Falls back to sending the prompt with every page if the model does not accept the cache.
+PROMPT_CACHING = True
+
+# Requests and tokens per minute of the model; 429 answers pause all requests with jittered backoff.
+# Raise it if your project has a higher quota tier. Models that are not in rate_limiter.DEFAULT_LIMITS get the
+# lowest limit of the table (with a warning).
+RATE_LIMIT = default_limit(model_name)
+
+# Page image encoding (PNG, JPEG or WEBP with quality, grayscale, downscaling to the long-edge limit)
+IMAGE_ENCODING = EncodingOptions(format="PNG", grayscale=False, max_long_edge=PROVIDER_LONG_EDGE["gemini"])
+
+# Streaming: the transcription is appended to output_dir/<page>.txt.part while it arrives (follow it with
+# tail -f); the file is replaced by the result when the page is complete. Off by default: every answer is received
+# in one piece as before.
+STREAM_RESPONSES = False
+
+# Near-identical pages (copies of documents, repeated cover pages): only one page per cluster is sent and its
+# result is copied to the others. Distance in bits of the 256-bit perceptual hash (page_dedup.py); distinct pages
+# of the corpus differ in 38 bits or more. Off by default (None): a page that is merged by mistake (forms, sparse
+# pages with the same layout) silently gets the transcription of another page. When enabling it (e.g. 16), review
+# dedup_report.json in the output folder.
+DEDUP_MAX_DISTANCE = None
+
+# Page cleanup before encoding (page_cleanup.py): empty margins are cropped, which saves image tokens. mask=True
+# also paints over the dodis.ch stamp (QR code bottom right on page 1, link top right on every page). The stamp is
+# not detected but masked at fixed positions, so text of the document in these corners (letterheads) would be lost;
+# masking is therefore off and the prompt's instructions keep the links out of the transcription. None = off.
+PAGE_CLEANUP = CleanupOptions(mask=False, trim=True)
+
+# Blank and low-content pages (blank backs, separator pages, only a page number or a stamp): the share of the page
+# covered by text is measured (page_content.py). Below blank_area the page is not sent and an empty .txt is written,
+# below sparse_area it is sent with a short prompt. Skipped pages are printed, listed in the summary and traced
+# (content, text_area). Off by default (None, every page is sent with the full prompt): the corpus has no blank
+# pages and faded scans such as dodis-55544 are close to the threshold. Enable with
+# CONTENT_FILTER = ContentThresholds() (from page_content.py).
+CONTENT_FILTER = None
+
+# Result store: after the run the new result files are appended, with tokens and latency from the trace, to the
+# Parquet dataset of all runs (result_store.py, partitioned by task/model/run). None = off.
+RESULT_STORE = "../answers/result_store"
+
+# Response cache: identical requests (model, prompt, encoded page image) are answered from disk.
+# Set USE_CACHE = False to bypass it.
+USE_CACHE = True
+
+# Resume: pages recorded in the journal of output_dir (same model and prompt) are skipped.
+RESUME = True
+
+# Transcription prompt (identical for every page)
+prompt = (
         """
         Als erfahrener Historiker mit der Spezialisierung auf die Vorarlberger Frage in der Schweiz im Jahr 1918 sollst du das angehängte Dokument transkribieren. 
         Im folgenden Absatz sind Informationen über den geschichtlichen Kontext, damit du weisst, in welchem Kontext der Inhalt des angehängten Dokuments steht. 
@@ -113,40 +138,31 @@ for root, _, filenames in os.walk(input_dir):
         Falls du Fehler bei der Befolgung der Anweisungen machst, drohen dir gravierende Konsequenzen!
         Nun atme tief durch und gehe Schritt für Schritt vor.
         """
-             )
-
-                try:
-                    answer = model.generate_content(
-                        [prompt, image],
-                        request_options={"timeout": 600})
-                    answer_text = answer.text or ""
-                    total_in_tokens += answer.usage_metadata.prompt_token_count
-                    total_out_tokens += answer.usage_metadata.candidates_token_count
-                    print("Done.")
-
-                    # Save transcription
-                    base_name = os.path.splitext(filename)[0]
-                    out_path = os.path.join(output_dir, f"{base_name}_page_{i+1}.txt")
-                    with open(out_path, "w", encoding="utf-8") as f:
-                        f.write(answer_text)
-
-                except Exception as e:
-                    print(f"\n❌ Fehler bei Seite {i+1} von {filename}: {e}")
-
-                    
-
-#  Summary 
-end_time = time.time()
-total_time = end_time - start_time
-print("----------------------------------------")
-print(f"Total processing time: {total_time:.2f} seconds")
-print(f"Total token cost (in/out): {total_in_tokens} / {total_out_tokens}")
-
-if total_files > 0:
-    print(f"Average token cost per file: {total_out_tokens / total_files:.2f}")
-else:
-    print("No files were processed — check input directory or file types.")
-
-print(f"Total cost (in/out): ${total_in_tokens / 1e6 * input_cost_per_mio_in_dollars:.2f} / "
-      f"${total_out_tokens / 1e6 * output_cost_per_mio_in_dollars:.2f}")
-print("----------------------------------------")
+)
+
+
+def main():
+    """Transcribe every PDF of input_dir with the settings above."""
+    Pipeline(
+        GeminiProvider(model_name, cache_prompt=PROMPT_CACHING),
+        TranscriptionTask(prompt),
+        input_dir=input_dir,
+        output_dir=output_dir,
+        dpi=DPI,
+        render_workers=RENDER_WORKERS,
+        encoding=IMAGE_ENCODING,
+        concurrency=CONCURRENCY,
+        stream=STREAM_RESPONSES,
+        dedup_distance=DEDUP_MAX_DISTANCE,
+        cleanup=PAGE_CLEANUP,
+        content_filter=CONTENT_FILTER,
+        result_store=RESULT_STORE,
+        rate_limit=RATE_LIMIT,
+        use_cache=USE_CACHE,
+        resume=RESUME,
+        budget_dollars=BUDGET_DOLLARS,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
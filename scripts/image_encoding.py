@@ -0,0 +1,112 @@
+"""Encoding of rendered pages before they are sent to a model.
+
+A 300-DPI RGB render of an A4 page is about 2500x3500 pixels. Every provider scales such an image
+down before the model sees it, so sending it at full size only costs encoding time and upload
+bytes. EncodingOptions describes how a page is encoded (PNG/JPEG/WebP, quality, grayscale and the
+maximum length of the long edge); encode_image() applies it. The same encoder is used for the
+Claude and the Gemini scripts.
+"""
+
+import base64
+import math
+from dataclasses import dataclass
+from io import BytesIO
+
+from PIL import Image
+
+# Longest edge (pixels) a provider processes without downscaling the image itself
+PROVIDER_LONG_EDGE = {
+    "anthropic": 1568,
+    "gemini": 3072,
+    "openai": 2048,
+}
+
+MEDIA_TYPES = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+
+@dataclass(frozen=True)
+class EncodingOptions:
+    """How a page image is encoded. max_long_edge=None keeps the rendered size."""
+    format: str = "PNG"
+    quality: int = 85
+    grayscale: bool = False
+    max_long_edge: int | None = None
+
+    def label(self) -> str:
+        """Short human-readable description, e.g. 'JPEG q80 gray 1568px'."""
+        parts = [self.format.upper()]
+        if self.format.upper() != "PNG":
+            parts.append(f"q{self.quality}")
+        parts.append("gray" if self.grayscale else "rgb")
+        parts.append(f"{self.max_long_edge}px" if self.max_long_edge else "full")
+        return " ".join(parts)
+
+
+@dataclass(frozen=True)
+class EncodedImage:
+    """Encoded page payload."""
+    data: bytes
+    media_type: str
+    width: int
+    height: int
+
+    def to_base64(self) -> str:
+        """Base64 string for APIs that expect inline image data (Anthropic, OpenAI)."""
+        return base64.b64encode(self.data).decode("utf-8")
+
+    def as_gemini_part(self) -> dict:
+        """Inline blob for google.generativeai generate_content()."""
+        return {"mime_type": self.media_type, "data": self.data}
+
+
+def encode_image(image: Image.Image, options: EncodingOptions = EncodingOptions()) -> EncodedImage:
+    """Convert, downscale and encode a PIL image according to options."""
+    fmt = options.format.upper()
+    if fmt not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported image format: {options.format}")
+
+    img = image
+    if options.grayscale:
+        if img.mode != "L":
+            img = img.convert("L")
+    elif img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    width, height = img.size
+    if options.max_long_edge and max(width, height) > options.max_long_edge:
+        scale = options.max_long_edge / max(width, height)
+        img = img.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.Resampling.LANCZOS)
+
+    buf = BytesIO()
+    if fmt == "JPEG":
+        img.save(buf, format="JPEG", quality=options.quality, optimize=True)
+    elif fmt == "WEBP":
+        img.save(buf, format="WEBP", quality=options.quality, method=4)
+    else:
+        img.save(buf, format="PNG")
+    return EncodedImage(buf.getvalue(), MEDIA_TYPES[fmt], img.size[0], img.size[1])
+
+
+def estimate_image_tokens(width: int, height: int, provider: str) -> int:
+    """Rough number of input tokens an image of this size costs with the given provider."""
+    if provider == "anthropic":
+        # Images are scaled to fit 1568px on the long edge, then cost about w*h/750 tokens
+        scale = min(1.0, PROVIDER_LONG_EDGE["anthropic"] / max(width, height))
+        return math.ceil((width * scale) * (height * scale) / 750)
+    if provider == "gemini":
+        # Small images cost 258 tokens, larger ones 258 tokens per 768x768 tile
+        if width <= 384 and height <= 384:
+            return 258
+        return 258 * math.ceil(width / 768) * math.ceil(height / 768)
+    if provider == "openai":
+        # High detail: fit into 2048x2048, shortest side 768px, 170 tokens per 512px tile + 85
+        scale = min(1.0, 2048 / max(width, height))
+        w, h = width * scale, height * scale
+        scale = min(1.0, 768 / min(w, h))
+        w, h = w * scale, h * scale
+        return 85 + 170 * math.ceil(w / 512) * math.ceil(h / 512)
+    raise ValueError(f"Unknown provider: {provider}")
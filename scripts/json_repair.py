@@ -0,0 +1,240 @@
+"""Tolerant JSON parsing for model answers.
+
+Models do not always answer with clean JSON. repair_json() reads the first JSON object (or array) of an
+answer and repairs the usual defects locally instead of dropping the page:
+- Markdown fences and text before or after the JSON (the rest of the answer is ignored),
+- typographic quotes (“ ” „ « ») and single quotes as string delimiters; inside a string they stay part
+  of the text,
+- unescaped quotes and line breaks inside strings,
+- trailing and doubled commas, missing commas between entries ({"a": "b" "c": 1}),
+- Python literals (None, True, False) and NaN,
+- answers cut off by the output limit: complete entries are kept, the open containers are closed and
+  the incomplete last value is dropped. An object that is cut off inside a list or object (a half-filled
+  entity) is dropped as a whole; a cut-off list keeps its complete elements.
+Every applied repair is reported, so the caller can log it. Text without any JSON raises JsonRepairError.
+"""
+
+import json
+import re
+from typing import NamedTuple
+
+OPEN_QUOTES = {'"': '"', "'": "'", "“": "”", "”": "”", "„": "“", "«": "»", "»": "«"}
+CLOSE_QUOTES = {'"', "”", "“", "»", "«"}
+LITERALS = {"true": True, "false": False, "null": None, "True": True, "False": False, "None": None, "NaN": None}
+NUMBER = re.compile(r"-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+WORD = re.compile(r"[A-Za-z_][\w-]*")
+TRUNCATED = "truncated output closed"
+
+
+class JsonRepairError(ValueError):
+    """The text contains no JSON that could be read."""
+
+
+class RepairedJson(NamedTuple):
+    """Parsed value and the repairs that were needed (empty for clean JSON)."""
+    value: object
+    repairs: list[str]
+
+
+class _Truncated(Exception):
+    """The text ended inside a value."""
+
+
+class _Parser:
+    """Recursive descent parser that accepts the defects listed in the module docstring."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+        self.depth = 0  # Open containers
+        self.repairs = []
+
+    def note(self, repair: str):
+        """Remember a repair once."""
+        if repair not in self.repairs:
+            self.repairs.append(repair)
+
+    def skip_whitespace(self):
+        """Move to the next non-whitespace character; raises _Truncated at the end of the text."""
+        while self.pos < len(self.text) and self.text[self.pos].isspace():
+            self.pos += 1
+        if self.pos >= len(self.text):
+            raise _Truncated()
+
+    def peek_after(self, pos: int) -> str:
+        """Next non-whitespace character after pos ("" at the end of the text)."""
+        while pos < len(self.text) and self.text[pos].isspace():
+            pos += 1
+        return self.text[pos] if pos < len(self.text) else ""
+
+    def quoted_entry_follows(self, pos: int) -> bool:
+        """Whether a quoted string followed by JSON syntax comes next after pos: "b" "c": 1 lacks a comma."""
+        while pos < len(self.text) and self.text[pos].isspace():
+            pos += 1
+        if pos >= len(self.text) or self.text[pos] not in OPEN_QUOTES:
+            return False
+        end = self.text.find(OPEN_QUOTES[self.text[pos]], pos + 1)
+        return end >= 0 and self.peek_after(end + 1) in ("", ",", ":", "}", "]")
+
+    def value(self):
+        """Parse any value at the current position."""
+        self.skip_whitespace()
+        char = self.text[self.pos]
+        if char == "{":
+            return self.container("}", self.object_entry, {})
+        if char == "[":
+            return self.container("]", self.array_entry, [])
+        if char in OPEN_QUOTES:
+            return self.string()
+        match = NUMBER.match(self.text, self.pos)
+        if match:
+            if match.end() >= len(self.text):
+                raise _Truncated()  # The number may be cut off
+            self.pos = match.end()
+            number = match.group()
+            return float(number) if any(c in number for c in ".eE") else int(number)
+        match = WORD.match(self.text, self.pos)
+        if match and match.group() in LITERALS:
+            if match.group() not in ("true", "false", "null"):
+                self.note("Python literals replaced")
+            self.pos = match.end()
+            return LITERALS[match.group()]
+        if match and match.end() >= len(self.text) and any(w.startswith(match.group()) for w in LITERALS):
+            raise _Truncated()
+        raise JsonRepairError(f"Unexpected {char!r} at position {self.pos}")
+
+    def container(self, closing: str, entry, result):
+        """Parse an object or array; entries are read by entry(result).
+
+        If the text ends inside, the entries read so far are kept and the cut-off entry is dropped. A
+        cut-off object inside another container is a half-filled record and raises _Truncated, so the
+        outer container drops it as well; a cut-off array keeps its complete elements.
+        """
+        self.pos += 1
+        self.depth += 1
+        try:
+            expect_separator = False
+            while True:
+                try:
+                    self.skip_whitespace()
+                    char = self.text[self.pos]
+                    if char == closing:
+                        self.pos += 1
+                        return result
+                    if char in "}]":
+                        self.note("mismatched brackets")
+                        return result
+                    if char == ",":
+                        self.pos += 1
+                        if not expect_separator or self.peek_after(self.pos) in (closing, ","):
+                            self.note("superfluous commas removed")
+                        expect_separator = False
+                        continue
+                    if expect_separator:
+                        self.note("missing commas inserted")
+                    entry(result)
+                except _Truncated:
+                    self.note(TRUNCATED)
+                    self.pos = len(self.text)  # The incomplete value is dropped; the outer containers end here too
+                    if closing == "}" and self.depth > 1:
+                        raise
+                    return result
+                expect_separator = True
+        finally:
+            self.depth -= 1
+
+    def object_entry(self, result: dict):
+        """One "key": value pair."""
+        char = self.text[self.pos]
+        if char in OPEN_QUOTES:
+            key = self.string()
+        else:
+            match = WORD.match(self.text, self.pos)
+            if not match:
+                raise JsonRepairError(f"Unexpected {char!r} at position {self.pos}")
+            self.note("unquoted keys quoted")
+            key = match.group()
+            self.pos = match.end()
+        self.skip_whitespace()
+        if self.text[self.pos] == ":":
+            self.pos += 1
+        else:
+            self.note("missing colons inserted")
+        result[key] = self.value()
+
+    def array_entry(self, result: list):
+        """One array element."""
+        result.append(self.value())
+
+    def string(self) -> str:
+        """String between straight or typographic quotes."""
+        opening = self.text[self.pos]
+        if opening == "'":
+            self.note("single quotes replaced")
+        elif opening != '"':
+            self.note("typographic quotes replaced")
+        closing = OPEN_QUOTES[opening]
+        self.pos += 1
+        chars = []
+        while self.pos < len(self.text):
+            char = self.text[self.pos]
+            if char == "\\" and self.pos + 1 < len(self.text):
+                escaped = self.text[self.pos:self.pos + 6] if self.text[self.pos + 1] == "u" else \
+                    self.text[self.pos:self.pos + 2]
+                try:
+                    chars.append(json.loads(f'"{escaped}"'))
+                except json.JSONDecodeError:
+                    chars.append(escaped[1])
+                    self.note("invalid escapes removed")
+                self.pos += len(escaped)
+                continue
+            if char == closing or (char in CLOSE_QUOTES and opening not in "\"'" and char != "«"):
+                # A quote only ends the string if JSON syntax follows (or the next quoted key or value of
+                # an entry without its comma); otherwise it belongs to the text
+                if self.peek_after(self.pos + 1) in ("", ",", ":", "}", "]") or self.quoted_entry_follows(self.pos + 1):
+                    self.pos += 1
+                    return "".join(chars)
+                if char == '"':
+                    self.note("unescaped quotes escaped")
+            elif char in "\n\r\t":
+                self.note("line breaks in strings escaped")
+            chars.append(char)
+            self.pos += 1
+        raise _Truncated()
+
+
+def extract_start(text: str) -> int:
+    """Position of the first { (or [ if the text has no object), skipping Markdown fences and prose."""
+    fence = re.search(r"```\s*(?:json)?\s*\n?", text)
+    start = fence.end() if fence else 0
+    for opening in "{[":
+        position = text.find(opening, start)
+        if position >= 0:
+            return position
+    if fence:
+        return extract_start(text[:fence.start()])
+    raise JsonRepairError("The answer contains no JSON")
+
+
+def repair_json(text: str) -> RepairedJson:
+    """Read the first JSON value of text and repair it where needed."""
+    try:
+        return RepairedJson(json.loads(text), [])
+    except json.JSONDecodeError:
+        pass
+    start = extract_start(text)
+    if text[:start].strip() and not re.fullmatch(r"\s*```\s*(?:json)?\s*", text[:start]):
+        repairs = ["text before the JSON ignored"]
+    else:
+        repairs = []
+    parser = _Parser(text)
+    parser.pos = start
+    parser.repairs = repairs
+    try:
+        value = parser.value()
+    except _Truncated as e:
+        raise JsonRepairError("The answer ends before its first JSON value is complete") from e
+    rest = text[parser.pos:].strip()
+    if rest and not re.fullmatch(r"```\s*", rest):
+        parser.note("text after the JSON ignored")
+    return RepairedJson(value, parser.repairs)
@@ -0,0 +1,114 @@
+"""On-disk cache for LLM responses, shared by the transcription and NER scripts.
+
+A response is stored under a hash of the model name, the prompt text, the generation parameters
+and the page payload (the encoded image or the raw pixels). Re-running a script after a crash or
+after a change that does not affect the request returns the stored answer instead of billing the
+page again. The cache lives in a single SQLite file and evicts the least recently used entries
+once it grows beyond max_bytes.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = "../.llm_cache/responses.sqlite"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def image_fingerprint(image) -> bytes:
+    """Return a digest of the pixels of a PIL image (mode, size and raw bytes)."""
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}:".encode("utf-8"))
+    digest.update(image.tobytes())
+    return digest.digest()
+
+
+class ResponseCache:
+    """SQLite-backed response cache with size-based LRU eviction and hit/miss counters."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 enabled: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON responses (last_access)")
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, prompt: str, params: dict, payload) -> str:
+        """Build the cache key from model, prompt, generation parameters and page payload."""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        digest = hashlib.sha256()
+        digest.update(json.dumps({"model": model, "prompt": prompt, "params": params},
+                                 sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(payload)
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        """Return the cached value for key (a dict) or None. Counts hits and misses."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict):
+        """Store value (a JSON-serializable dict) under key and evict old entries if needed."""
+        if not self.enabled:
+            return
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, data, len(data.encode("utf-8")), time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Delete least recently used entries until the cache fits into max_bytes."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def summary(self) -> str:
+        """One-line summary for the end-of-run report."""
+        if not self.enabled:
+            return "Cache: bypassed"
+        return f"Cache hits/misses: {self.hits} / {self.misses} (evicted: {self.evictions})"
+
+    def close(self):
+        """Close the underlying database connection."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,319 @@
+"""Local alignment of NER mentions: the start/end offsets are recomputed from the entity names.
+
+The NER prompt asks the model for the character offsets of every mention, but the offsets it returns
+are often wrong (counted in a different text, off by a line, or simply invented), and the only way to
+fix them was another request. The entity names, however, are taken from the text and are mostly right.
+align_mentions therefore searches the names of all persons and places of a page in its transcription
+and replaces the mentions with the spans it finds:
+
+- Every name variant of an entity (name, normalized form, name without its honorifics) is a pattern
+  of one Aho-Corasick automaton, so all occurrences of all variants are found in one linear pass over
+  the text. Text and patterns are folded like the entity index (entity_index.fold): casefolded, without
+  diacritics, ſ as s, punctuation and whitespace as one space, words hyphenated at line ends joined.
+  Each folded character keeps its position in the original text, so the spans refer to the file.
+- Matches must start and end at word boundaries (a genitive -s is allowed: "Wilsons" is a mention of
+  Wilson). Overlapping matches are resolved leftmost-longest: "Graf Czernin" wins over "Czernin".
+- Entities none of whose variants occurs exactly are searched fuzzily, for OCR and transcription
+  variants ("Feldkireh"): every run of as many words as the variant has is compared with it (bit-parallel
+  edit distance of evaluate_transcript.py); up to FUZZY_ERROR_RATE of its characters may differ.
+
+With offsets computed locally the model can be told to leave the mentions out (TextNerTask with
+omit_offsets), which saves a large part of the output tokens of a page.
+
+The other fields of a mention (text, page of the document mode) are kept, and entities that are not
+found keep the mentions of the model.
+
+The pipeline aligns the pages it sends as text (transcript_pipeline.py, align). Existing
+results are aligned against their transcriptions with the command line. A transcription is matched by
+its path relative to the transcript folder, which mirrors the NER folder; pages with a transcription in
+more than one folder are reported and skipped. By default it only counts how many of the model's offsets
+were right; --write rewrites the result files in place:
+
+    python mention_alignment.py ../answers/google_ner ../answers/google_transcript --fuzzy 0
+    python mention_alignment.py ../answers/google_ner ../answers/google_transcript --write
+"""
+
+import argparse
+import json
+import os
+import time
+import unicodedata
+from collections import deque
+from dataclasses import dataclass, fields
+
+from evaluate_transcript import HYPHENATION, edit_distance, read_text
+from result_store import result_files
+
+ENTITY_KEYS = ("persons", "places")
+FUZZY_ERROR_RATE = 0.2  # Share of the characters of a name that may differ in a fuzzy match
+MIN_PATTERN = 2         # Shorter folded names (initials) are not searched
+MIN_FUZZY = 5           # Shorter folded names are only matched exactly
+
+
+@dataclass
+class AlignmentCounts:
+    """Mentions found in the text and how the model's offsets compare to them."""
+    entities: int = 0
+    unaligned: int = 0       # Entities of which no variant was found in the text
+    exact: int = 0           # Mentions found by the automaton
+    fuzzy: int = 0           # Mentions found by the fuzzy search
+    model_offsets: int = 0   # Mentions with offsets in the answer of the model
+    model_correct: int = 0   # ... of which the span was found by the alignment as well
+
+    def add(self, other: "AlignmentCounts"):
+        """Add the counts of another page."""
+        for field in fields(self):
+            setattr(self, field.name, getattr(self, field.name) + getattr(other, field.name))
+
+
+def fold_text(text: str) -> tuple[str, list[int], list[int]]:
+    """Folded text and the start and end in text of every folded character."""
+    skipped = set()
+    for match in HYPHENATION.finditer(text):
+        skipped.update(range(match.end(1), match.start(2)))  # Hyphen and line break of a hyphenated word
+    folded, starts, ends = [], [], []
+    for i, char in enumerate(text):
+        if i in skipped:
+            continue
+        if unicodedata.combining(char):
+            if ends and folded[-1] != " ":
+                ends[-1] = i + 1  # A separate combining mark belongs to the preceding letter
+            continue
+        for part in unicodedata.normalize("NFKD", char.casefold()):
+            if unicodedata.combining(part):
+                continue
+            if part.isalnum():
+                folded.append(part)
+            elif folded and folded[-1] == " ":
+                continue
+            else:
+                folded.append(" ")
+            starts.append(i)
+            ends.append(i + 1)
+    return "".join(folded), starts, ends
+
+
+def fold_name(name: str) -> str:
+    """Folded search pattern of a name."""
+    return fold_text(name)[0].strip()
+
+
+class Automaton:
+    """Aho-Corasick automaton over a set of patterns: finds all occurrences of all patterns in one pass."""
+
+    def __init__(self, patterns: list[str]):
+        self.patterns = patterns
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append(index)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, target in self.goto[state].items():
+                queue.append(target)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[target] = self.goto[fallback].get(char, 0)
+                self.output[target] = self.output[target] + self.output[self.fail[target]]
+
+    def find(self, text: str) -> list[tuple[int, int, int]]:
+        """(start, end, pattern index) of every occurrence in text."""
+        matches, state = [], 0
+        for position, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for index in self.output[state]:
+                matches.append((position + 1 - len(self.patterns[index]), position + 1, index))
+        return matches
+
+
+def is_word(folded: str, start: int, end: int) -> bool:
+    """Whether folded[start:end] starts and ends at word boundaries (a following genitive s is allowed)."""
+    if start > 0 and folded[start - 1] != " ":
+        return False
+    if end < len(folded) and folded[end] != " ":
+        return folded[end] == "s" and (end + 1 == len(folded) or folded[end + 1] == " ")
+    return True
+
+
+def name_variants(entity: dict) -> set[str]:
+    """Folded name, normalized form and name without its honorifics."""
+    names = [entity["name"], entity.get("normalized")]
+    honorifics = entity.get("honorifics") if isinstance(entity.get("honorifics"), list) else []
+    for honorific in honorifics:
+        if isinstance(honorific, str) and entity["name"].startswith(honorific + " "):
+            names.append(entity["name"][len(honorific) + 1:])
+    return {pattern for pattern in (fold_name(name) for name in names if isinstance(name, str))
+            if len(pattern) >= MIN_PATTERN}
+
+
+def word_spans(folded: str) -> list[tuple[int, int]]:
+    """(start, end) of the words of a folded text."""
+    words, start = [], None
+    for position, char in enumerate(folded + " "):
+        if char != " " and start is None:
+            start = position
+        elif char == " " and start is not None:
+            words.append((start, position))
+            start = None
+    return words
+
+
+def fuzzy_spans(folded: str, words: list[tuple[int, int]], pattern: str,
+                error_rate: float) -> list[tuple[int, int, int]]:
+    """(edit distance, start, end) of the word runs of folded within error_rate of pattern."""
+    max_errors = int(len(pattern) * error_rate)
+    length = pattern.count(" ") + 1
+    spans = []
+    for first in range(len(words) - length + 1):
+        start, end = words[first][0], words[first + length - 1][1]
+        if abs(end - start - len(pattern)) <= max_errors:
+            distance = edit_distance(folded[start:end], pattern)
+            if distance <= max_errors:
+                spans.append((distance, start, end))
+    return spans
+
+
+def align_mentions(result: dict, text: str, error_rate: float = FUZZY_ERROR_RATE) -> AlignmentCounts:
+    """Replace the mentions of the persons and places of result with their spans in text (in place).
+
+    Entities that are not found in text keep the mentions of the model.
+    """
+    counts = AlignmentCounts()
+    entities = [entity for key in ENTITY_KEYS for entity in result.get(key) or []]
+    counts.entities = len(entities)
+    if not entities:
+        return counts
+    folded, starts, ends = fold_text(text)
+    patterns = {}  # Folded pattern -> indices of the entities with this variant
+    for index, entity in enumerate(entities):
+        for pattern in name_variants(entity):
+            patterns.setdefault(pattern, set()).add(index)
+    automaton = Automaton(list(patterns))
+    matches = sorted(((start, end, pattern) for start, end, pattern in automaton.find(folded)
+                      if is_word(folded, start, end)), key=lambda match: (match[0], -match[1]))
+
+    spans = [[] for _ in entities]
+    taken = [False] * len(folded)
+    for start, end, pattern in matches:  # Leftmost-longest, without overlaps
+        if any(taken[start:end]):
+            continue
+        taken[start:end] = [True] * (end - start)
+        for index in patterns[automaton.patterns[pattern]]:
+            spans[index].append((start, end))
+            counts.exact += 1
+
+    unmatched = [index for index, found in enumerate(spans) if not found]
+    if unmatched and error_rate > 0:
+        words = word_spans(folded)
+        for index in unmatched:
+            candidates = sorted(span for pattern in name_variants(entities[index]) if len(pattern) >= MIN_FUZZY
+                                for span in fuzzy_spans(folded, words, pattern, error_rate))
+            for _, start, end in candidates:  # Closest first, without overlaps
+                if not any(taken[start:end]):
+                    taken[start:end] = [True] * (end - start)
+                    spans[index].append((start, end))
+                    counts.fuzzy += 1
+
+    for entity, found in zip(entities, spans):
+        aligned = {(starts[start], ends[end - 1]) for start, end in found}
+        mentions = [m for m in entity.get("mentions") or [] if isinstance(m, dict)]
+        model = [m for m in mentions if isinstance(m.get("start"), int) and isinstance(m.get("end"), int)]
+        counts.model_offsets += len({(m["start"], m["end"]) for m in model})
+        counts.model_correct += len({(m["start"], m["end"]) for m in model} & aligned)
+        counts.unaligned += not aligned
+        if aligned:  # An entity that was not found keeps the mentions of the model
+            entity["mentions"] = [aligned_mention(start, end, mentions, text)
+                                  for start, end in sorted(aligned)]
+    return counts
+
+
+def aligned_mention(start: int, end: int, mentions: list[dict], text: str) -> dict:
+    """Mention at start:end with the other fields (text, page, ...) of the model's mention of that span.
+
+    Without a mention of the same span the fields of the model's mention that starts closest are taken;
+    a text field is set to the text of the new span.
+    """
+    same = [m for m in mentions if m.get("start") == start and m.get("end") == end]
+    with_offsets = [m for m in mentions if isinstance(m.get("start"), int)]
+    closest = same or sorted(with_offsets, key=lambda m: abs(m["start"] - start)) or mentions
+    mention = {**(closest[0] if closest else {}), "start": start, "end": end}
+    if "text" in mention:
+        mention["text"] = text[start:end]
+    return mention
+
+
+def align_file(result_path: str, transcript_path: str, error_rate: float, write: bool) -> AlignmentCounts | None:
+    """Align one result file against its transcription; None if the result is not a parsed NER result."""
+    with open(result_path, "r", encoding="utf-8") as f:
+        result = json.load(f)
+    if not isinstance(result, dict) or "error" in result or not any(key in result for key in ENTITY_KEYS):
+        return None
+    counts = align_mentions(result, read_text(transcript_path), error_rate)
+    if write:
+        temp_path = result_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=4, ensure_ascii=False)
+        os.replace(temp_path, result_path)
+    return counts
+
+
+def main():
+    """Command line: align the NER results of a folder with their transcriptions."""
+    parser = argparse.ArgumentParser(description="Recompute the mention offsets of NER results from the transcriptions")
+    parser.add_argument("ner_dir", help="NER results (<doc>_page_<n>.json)")
+    parser.add_argument("transcript_dirs", nargs="+",
+                        help="transcriptions (<doc>_page_<n>.txt), matched by the path relative to ner_dir")
+    parser.add_argument("--fuzzy", type=float, default=FUZZY_ERROR_RATE,
+                        help="share of the characters of a name that may differ (0: exact matches only)")
+    parser.add_argument("--write", action="store_true", help="rewrite the result files (default: only count)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    transcripts = {}  # Relative path -> paths; the transcript folders mirror the NER folder
+    for directory in args.transcript_dirs:
+        for relative, path in result_files(directory, ".txt").items():
+            transcripts.setdefault(relative, []).append(path)
+    total, aligned, skipped = AlignmentCounts(), 0, 0
+    for relative, path in sorted(result_files(args.ner_dir, ".json").items()):
+        filename = os.path.basename(relative)
+        candidates = transcripts.get(os.path.splitext(relative)[0] + ".txt", [])
+        if len(candidates) > 1:
+            print(f"⚠️ {relative}: transcription in more than one folder ({', '.join(candidates)}), skipped")
+        transcript = candidates[0] if len(candidates) == 1 else None
+        try:
+            counts = None if transcript is None else align_file(path, transcript, args.fuzzy, args.write)
+        except (OSError, UnicodeDecodeError, json.JSONDecodeError) as e:
+            print(f"❌ Fehler bei {filename}: {e}")
+            counts = None
+        if counts is None:
+            skipped += 1
+            continue
+        total.add(counts)
+        aligned += 1
+
+    print("----------------------------------------")
+    print(f"Pages aligned: {aligned} ({skipped} without transcription or parsed result), "
+          f"{time.perf_counter() - start:.2f} s" + ("" if args.write else " — counted only, nothing written"))
+    print(f"Entities: {total.entities} ({total.unaligned} not found in the text)")
+    print(f"Mentions: {total.exact} exact, {total.fuzzy} fuzzy")
+    if total.model_offsets:
+        print(f"Offsets of the model: {total.model_correct} of {total.model_offsets} "
+              f"({total.model_correct / total.model_offsets:.0%}) found by the alignment")
+    print("----------------------------------------")
+
+
+if __name__ == "__main__":
+    main()
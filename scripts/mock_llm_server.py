@@ -0,0 +1,431 @@
+"""
+Local stand-in for the Anthropic Messages API, the OpenAI Chat Completions API and the Gemini API.
+Used to test the rate limiter (rate_limiter.py) and the pipeline engine and to benchmark it
+(benchmark_pipeline.py) without API costs.
+
+- POST /v1/messages            Anthropic answer with usage and anthropic-ratelimit-* headers; text blocks
+                               up to a cache_control marker are reported as cache write, then as cache read
+- POST /v1/chat/completions    OpenAI answer with usage and x-ratelimit-* headers
+- POST /v1beta/models/<model>:generateContent   Gemini answer with usageMetadata (REST transport)
+- Streaming: "stream": true (Anthropic, OpenAI) and :streamGenerateContent (Gemini) send the answer
+  word by word, stream_chunk_delay seconds apart, as server-sent events (Gemini: a streamed JSON array)
+- POST /v1/messages/batches    Message Batch; it ends batch_latency seconds after submission
+- GET  /v1/messages/batches/<id>[/results]   Batch state and JSONL results (error_rate share errored)
+- GET  /stats                  Counters (requests, answers, 429s, 529s) as JSON
+
+The server enforces an RPM limit (sliding 60s window) and can additionally answer a share of the
+requests with synthetic 429 or 529 errors. Response times follow a fixed, uniform (latency +/- jitter)
+or lognormal (mean latency, spread latency_sigma) distribution. The answers are canned: config.text,
+or the given responses in turn (e.g. NER JSON). Start it and point the scripts at it:
+
+    python mock_llm_server.py --rpm 30 --error-rate 0.1 --latency-distribution lognormal
+    python mock_llm_server.py --responses canned_ner.json   # JSON list of answer texts
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=test python claude_transcript.py
+
+Scripts and benchmarks can also run it in-process with start_server().
+"""
+
+import argparse
+import collections
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def iso_time(timestamp: float) -> str:
+    """RFC 3339 time as used by the APIs."""
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp))
+
+
+@dataclass
+class MockConfig:
+    """Behaviour of the mock server."""
+    text: str = "Dies ist eine Testantwort des Mock-Servers."
+    latency: float = 0.5        # Mean response time in seconds
+    latency_jitter: float = 0.2  # Uniform +/- jitter in seconds
+    latency_distribution: str = "uniform"  # fixed, uniform or lognormal
+    latency_sigma: float = 0.5  # Spread of the lognormal distribution (sigma of the log)
+    responses: tuple = ()       # Canned answer texts, used in turn instead of text
+    rpm: int | None = None      # Requests per minute before 429 (None = unlimited)
+    error_rate: float = 0.0     # Share of the requests answered with a synthetic 429
+    overload_rate: float = 0.0  # Share of the requests answered with 529 (Anthropic overloaded)
+    input_tokens: int = 1600
+    output_tokens: int = 400
+    batch_latency: float = 2.0  # Seconds until a submitted batch has ended
+    stream_chunk_delay: float = 0.01  # Seconds between two chunks of a streamed answer
+
+    def sample_latency(self) -> float:
+        """Response time of one request in seconds."""
+        if self.latency_distribution == "fixed":
+            return self.latency
+        if self.latency_distribution == "lognormal":
+            if self.latency <= 0:
+                return 0.0
+            # mu chosen so that the mean of the distribution is latency; the long tail models slow requests
+            return random.lognormvariate(math.log(self.latency) - self.latency_sigma ** 2 / 2, self.latency_sigma)
+        if self.latency_distribution == "uniform":
+            return max(0.0, self.latency + random.uniform(-self.latency_jitter, self.latency_jitter))
+        raise ValueError(f"Unknown latency distribution: {self.latency_distribution}")
+
+
+class MockState:
+    """Thread-safe counters and the sliding RPM window."""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.lock = threading.Lock()
+        self.window = collections.deque()
+        self.counts = collections.Counter()
+        self.batches = {}  # batch id -> (submission time, custom ids, model)
+        self.prompt_cache = set()  # Cached prompt prefixes
+        self._responses = itertools.cycle(config.responses or (config.text,))
+
+    def next_text(self) -> str:
+        """Next canned answer text."""
+        with self.lock:
+            return next(self._responses)
+
+    def admit(self) -> tuple[int, int, float]:
+        """Register a request. Returns (status, remaining requests, seconds until a slot frees up)."""
+        now = time.monotonic()
+        with self.lock:
+            self.counts["requests"] += 1
+            while self.window and now - self.window[0] >= 60:
+                self.window.popleft()
+            limit = self.config.rpm
+            if limit is not None and len(self.window) >= limit:
+                self.counts["429"] += 1
+                return 429, 0, 60 - (now - self.window[0])
+            roll = random.random()
+            if roll < self.config.error_rate:
+                self.counts["429"] += 1
+                return 429, 0, 1.0
+            if roll < self.config.error_rate + self.config.overload_rate:
+                self.counts["529"] += 1
+                return 529, 0, 1.0
+            self.window.append(now)
+            self.counts["ok"] += 1
+            remaining = limit - len(self.window) if limit is not None else 1_000_000
+            reset = 60 - (now - self.window[0]) if self.window else 0.0
+            return 200, remaining, reset
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Request handler; the server instance carries the MockState."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass  # Keep the console of the benchmark readable
+
+    def send_json(self, status: int, body: dict, headers: dict = None):
+        """Send a JSON body with status and extra headers."""
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Counters under /stats, state and results of batches."""
+        path = self.path.rstrip("/")
+        if path == "/stats":
+            with self.server.state.lock:
+                self.send_json(200, dict(self.server.state.counts))
+            return
+        match = re.fullmatch(r".*/v1/messages/batches/([\w-]+)(/results)?", path)
+        if not match or match.group(1) not in self.server.state.batches:
+            self.send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": "not found"}})
+        elif match.group(2):
+            self.send_batch_results(match.group(1))
+        else:
+            self.send_json(200, self.batch_object(match.group(1)))
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Answer a Messages or Chat Completions request (or a synthetic error)."""
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        config = self.server.state.config
+        path = self.path.rstrip("/")
+        if path.endswith("/v1/messages/batches"):
+            self.create_batch(request)
+            return
+        if path.endswith("/v1/messages"):
+            api = "anthropic"
+        elif path.endswith("/chat/completions"):
+            api = "openai"
+        elif re.search(r"/models/[^/]+:(generateContent|streamGenerateContent)$", path.split("?")[0]):
+            api = "gemini"
+            request["stream"] = ":streamGenerateContent" in path
+        else:
+            self.send_json(404, {"error": {"message": f"unknown endpoint {self.path}"}})
+            return
+
+        status, remaining, reset = self.server.state.admit()
+        time.sleep(config.sample_latency())
+        headers = self.rate_limit_headers(api, remaining, reset)
+        if status != 200 and api == "gemini":
+            self.send_json(status, {"error": {"code": status, "message": f"Synthetic {status}",
+                                              "status": "RESOURCE_EXHAUSTED" if status == 429 else "UNAVAILABLE"}})
+        elif status != 200:
+            headers["retry-after"] = f"{max(1.0, reset):.0f}"
+            kind = "rate_limit_error" if status == 429 else "overloaded_error"
+            self.send_json(status, {"type": "error", "error": {"type": kind, "message": f"Synthetic {status}"}},
+                           headers)
+        elif request.get("stream"):
+            self.send_stream(api, request, headers)
+        elif api == "anthropic":
+            self.send_json(200, self.anthropic_answer(request), headers)
+        elif api == "openai":
+            self.send_json(200, self.openai_answer(request), headers)
+        else:
+            self.send_json(200, self.gemini_answer())
+
+    def rate_limit_headers(self, api: str, remaining: int, reset: float) -> dict:
+        """Request limit headers in the format of the API."""
+        limit = self.server.state.config.rpm or 1_000_000
+        if api == "gemini":
+            return {}  # Gemini does not report its limits in headers
+        if api == "anthropic":
+            return {"anthropic-ratelimit-requests-limit": limit,
+                    "anthropic-ratelimit-requests-remaining": remaining,
+                    "anthropic-ratelimit-requests-reset": iso_time(time.time() + reset)}
+        return {"x-ratelimit-limit-requests": limit,
+                "x-ratelimit-remaining-requests": remaining,
+                "x-ratelimit-reset-requests": f"{reset:.3f}s"}
+
+    def prompt_cache_usage(self, request: dict) -> dict:
+        """cache_creation_input_tokens / cache_read_input_tokens of the prefix up to a cache_control block."""
+        prefix = []
+        for message in request.get("messages", []):
+            content = message.get("content")
+            for block in content if isinstance(content, list) else []:
+                if block.get("type") == "text":
+                    prefix.append(block["text"])
+                if "cache_control" in block:
+                    tokens = len("".join(prefix)) // 3
+                    key = hash((request.get("model"), tuple(prefix)))
+                    with self.server.state.lock:
+                        hit = key in self.server.state.prompt_cache
+                        self.server.state.prompt_cache.add(key)
+                    return {"cache_creation_input_tokens": 0 if hit else tokens,
+                            "cache_read_input_tokens": tokens if hit else 0}
+        return {"cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+
+    def anthropic_answer(self, request: dict) -> dict:
+        """Body of a Messages API answer."""
+        config = self.server.state.config
+        return {
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "type": "message",
+            "role": "assistant",
+            "model": request.get("model", "mock"),
+            "content": [{"type": "text", "text": self.server.state.next_text()}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": config.input_tokens, "output_tokens": config.output_tokens,
+                      **self.prompt_cache_usage(request)},
+        }
+
+    def send_stream(self, api: str, request: dict, headers: dict):
+        """Send the answer in chunks of one word; the connection is closed at the end of the stream."""
+        chunks = re.findall(r"\s*\S+\s*$|\s*\S+", self.server.state.next_text()) or [""]
+        events = {"anthropic": self.anthropic_events, "openai": self.openai_events,
+                  "gemini": self.gemini_events}[api](request, chunks)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json" if api == "gemini" else "text/event-stream")
+        self.send_header("Connection", "close")
+        for name, value in headers.items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.close_connection = True
+        for index, event in enumerate(events):
+            if index:
+                time.sleep(self.server.state.config.stream_chunk_delay)
+            self.wfile.write(event.encode("utf-8"))
+            self.wfile.flush()
+
+    def anthropic_events(self, request: dict, chunks: list[str]):
+        """Server-sent events of a streamed Messages API answer."""
+        config = self.server.state.config
+
+        def event(kind: str, data: dict) -> str:
+            return f"event: {kind}\ndata: {json.dumps({'type': kind, **data})}\n\n"
+
+        yield event("message_start", {"message": {
+            "id": f"msg_{uuid.uuid4().hex[:24]}", "type": "message", "role": "assistant",
+            "model": request.get("model", "mock"), "content": [], "stop_reason": None, "stop_sequence": None,
+            "usage": {"input_tokens": config.input_tokens, "output_tokens": 1, **self.prompt_cache_usage(request)}}})
+        yield event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+        for chunk in chunks:
+            yield event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": chunk}})
+        yield event("content_block_stop", {"index": 0})
+        yield event("message_delta", {"delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                      "usage": {"output_tokens": config.output_tokens}})
+        yield event("message_stop", {})
+
+    def openai_events(self, request: dict, chunks: list[str]):
+        """Server-sent events of a streamed Chat Completions answer (usage last, as with include_usage)."""
+        config = self.server.state.config
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": request.get("model", "mock")}
+        for index, chunk in enumerate(chunks):
+            delta = {"role": "assistant", "content": chunk} if index == 0 else {"content": chunk}
+            yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})}\n\n"
+        yield f"data: {json.dumps({**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+        if (request.get("stream_options") or {}).get("include_usage"):
+            usage = {"prompt_tokens": config.input_tokens, "completion_tokens": config.output_tokens,
+                     "total_tokens": config.input_tokens + config.output_tokens}
+            yield f"data: {json.dumps({**base, 'choices': [], 'usage': usage})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    def gemini_events(self, request: dict, chunks: list[str]):  # pylint: disable=unused-argument
+        """Elements of the JSON array of a streamed generateContent answer; the last one has the usage."""
+        config = self.server.state.config
+        for index, chunk in enumerate(chunks):
+            last = index == len(chunks) - 1
+            element = {"candidates": [{"content": {"role": "model", "parts": [{"text": chunk}]}, "index": 0,
+                                       **({"finishReason": "STOP"} if last else {})}]}
+            if last:
+                element["usageMetadata"] = {"promptTokenCount": config.input_tokens,
+                                            "candidatesTokenCount": config.output_tokens,
+                                            "totalTokenCount": config.input_tokens + config.output_tokens}
+            yield ("[" if index == 0 else ",\r\n") + json.dumps(element) + ("]" if last else "")
+
+    def create_batch(self, request: dict):
+        """Accept a Message Batch; its results are produced when they are fetched."""
+        state = self.server.state
+        batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+        custom_ids = [entry["custom_id"] for entry in request.get("requests", [])]
+        model = (request.get("requests") or [{}])[0].get("params", {}).get("model", "mock")
+        with state.lock:
+            state.batches[batch_id] = (time.time(), custom_ids, model)
+            state.counts["batches"] += 1
+            state.counts["batch_requests"] += len(custom_ids)
+        self.send_json(200, self.batch_object(batch_id))
+
+    def batch_object(self, batch_id: str) -> dict:
+        """MessageBatch with processing_status and request_counts."""
+        submitted, custom_ids, _ = self.server.state.batches[batch_id]
+        ended = time.time() - submitted >= self.server.state.config.batch_latency
+        base_url = f"http://{self.headers.get('Host')}"
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {"processing": 0 if ended else len(custom_ids),
+                               "succeeded": len(custom_ids) if ended else 0,
+                               "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": iso_time(submitted),
+            "expires_at": iso_time(submitted + 86400),
+            "ended_at": iso_time(submitted + self.server.state.config.batch_latency) if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{base_url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def send_batch_results(self, batch_id: str):
+        """Results of an ended batch as JSONL; error_rate share of the requests is errored."""
+        _, custom_ids, model = self.server.state.batches[batch_id]
+        lines = []
+        for custom_id in custom_ids:
+            if random.random() < self.server.state.config.error_rate:
+                result = {"type": "errored", "error": {"type": "error", "error": {
+                    "type": "api_error", "message": "Synthetic batch error"}}}
+            else:
+                result = {"type": "succeeded", "message": self.anthropic_answer({"model": model})}
+            lines.append(json.dumps({"custom_id": custom_id, "result": result}))
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/binary")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def openai_answer(self, request: dict) -> dict:
+        """Body of a Chat Completions answer."""
+        config = self.server.state.config
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": self.server.state.next_text()},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": config.input_tokens, "completion_tokens": config.output_tokens,
+                      "total_tokens": config.input_tokens + config.output_tokens},
+        }
+
+    def gemini_answer(self) -> dict:
+        """Body of a generateContent answer."""
+        config = self.server.state.config
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": self.server.state.next_text()}]},
+                            "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": config.input_tokens, "candidatesTokenCount": config.output_tokens,
+                              "totalTokenCount": config.input_tokens + config.output_tokens},
+        }
+
+
+def start_server(config: MockConfig = None, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start the mock server in a background thread. Port 0 picks a free port (server.server_port)."""
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.state = MockState(config or MockConfig())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def load_responses(path: str) -> tuple:
+    """Canned answers from a file: a JSON list of strings, otherwise the whole file as one answer."""
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    try:
+        responses = json.loads(content)
+    except json.JSONDecodeError:
+        return (content,)
+    if isinstance(responses, list) and all(isinstance(r, str) for r in responses):
+        return tuple(responses)
+    return (content,)
+
+
+def main():
+    """Command line: run the mock server until interrupted."""
+    parser = argparse.ArgumentParser(description="Mock server for the Anthropic, OpenAI and Gemini APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rpm", type=int, default=None, help="requests per minute before 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of synthetic 429 answers")
+    parser.add_argument("--overload-rate", type=float, default=0.0, help="share of synthetic 529 answers")
+    parser.add_argument("--latency", type=float, default=0.5, help="mean latency in seconds")
+    parser.add_argument("--latency-distribution", choices=("fixed", "uniform", "lognormal"), default="uniform")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="spread of the lognormal distribution")
+    parser.add_argument("--responses", help="file with canned answers (JSON list of strings or plain text)")
+    parser.add_argument("--batch-latency", type=float, default=2.0, help="seconds until a batch has ended")
+    args = parser.parse_args()
+
+    config = MockConfig(latency=args.latency, rpm=args.rpm, error_rate=args.error_rate,
+                        overload_rate=args.overload_rate, batch_latency=args.batch_latency,
+                        latency_distribution=args.latency_distribution, latency_sigma=args.latency_sigma,
+                        responses=load_responses(args.responses) if args.responses else ())
+    server = start_server(config, args.host, args.port)
+    print(f"Mock server on http://{args.host}:{server.server_port} — Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Masking of the dodis.ch stamp and trimming of empty margins before a page is encoded.
+
+Every PDF of the corpus carries the stamp of the dodis.ch database: on page 1 a QR code with the
+db.dodis.ch logo in the bottom right corner, on every page the link dodis.ch/<id> in the top right
+corner. The prompts ask the model to ignore both, but their image tokens are paid anyway and the link
+still ends up in some transcriptions. Scans also come with wide empty margins.
+
+The stamp is drawn at fixed distances from the corners of the page (in PDF points, the same in all 97
+PDFs of the repository): the QR code is 40 pt wide, 10 pt from the right and bottom edge, with the
+logo above it; the link is 9 pt text ending 10 pt from the right and top edge. At the render DPI these
+boxes are known in pixels, so clean_page()
+- masks a stamp box with the paper colour around it, if the box contains dark pixels (pages without
+  the stamp, e.g. single image files, stay untouched). The stamp itself is not detected: text of the
+  document inside a box (a letterhead in the top right corner) is masked as well, so mask is opt-in,
+- crops the page to the text found by the content filter (page_content.py), plus a padding, if that
+  removes at least min_trim of the area. Scanner edges (rows or columns of pixels that are dark almost
+  over their whole length) do not count as text.
+All steps are NumPy operations on a downscaled grey copy; only the final crop and mask touch the
+full-size page.
+"""
+
+from dataclasses import dataclass
+from typing import NamedTuple
+
+import numpy as np
+from PIL import Image
+
+from page_content import ANALYSIS_LONG_EDGE, ContentThresholds, grey_pixels, ink_mask, text_cells
+
+POINTS_PER_INCH = 72
+# Stamp boxes in points from the page edges: (right, left, top, bottom) distance of the box edges,
+# i.e. the box spans width - left .. width - right horizontally; 2 pt padding around the drawing
+QR_BOX = {"right": 8, "left": 52, "bottom": 8, "top": 62}   # QR code 10-50 pt, logo up to 60.3 pt
+LINK_BOX = {"right": 8, "left": 80, "top": 8, "bottom": 21}  # Text from 77.3 to 10 pt, baseline 17.3 pt
+
+
+@dataclass
+class CleanupOptions:
+    """What clean_page() does; the shares refer to the width and height of the page."""
+    mask: bool = False        # Mask the dodis.ch stamp boxes (fixed positions, see above)
+    trim: bool = True         # Trim empty margins
+    stamp_ink: float = 0.02   # Share of dark pixels that shows the stamp is in its box
+    padding: float = 0.02     # Kept around the text when trimming (share of the long edge)
+    min_trim: float = 0.05    # Smaller savings of area are not worth a crop
+    edge_fill: float = 0.8    # Rows/columns with more inked pixels are scanner edges, not text
+
+
+class CleanupResult(NamedTuple):
+    """Cleaned page and what was done."""
+    image: Image.Image
+    masked: list  # "qr", "link"
+    trimmed: float  # Share of the area that was cropped away
+
+
+def stamp_boxes(width: int, height: int, page_no: int | None, dpi: int) -> dict[str, tuple[int, int, int, int]]:
+    """Pixel boxes (left, top, right, bottom) of the stamp on a rendered PDF page; none for image files."""
+    if page_no is None:
+        return {}
+    scale = dpi / POINTS_PER_INCH
+    boxes = {"link": (width - LINK_BOX["left"] * scale, LINK_BOX["top"] * scale,
+                      width - LINK_BOX["right"] * scale, LINK_BOX["bottom"] * scale)}
+    if page_no == 1:
+        boxes["qr"] = (width - QR_BOX["left"] * scale, height - QR_BOX["top"] * scale,
+                       width - QR_BOX["right"] * scale, height - QR_BOX["bottom"] * scale)
+    return {name: tuple(int(round(min(max(value, 0), limit))) for value, limit in zip(box, (width, height) * 2))
+            for name, box in boxes.items()}
+
+
+def mask_stamp(image: Image.Image, page_no: int | None, dpi: int, options: CleanupOptions) -> tuple[Image.Image, list]:
+    """Paint the stamp boxes that contain the stamp with the paper colour around them."""
+    boxes = stamp_boxes(image.width, image.height, page_no, dpi)
+    masked = []
+    for name, (left, top, right, bottom) in boxes.items():
+        if right - left < 2 or bottom - top < 2:
+            continue
+        region = np.asarray(image.crop((left, top, right, bottom)).convert("L"))
+        if (region < 96).mean() < options.stamp_ink:
+            continue
+        # Paper colour: the bright pixels of a frame around the box
+        frame = image.crop((max(0, 2 * left - right), max(0, 2 * top - bottom),
+                            min(image.width, 2 * right - left), min(image.height, 2 * bottom - top)))
+        pixels = np.asarray(frame).reshape(-1, len(frame.getbands()))
+        paper = tuple(int(value) for value in np.percentile(pixels, 90, axis=0))
+        if not masked:
+            image = image.copy()  # Keep the rendered page unchanged; the caller decides which one to use
+        image.paste(paper if len(paper) > 1 else paper[0], (left, top, right, bottom))
+        masked.append(name)
+    return image, masked
+
+
+def text_box(image: Image.Image, options: CleanupOptions) -> tuple[int, int, int, int] | None:
+    """Pixel box (left, top, right, bottom) around the text of the page, None if no text was found."""
+    # Only clearly dark ink bounds the crop: the faint marks that keep a page from being blank (paper grain,
+    # show-through) would keep the margins as well
+    thresholds = ContentThresholds(margin=0, min_contrast=0.2)
+    pixels = grey_pixels(image, thresholds)
+    if pixels.size == 0:
+        return None
+    ink = ink_mask(pixels, thresholds)
+    # Scanner edges are dark over (almost) the whole row or column; even dense text lines are not
+    edges = (ink.mean(axis=1) > options.edge_fill)[:, None] | (ink.mean(axis=0) > options.edge_fill)[None, :]
+    cells = text_cells(ink & ~edges, thresholds)
+    rows, cols = np.flatnonzero(cells.any(axis=1)), np.flatnonzero(cells.any(axis=0))
+    if rows.size == 0:
+        return None
+    # Cells -> pixels of the page. The strip below and right of the last whole block was not analysed:
+    # text that reaches the last block may continue there, so the box then extends to the page edge.
+    cell = thresholds.cell / min(1.0, ANALYSIS_LONG_EDGE / max(image.size))
+    last_row, last_col = cells.shape[0] - thresholds.block // thresholds.cell, \
+        cells.shape[1] - thresholds.block // thresholds.cell
+    pad = options.padding * max(image.size)
+    left = max(0, int(cols[0] * cell - pad))
+    top = max(0, int(rows[0] * cell - pad))
+    right = image.width if cols[-1] >= last_col else min(image.width, int((cols[-1] + 1) * cell + pad))
+    bottom = image.height if rows[-1] >= last_row else min(image.height, int((rows[-1] + 1) * cell + pad))
+    return left, top, right, bottom
+
+
+def trim_margins(image: Image.Image, options: CleanupOptions) -> tuple[Image.Image, float]:
+    """Crop the page to its text; returns the page and the share of the area that was cropped away."""
+    box = text_box(image, options)
+    if box is None:
+        return image, 0.0  # Nothing to read: the content filter decides about such pages
+    left, top, right, bottom = box
+    saved = 1 - (right - left) * (bottom - top) / (image.width * image.height)
+    if saved < options.min_trim:
+        return image, 0.0
+    return image.crop(box), saved
+
+
+def clean_page(image: Image.Image, page_no: int | None, dpi: int, options: CleanupOptions = None) -> CleanupResult:
+    """Mask the stamp and trim the margins of a rendered page."""
+    options = options or CleanupOptions()
+    masked, trimmed = [], 0.0
+    if options.mask:
+        image, masked = mask_stamp(image, page_no, dpi, options)
+    if options.trim:
+        image, trimmed = trim_margins(image, options)
+    return CleanupResult(image, masked, trimmed)
@@ -0,0 +1,109 @@
+"""Blank and low-content page filter on the rendered page.
+
+Scanned documents contain blank backs, separator pages and pages with only a page number or a stamp.
+measure_content() measures a page in a few vectorized NumPy operations on a downscaled grey copy:
+- ink: share of the pixels that are darker than the paper around them by more than the noise of the paper.
+  Paper brightness and noise are taken from the blocks of the page itself, so yellowed, grey, unevenly lit
+  and faded scans work as well; the margins are ignored because scanner edges and punch holes are dark too,
+- text_area: share of the page covered by text-like cells, i.e. cells of a fine grid with some ink that
+  touch another inked cell. Isolated specks (dust, show-through, JPEG noise) do not count.
+
+classify() turns the measurement into "blank" (no request, the task's empty result is written),
+"sparse" (sent with the short prompt of the task, if it has one) or "text". The thresholds are part of
+ContentThresholds and can be tuned per script.
+
+Measured on the page scans of the corpus (272 pages): the faded pages of dodis-55544, whose text is only
+a few grey levels darker than the paper, have a text area of 0.013-0.06, all other typed and handwritten
+scans 0.08 and more. Synthetic empty paper with grain, gradients and JPEG noise stays below 0.001, but
+show-through and the coarse grain of some real scans reach 0.2 and are sent like text. 29 pages have a white
+scan and their text only as PDF text; they measure 0 on the scan and must be judged on the rendered page.
+No page of the corpus is blank, so the filter is off in the scripts by default. The blank threshold is kept
+low on purpose: a page that is skipped by mistake loses its text, a page sent by mistake costs one request.
+"""
+
+from dataclasses import dataclass
+from typing import NamedTuple
+
+import numpy as np
+from PIL import Image
+
+ANALYSIS_LONG_EDGE = 1000  # Pages are measured at this size; enough for text lines, ~35 ms per page
+
+
+@dataclass
+class ContentThresholds:
+    """Thresholds of the filter; shares refer to the page without its margins."""
+    blank_area: float = 0.001   # Less text area: blank page, nothing is sent
+    sparse_area: float = 0.01   # Less text area: low content, short prompt
+    noise_factor: float = 4.0   # Ink is darker than the paper around it by noise_factor x the noise of the paper
+    min_contrast: float = 0.02  # ... and by at least this share of the paper brightness
+    margin: float = 0.04        # Share of width/height ignored at every edge
+    block: int = 32             # Edge of the blocks the paper brightness is taken from (pixels)
+    cell: int = 8               # Edge of the text cells (pixels)
+    cell_ink: float = 0.04      # Share of inked pixels that makes a text cell
+
+
+class PageContent(NamedTuple):
+    """Measurement of one page."""
+    ink: float
+    text_area: float
+
+
+def grey_pixels(image: Image.Image, thresholds: ContentThresholds) -> np.ndarray:
+    """Downscaled grey page without its margins, cropped to whole blocks."""
+    grey = image.convert("L")
+    scale = ANALYSIS_LONG_EDGE / max(grey.size)
+    if scale < 1:
+        grey = grey.resize((max(1, round(grey.width * scale)), max(1, round(grey.height * scale))),
+                           Image.Resampling.BOX)
+    pixels = np.asarray(grey, dtype=np.float32)
+    height, width = pixels.shape
+    dy, dx = int(height * thresholds.margin), int(width * thresholds.margin)
+    pixels = pixels[dy:height - dy or None, dx:width - dx or None]
+    size = thresholds.block
+    return pixels[:pixels.shape[0] // size * size, :pixels.shape[1] // size * size]
+
+
+def ink_mask(pixels: np.ndarray, thresholds: ContentThresholds) -> np.ndarray:
+    """Boolean mask of the pixels that are darker than the paper of their block by more than its noise."""
+    size = thresholds.block
+    rows, cols = pixels.shape[0] // size, pixels.shape[1] // size
+    blocks = pixels.reshape(rows, size, cols, size)
+    paper, middle = np.percentile(blocks, [90, 50], axis=(1, 3))
+    # Ink only darkens: the spread between the bright side and the middle of a block is the grain of the paper.
+    # Most blocks of a page are paper or sparse text, so the median block gives the noise of the page.
+    noise = float(np.median(paper - middle))
+    # A block full of ink (a dense line, a stamp) has no paper of its own: use the page's instead
+    paper = np.maximum(paper, np.median(pixels) * 0.9)
+    contrast = np.maximum(thresholds.noise_factor * noise, thresholds.min_contrast * paper)
+    return (blocks < (paper - contrast)[:, None, :, None]).reshape(pixels.shape)
+
+
+def text_cells(ink: np.ndarray, thresholds: ContentThresholds) -> np.ndarray:
+    """Cells with ink that touch at least one other such cell (8-neighbourhood)."""
+    size = thresholds.cell
+    rows, cols = ink.shape[0] // size, ink.shape[1] // size
+    cells = ink[:rows * size, :cols * size].reshape(rows, size, cols, size).mean(axis=(1, 3)) > thresholds.cell_ink
+    padded = np.pad(cells, 1)
+    neighbours = sum(padded[1 + dy:rows + 1 + dy, 1 + dx:cols + 1 + dx]
+                     for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dy or dx)
+    return cells & (neighbours > 0)
+
+
+def measure_content(image: Image.Image, thresholds: ContentThresholds = None) -> PageContent:
+    """Ink share and text area of a rendered page."""
+    thresholds = thresholds or ContentThresholds()
+    pixels = grey_pixels(image, thresholds)
+    if pixels.size == 0:
+        return PageContent(0.0, 0.0)  # A strip smaller than one block: nothing to read
+    ink = ink_mask(pixels, thresholds)
+    return PageContent(float(ink.mean()), float(text_cells(ink, thresholds).mean()))
+
+
+def classify(content: PageContent, thresholds: ContentThresholds) -> str:
+    """"blank", "sparse" or "text"."""
+    if content.text_area < thresholds.blank_area:
+        return "blank"
+    if content.text_area < thresholds.sparse_area:
+        return "sparse"
+    return "text"
@@ -0,0 +1,217 @@
+"""Near-duplicate detection of rendered pages before they are sent.
+
+The corpus contains near-identical variants of documents (dodis-55222.pdf / dodis-55222-a.pdf) and
+repeated cover and appendix pages. The engine (Pipeline(dedup_distance=...)) hashes every rendered
+page and sends only one representative per cluster of near-identical pages; the result of the
+representative is copied to the other pages of the cluster.
+
+- phash(): perceptual hash from the low frequencies of the 2D DCT of the downscaled grey page
+  (hash_size x hash_size bits). Re-encoding, another resolution or brightness change only a few bits;
+  shifted or rotated rescans of a page are not matched.
+- MultiIndexHash: exact Hamming-radius lookup through substring tables, so a lookup among 10k+ hashes
+  compares a few dozen candidates instead of every page.
+- PageIndex: the hashes of answered representatives in <output_dir>/.page_hashes.jsonl (per model and
+  prompt, like the journal), so later runs reuse their results too; writes dedup_report.json with the
+  clusters of a run.
+
+The distance is the number of differing bits (0..256). On the scans of this repository, distinct pages
+differ in at least 38 bits (median 126), JPEG re-encoding and rescaling of the same page in at most 16.
+"""
+
+import asyncio
+import json
+import os
+import numpy as np
+from PIL import Image
+
+from page_journal import atomic_write_text
+
+INDEX_FILENAME = ".page_hashes.jsonl"
+REPORT_FILENAME = "dedup_report.json"
+HASH_SIZE = 16        # Bits per side of the hash: 256-bit hashes
+HIGHFREQ_FACTOR = 4   # The page is downscaled to HASH_SIZE * HIGHFREQ_FACTOR pixels per side
+DEFAULT_MAX_DISTANCE = 16
+
+
+def dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II matrix: dct_matrix(n) @ x is the DCT of the vector x."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = dct_matrix(HASH_SIZE * HIGHFREQ_FACTOR)
+
+
+def phash(image: Image.Image, hash_size: int = HASH_SIZE) -> int:
+    """Perceptual hash of a page as int of hash_size² bits."""
+    size = hash_size * HIGHFREQ_FACTOR
+    dct = _DCT if size == _DCT.shape[0] else dct_matrix(size)
+    pixels = np.asarray(image.convert("L").resize((size, size), Image.Resampling.BOX), dtype=np.float64)
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size].ravel()
+    bits = low > np.median(low[1:])  # The DC term only carries the mean brightness
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of differing bits of two hashes."""
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHash:
+    """Exact search for all hashes within max_distance bits (multi-index hashing).
+
+    The hashes are cut into max_distance + 1 substrings with one dict each. Two hashes that differ in
+    at most max_distance bits agree completely in at least one substring (pigeonhole principle), so a
+    lookup only compares the hashes that share a substring with it: a few dozen among 10k pages.
+    """
+
+    def __init__(self, max_distance: int, bits: int = HASH_SIZE * HASH_SIZE):
+        self.max_distance = max_distance
+        count = min(max_distance + 1, bits)
+        self.bounds = [(i * bits // count, (i + 1) * bits // count) for i in range(count)]
+        self.tables = [{} for _ in self.bounds]
+        self.values = []
+        self.items = []
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def substrings(self, value: int) -> list[int]:
+        """The substrings of a hash, one per table."""
+        return [(value >> start) & ((1 << (end - start)) - 1) for start, end in self.bounds]
+
+    def add(self, value: int, item):
+        """Insert a hash with an item (e.g. the page it belongs to)."""
+        index = len(self.values)
+        self.values.append(value)
+        self.items.append(item)
+        for table, key in zip(self.tables, self.substrings(value)):
+            table.setdefault(key, []).append(index)
+
+    def search(self, value: int) -> list[tuple[int, object]]:
+        """(distance, item) of all hashes within max_distance, nearest first."""
+        candidates = set()
+        for table, key in zip(self.tables, self.substrings(value)):
+            candidates.update(table.get(key, ()))
+        found = [(hamming(value, self.values[i]), i) for i in candidates]
+        return [(distance, self.items[i]) for distance, i in sorted(found) if distance <= self.max_distance]
+
+
+class Representative:
+    """A page that is (or was) sent for its cluster; output is set when its result is written."""
+
+    def __init__(self, doc: str, page: int | None, output: str | None = None):
+        self.doc = doc
+        self.page = page
+        self.output = output
+        self.failed = False
+        self.done = asyncio.Event() if output is None else None
+
+    @property
+    def label(self) -> str:
+        """Name of the page in messages and the report."""
+        return self.doc if self.page is None else f"{self.doc} p.{self.page}"
+
+    async def wait(self) -> str | None:
+        """Path of the result once the page is answered, None if it failed."""
+        if self.done is not None:
+            await self.done.wait()
+        return None if self.failed else self.output
+
+
+class PageIndex:  # pylint: disable=too-many-instance-attributes
+    """Hashes of the representatives of one output folder and the clusters of the current run."""
+
+    def __init__(self, output_dir: str, model: str, prompt_hash: str, max_distance: int):
+        self.path = os.path.join(output_dir, INDEX_FILENAME)
+        self.report_path = os.path.join(output_dir, REPORT_FILENAME)
+        self.model = model
+        self.prompt_hash = prompt_hash
+        self.max_distance = max_distance
+        self.lookup = MultiIndexHash(max_distance)
+        self.hashes = {}    # id(representative) -> hash of the representatives of this run
+        self.clusters = {}  # representative label -> duplicates of this run with their distance
+        self.pages_hashed = 0
+        self._load()
+
+    def _load(self):
+        """Finished representatives of earlier runs with the same model and prompt."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Torn last line of an interrupted run
+                if record.get("model") == self.model and record.get("prompt") == self.prompt_hash:
+                    self.lookup.add(int(record["hash"], 16),
+                                  Representative(record["doc"], record["page"], record["output"]))
+
+    def reset(self):
+        """Forget all hashes (RESUME = False)."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.lookup = MultiIndexHash(self.max_distance)
+
+    def hash(self, image: Image.Image) -> int:
+        """Perceptual hash of a rendered page."""
+        self.pages_hashed += 1
+        return phash(image)
+
+    def match(self, value: int) -> tuple[Representative | None, int]:
+        """Representative of the nearest usable cluster and the distance to it; (None, -1) if there is none."""
+        for distance, representative in self.lookup.search(value):
+            if representative.failed:
+                continue
+            if representative.output is not None and not os.path.exists(representative.output):
+                continue  # The result file of an earlier run was deleted
+            return representative, distance
+        return None, -1
+
+    def add(self, value: int, doc: str, page: int | None) -> Representative:
+        """Make a page the representative of its cluster; near-identical pages wait for its result."""
+        representative = Representative(doc, page)
+        self.lookup.add(value, representative)
+        self.hashes[id(representative)] = value
+        return representative
+
+    def add_duplicate(self, representative: Representative, doc: str, page: int | None, distance: int):
+        """Record a page that got the result of its representative."""
+        self.clusters.setdefault(representative.label, []).append({"doc": doc, "page": page, "distance": distance})
+
+    def finish(self, representative: Representative, output: str | None):
+        """Record the result of a representative (None: it failed, its duplicates are sent themselves)."""
+        representative.output = output
+        representative.failed = output is None
+        if output is not None:
+            record = {"hash": f"{self.hashes[id(representative)]:x}", "doc": representative.doc,
+                      "page": representative.page, "model": self.model, "prompt": self.prompt_hash,
+                      "output": output}
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if representative.done is not None:
+            representative.done.set()
+
+    @property
+    def duplicates(self) -> int:
+        """Pages of this run that were matched to a representative."""
+        return sum(len(pages) for pages in self.clusters.values())
+
+    def write_report(self) -> str | None:
+        """Write the clusters of this run (representative -> duplicates with distances); returns the path."""
+        if not self.pages_hashed:
+            return None
+        report = {
+            "max_distance": self.max_distance,
+            "hash_bits": HASH_SIZE * HASH_SIZE,
+            "pages_hashed": self.pages_hashed,
+            "duplicates": self.duplicates,
+            "clusters": dict(sorted(self.clusters.items())),
+        }
+        atomic_write_text(self.report_path, json.dumps(report, indent=2, ensure_ascii=False))
+        return self.report_path
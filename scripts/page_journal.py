@@ -0,0 +1,96 @@
+"""Completion journal for resumable runs.
+
+Every finished page is recorded as one JSON line (pdf, page, model, prompt hash, output file) in a
+journal next to the results. A restarted run skips the pages that are already in the journal and
+whose output file still exists, so only missing or failed pages are sent again.
+
+Each entry is appended with a single write and flushed to disk with fsync. Output files are written
+to a temporary file first and moved into place with os.replace(), so a page is never journaled
+with a half-written result. A torn last line (e.g. after a power loss) is ignored on load.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+JOURNAL_FILENAME = ".page_journal.jsonl"
+
+
+def prompt_hash(prompt: str) -> str:
+    """Short, stable hash of a prompt text."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def atomic_write_text(path: str, text: str):
+    """Write text to path via a temporary file and os.replace()."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class PageJournal:
+    """Append-only journal of finished (pdf, page, model, prompt hash) tuples."""
+
+    def __init__(self, directory: str, filename: str = JOURNAL_FILENAME):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, filename)
+        self._done = {}
+        self._torn_tail = False
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                self._torn_tail = not line.endswith("\n")
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                key = (entry["pdf"], entry["page"], entry["model"], entry["prompt_hash"])
+                self._done[key] = entry.get("output")
+
+    def __len__(self):
+        return len(self._done)
+
+    def is_done(self, pdf: str, page: int, model: str, prompt_digest: str) -> bool:
+        """True if the page was finished with this model and prompt and its output still exists."""
+        key = (pdf, page, model, prompt_digest)
+        if key not in self._done:
+            return False
+        output = self._done[key]
+        return output is None or os.path.exists(output)
+
+    def pending_pages(self, pdf: str, page_count: int, model: str, prompt_digest: str) -> list[int]:
+        """Page numbers (1-based) of a PDF that still have to be processed."""
+        return [n for n in range(1, page_count + 1) if not self.is_done(pdf, n, model, prompt_digest)]
+
+    def mark_done(self, pdf: str, page: int, model: str, prompt_digest: str, output: str = None):
+        """Record a finished page. Call this only after the output file has been written."""
+        entry = {"pdf": pdf, "page": page, "model": model, "prompt_hash": prompt_digest,
+                 "output": output, "finished_at": time.time()}
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        if self._torn_tail:
+            # Terminate a torn last line so that this entry starts on a line of its own
+            line = "\n" + line
+            self._torn_tail = False
+        line = line.encode("utf-8")
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._done[(pdf, page, model, prompt_digest)] = output
+
+    def reset(self):
+        """Forget all finished pages (used when a run should start from scratch)."""
+        self._done.clear()
+        self._torn_tail = False
+        if os.path.exists(self.path):
+            os.remove(self.path)
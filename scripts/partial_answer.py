@@ -0,0 +1,61 @@
+"""Partial answers of streamed requests on disk.
+
+With Pipeline(stream=True) the answer text is appended to <result file>.part as it arrives, so long
+transcriptions show their progress (tail -f) and a killed run keeps what was already generated. The
+file is removed once the answer is complete; the response cache then holds the whole text.
+
+A restarted run (or a retry) continues a partial answer where the provider can (Claude: assistant
+prefill, providers.Provider.supports_prefill); otherwise the page is requested from the start.
+"""
+
+import os
+import time
+
+PARTIAL_SUFFIX = ".part"
+
+
+class PartialAnswer:
+    """The .part file of one page and the arrival time of its first chunk."""
+
+    def __init__(self, result_path: str):
+        self.path = result_path + PARTIAL_SUFFIX
+        self.first_chunk = None  # time.perf_counter() of the first chunk of the current attempt
+        self._file = None
+
+    def existing(self) -> str:
+        """Text of an earlier, interrupted attempt ("" if there is none)."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return ""
+
+    def start(self, keep: str = ""):
+        """Begin an attempt: the file is reset to keep (the text that is continued) and grows from there."""
+        self.close()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "w", encoding="utf-8")  # pylint: disable=consider-using-with
+        self._file.write(keep)
+        self._file.flush()
+        self.first_chunk = None
+
+    def write(self, chunk: str):
+        """Append a chunk of the answer (called by the provider while the answer arrives)."""
+        if not chunk:
+            return
+        if self.first_chunk is None:
+            self.first_chunk = time.perf_counter()
+        self._file.write(chunk)
+        self._file.flush()
+
+    def close(self):
+        """Close the file; its text stays for a later attempt."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """Remove the file (the answer is complete)."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
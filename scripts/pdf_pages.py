@@ -0,0 +1,115 @@
+"""Helpers to rasterize PDFs page by page instead of all at once.
+
+convert_from_path(pdf_path) renders every page of a document into memory before the first
+request can be sent. The functions in this module ask pdfinfo for the page count and render
+one page at a time with first_page/last_page.
+
+render_pages_parallel() renders pages of many PDFs in parallel. Pages are returned in the order
+of the job list, independent of which worker finishes first, so runs stay deterministic.
+pdf2image runs every page through its own pdftoppm process, so a thread pool already keeps all
+cores busy without copying the rendered images between processes. processes=True uses a real
+process pool instead (only for scripts with an `if __name__ == "__main__"` guard, because
+workers re-import the main module on platforms that spawn processes).
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import NamedTuple
+
+from PIL import Image
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+
+class RenderedPage(NamedTuple):
+    """A rendered page of render_pages_parallel(). image is None if rendering failed."""
+    pdf_path: str
+    page_no: int
+    image: object
+    error: Exception | None
+    render_seconds: float = 0.0  # Time spent in the worker
+
+
+def iter_pdf_files(directory: str, extensions: tuple = (".pdf",)):
+    """Yield (filename, path) for every PDF (or file with one of extensions) below directory, sorted."""
+    for root, dirs, filenames in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(extensions):
+                yield filename, os.path.join(root, filename)
+
+
+def get_page_count(pdf_path: str) -> int:
+    """Return the number of pages of a PDF as reported by pdfinfo."""
+    return int(pdfinfo_from_path(pdf_path)["Pages"])
+
+
+def render_page(pdf_path: str, page_no: int, dpi: int = 200):
+    """Render a single page (1-based) of a PDF to a PIL image."""
+    return convert_from_path(pdf_path, dpi=dpi, first_page=page_no, last_page=page_no)[0]
+
+
+def render_source(path: str, page_no: int | None, dpi: int = 200):
+    """Render a PDF page, or load an image file if page_no is None."""
+    if page_no is None:
+        with Image.open(path) as img:
+            img.load()
+            return img.copy()
+    return render_page(path, page_no, dpi)
+
+
+def iter_pdf_pages(pdf_path: str, dpi: int = 200, page_numbers=None):
+    """Yield (page_no, image) for every page of a PDF, rendering one page at a time.
+
+    If page_numbers is given, only these pages (1-based) are rendered.
+    """
+    if page_numbers is None:
+        page_numbers = range(1, get_page_count(pdf_path) + 1)
+    for page_no in page_numbers:
+        yield page_no, render_page(pdf_path, page_no, dpi)
+
+
+def _timed_render(render, pdf_path: str, page_no, dpi: int):
+    """Call render and return (image, seconds); module level, so it works with a process pool."""
+    start = time.perf_counter()
+    image = render(pdf_path, page_no, dpi)
+    return image, time.perf_counter() - start
+
+
+def render_pages_parallel(jobs, dpi: int = 200, workers: int = None, depth: int = None,
+                          processes: bool = False, render=render_page):
+    """Render (pdf_path, page_no) jobs on a worker pool and yield RenderedPage items in job order.
+
+    render is called as render(pdf_path, page_no, dpi); use render_source for mixed PDF/image jobs.
+
+    Up to depth pages (default: 2 * workers) are rendered ahead of the caller, so the pool keeps
+    working while the caller sends the current page. A page that fails to render is yielded with
+    its error instead of stopping the whole run.
+    """
+    workers = workers or os.cpu_count() or 1
+    depth = depth or 2 * workers
+    jobs = iter(jobs)
+    pool = (ProcessPoolExecutor if processes else ThreadPoolExecutor)(max_workers=workers)
+    pending = deque()
+
+    def submit(job):
+        pdf_path, page_no = job
+        pending.append((pdf_path, page_no, pool.submit(_timed_render, render, pdf_path, page_no, dpi)))
+
+    try:
+        for job in islice(jobs, depth):
+            submit(job)
+        while pending:
+            pdf_path, page_no, future = pending.popleft()
+            try:
+                (image, seconds), error = future.result(), None
+            except Exception as e:  # pylint: disable=broad-except
+                image, seconds, error = None, 0.0, e
+            next_job = next(jobs, None)
+            if next_job is not None:
+                submit(next_job)
+            yield RenderedPage(pdf_path, page_no, image, error, seconds)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,667 @@
+"""Pipeline engine shared by all transcription and NER scripts.
+
+The scripts used to copy the same walk → render → send → save loop. The engine implements the loop
+once; a script only picks a provider (providers.py), a task (tasks.py) and its directories:
+
+    Pipeline(ClaudeProvider("claude-sonnet-4-5-20250929"), TranscriptionTask(PROMPT),
+             input_dir="../pdf_data_transcript/fraktur", output_dir="../answers/anthropic_transcript").run()
+
+For every page the engine
+- renders PDF pages (or loads image files) in parallel and in a fixed order (pdf_pages.py),
+- with cleanup masks the dodis.ch stamp (QR code, link) and trims empty margins before the page is
+  measured, hashed and encoded (page_cleanup.py),
+- with content_filter writes the task's empty result for blank pages without a request and sends
+  low-content pages with the task's short prompt (page_content.py),
+- with dedup_distance sends only one page per cluster of near-identical pages and copies its result
+  to the others (page_dedup.py),
+- encodes the page for the provider (image_encoding.py),
+- answers identical requests from the response cache (llm_cache.py),
+- sends up to `concurrency` requests at the same time within the model's rate limits
+  (rate_limiter.py) and retries failed ones,
+- with stream=True appends the answer to disk while it arrives and records the time to the first
+  token; interrupted answers are continued where the provider can (partial_answer.py),
+- lets the task parse the answer (JSON is repaired locally where possible; answers that cannot be
+  repaired get one text-only repair request) and writes the result atomically,
+- records finished pages in the journal so restarted runs skip them (page_journal.py),
+- writes a trace record with the duration of every stage per page (run_trace.py),
+- books the cost of every request with the versioned price of the model (pricing.py) and stops
+  dispatching before budget_dollars would be exceeded (cost_ledger.py),
+- with result_store appends the new result files of the run to the Parquet dataset of all runs
+  (result_store.py).
+"""
+
+import asyncio
+import os
+import random
+import time
+from dataclasses import dataclass, field
+
+from cost_ledger import BudgetExceeded, CostLedger
+from image_encoding import PROVIDER_LONG_EDGE, EncodingOptions, encode_image, estimate_image_tokens
+from llm_cache import DEFAULT_CACHE_PATH, ResponseCache
+from page_cleanup import CleanupOptions, mask_stamp, trim_margins
+from page_content import ContentThresholds, classify, measure_content
+from page_dedup import PageIndex, Representative
+from page_journal import PageJournal, atomic_write_text
+from partial_answer import PartialAnswer
+from pdf_pages import get_page_count, iter_pdf_files, render_pages_parallel, render_source
+from pricing import CURRENT_PRICE_VERSION, Price, price_for
+from providers import Provider
+from rate_limiter import DEFAULT_LIMITS, RateLimit, RateLimiter, is_rate_limit_error
+from result_store import ResultStore
+from run_trace import PageTrace, TraceWriter, stage_table
+from tasks import Task, TaskParseError
+
+REPAIR_REQUEST = "repair request"  # Marks a trace whose answer was repaired by a second, text-only request
+
+
+@dataclass
+class RunStats:
+    """Counters of one pipeline run."""
+    files: int = 0
+    pages_planned: int = 0
+    pages_done: int = 0
+    pages_failed: int = 0
+    pages_skipped: int = 0
+    input_tokens: int = 0  # Uncached input tokens
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+    pages_over_budget: int = 0  # Not sent because the budget was reached
+    pages_deduplicated: int = 0  # Got the result of a near-identical page (page_dedup.py)
+    pages_blank: int = 0        # Blank pages: empty result, nothing sent (page_content.py)
+    pages_sparse: int = 0       # Low-content pages sent with the short prompt of the task
+    blank_pages: list[str] = field(default_factory=list)  # Pages that got the empty result, listed in the summary
+    pages_text: int = 0         # Sent as transcription instead of the image (transcript_pipeline.py)
+    mentions_aligned: int = 0   # Mentions found in the transcription of the page (mention_alignment.py)
+    mentions_fuzzy: int = 0     # ... of which by the fuzzy search
+    model_offsets: int = 0      # Mention offsets returned by the model on those pages
+    model_offsets_wrong: int = 0  # ... that the alignment did not confirm
+    stamps_masked: int = 0      # dodis.ch QR codes and links masked (page_cleanup.py)
+    pages_trimmed: int = 0      # Pages whose empty margins were cropped
+    area_trimmed: float = 0.0   # Sum of the cropped shares of the page area
+    pages_repaired: int = 0     # Answers that needed a repair (json_repair.py or a repair request)
+    repair_requests: int = 0    # Text-only requests for answers that could not be repaired locally
+    pages_stored: int = 0       # Result files added to the result store (result_store.py)
+    retries: int = 0
+    rate_limited: int = 0
+    duration: float = 0.0
+
+
+class Pipeline:  # pylint: disable=too-many-public-methods
+    """Runs one task with one provider over all PDFs (or images) of input_dir."""
+
+    price_factor = 1.0  # Share of the list price that is billed (batch APIs are cheaper)
+    pricing_note = ""
+
+    def __init__(self, provider: Provider, task: Task, input_dir: str, output_dir: str, *,
+                 input_extensions: tuple = (".pdf",), dpi: int = 200, render_workers: int = None,
+                 encoding: EncodingOptions = None, concurrency: int = 4, max_retries: int = 3,
+                 repair_requests: bool = True, stream: bool = False, dedup_distance: int = None,
+                 cleanup: CleanupOptions = None, content_filter: ContentThresholds = None,
+                 rate_limit: RateLimit = None, result_store: str = None,
+                 use_cache: bool = True, cache_path: str = DEFAULT_CACHE_PATH, resume: bool = True, trace: bool = True,
+                 budget_dollars: float = None, price_version: str = CURRENT_PRICE_VERSION,
+                 input_cost_per_mio_in_dollars: float = None, output_cost_per_mio_in_dollars: float = None,
+                 cache_read_cost_per_mio_in_dollars: float = None, cache_write_cost_per_mio_in_dollars: float = None):
+        self.provider = provider
+        self.task = task
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.input_extensions = tuple(ext.lower() for ext in input_extensions)
+        self.dpi = dpi
+        self.render_workers = render_workers or os.cpu_count()
+        self.encoding = encoding or EncodingOptions(max_long_edge=PROVIDER_LONG_EDGE.get(provider.name))
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.repair_requests = repair_requests
+        self.stream = stream
+        self.cleanup = cleanup
+        self.content_filter = content_filter
+        self.limiter = RateLimiter(rate_limit or DEFAULT_LIMITS.get(provider.model, RateLimit()))
+        self.resume = resume
+        self.price = self.resolve_price(price_version, input_cost_per_mio_in_dollars, output_cost_per_mio_in_dollars,
+                                        cache_read_cost_per_mio_in_dollars, cache_write_cost_per_mio_in_dollars)
+        self.cache = ResponseCache(cache_path, enabled=use_cache)
+        self.journal = PageJournal(output_dir)
+        self.dedup = PageIndex(output_dir, provider.model, task.prompt_hash, dedup_distance) \
+            if dedup_distance is not None else None
+        self.tracer = TraceWriter(output_dir, enabled=trace)
+        self.result_store = ResultStore(result_store) if result_store is not None else None
+        self.ledger = CostLedger(output_dir, provider.model, self.price, price_version, self.price_factor,
+                                 budget_dollars)
+        self.doc_folders = {}  # Document name -> folder (relative to the parent of input_dir) for the cost report
+        self.projection_warned = False
+        self.stats = RunStats()
+
+    def resolve_price(self, price_version: str, input_cost: float | None, output_cost: float | None,
+                      cache_read_cost: float | None, cache_write_cost: float | None) -> Price:
+        """Price of the model from the price table; explicitly given prices override it."""
+        listed = price_for(self.provider.model, price_version)
+        if listed is None:
+            listed = Price(0.0, 0.0)
+            if input_cost is None or output_cost is None:
+                print(f"> No price for {self.provider.model} in the price table {price_version}: costs count as $0")
+        input_cost = listed.input if input_cost is None else input_cost
+        # Prompt caching: unless listed, derived from the input price with the provider's factors
+        if cache_read_cost is None:
+            cache_read_cost = listed.cache_read if listed.cache_read is not None and input_cost == listed.input \
+                else input_cost * self.provider.cache_read_price
+        if cache_write_cost is None:
+            cache_write_cost = listed.cache_write if listed.cache_write is not None and input_cost == listed.input \
+                else input_cost * self.provider.cache_write_price
+        return Price(input_cost, listed.output if output_cost is None else output_cost, cache_read_cost,
+                     cache_write_cost)
+
+    # Planning and output names
+
+    @staticmethod
+    def is_pdf(path: str) -> bool:
+        """True for PDF inputs; everything else is treated as a single image."""
+        return path.lower().endswith(".pdf")
+
+    def output_path(self, doc_name: str, page_no: int | None) -> str:
+        """<doc>_page_<n><ext> for PDF pages, <doc><ext> for single images."""
+        base_name = os.path.splitext(doc_name)[0]
+        if page_no is None:
+            return os.path.join(self.output_dir, f"{base_name}{self.task.extension}")
+        return os.path.join(self.output_dir, f"{base_name}_page_{page_no}{self.task.extension}")
+
+    def register_document(self, filename: str, path: str):
+        """Remember the folder of a document for the cost report."""
+        parent = os.path.dirname(os.path.normpath(self.input_dir))
+        self.doc_folders[filename] = os.path.relpath(os.path.dirname(path), parent)
+
+    def is_done(self, doc_name: str, page_no: int | None) -> bool:
+        """True if the journal lists the page as finished with this model and prompt."""
+        return self.journal.is_done(doc_name, page_no or 1, self.provider.model, self.task.prompt_hash)
+
+    def plan_jobs(self) -> list[tuple[str, int | None]]:
+        """(path, page_no) of all pages still to be processed; page_no is None for image files."""
+        jobs = []
+        for filename, path in iter_pdf_files(self.input_dir, self.input_extensions):
+            self.stats.files += 1
+            self.register_document(filename, path)
+            if not self.is_pdf(path):
+                pages = [None]
+            else:
+                try:
+                    pages = list(range(1, get_page_count(path) + 1))
+                except Exception as e:  # pylint: disable=broad-except
+                    print(f"❌ Fehler beim Konvertieren von {filename}: {e}")
+                    continue
+            pending = [n for n in pages if not (self.resume and self.is_done(filename, n))]
+            self.stats.pages_skipped += len(pages) - len(pending)
+            print(f"> File ({self.stats.files}): {filename} — {len(pending)} of {len(pages)} pages pending")
+            jobs.extend((path, page_no) for page_no in pending)
+        self.stats.pages_planned = len(jobs)
+        return jobs
+
+    # Processing of a single page
+
+    def estimate_input_tokens(self, prompt: str, encoded) -> int:
+        """Rough input tokens of a request, taken from the rate limit before it is sent."""
+        if encoded is None:
+            return len(prompt) // 3
+        image_tokens = 1600
+        if self.provider.name in PROVIDER_LONG_EDGE:
+            image_tokens = estimate_image_tokens(encoded.width, encoded.height, self.provider.name)
+        return len(prompt) // 3 + image_tokens
+
+    async def send_request(self, prompt: str, encoded):
+        """One request to the provider (one page image, or the prompt alone if encoded is None)."""
+        return await self.provider.send(prompt, encoded)
+
+    async def send_streaming(self, prompt: str, encoded, partial: PartialAnswer):
+        """One streamed request; the answer is appended to the partial answer file as it arrives.
+
+        The text of an interrupted attempt is continued if the provider supports it, otherwise dropped.
+        """
+        prefill = partial.existing().rstrip() if self.provider.supports_prefill else ""
+        if prefill:
+            print(f"> Continuing {os.path.basename(partial.path)} after {len(prefill)} characters")
+        partial.start(prefill)
+        try:
+            return await self.provider.send_stream(prompt, encoded, partial.write, prefill)
+        finally:
+            partial.close()
+
+    async def send_with_retries(self, prompt: str, encoded, trace: PageTrace = None, partial: PartialAnswer = None):
+        """Send a request within the rate limits; failed requests are repeated up to max_retries times.
+
+        Rate-limit errors (429/529) pause all workers via the limiter; other errors back off only this request.
+        Waiting and request time as well as the retries are added to trace. With partial the answer is streamed.
+        """
+        trace = trace if trace is not None else self.new_trace("", None)
+        estimated = self.estimate_input_tokens(prompt, encoded)
+        reservation = self.ledger.estimate(estimated, self.provider.max_tokens)
+        await self.ledger.reserve(reservation)
+        try:
+            return await self.dispatch(prompt, encoded, estimated, trace, partial)
+        finally:
+            self.ledger.release(reservation)
+
+    async def dispatch(self, prompt: str, encoded, estimated: int, trace: PageTrace,  # pylint: disable=too-many-arguments
+                       partial: PartialAnswer = None):
+        """The attempts of send_with_retries(); the answered request is charged to the ledger."""
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            await self.limiter.acquire(estimated)
+            sent = time.perf_counter()
+            trace.wait += sent - start
+            try:
+                if partial is None:
+                    response = await self.send_request(prompt, encoded)
+                else:
+                    response = await self.send_streaming(prompt, encoded, partial)
+            except Exception as e:  # pylint: disable=broad-except
+                trace.request += time.perf_counter() - sent
+                if is_rate_limit_error(e):
+                    self.stats.rate_limited += 1
+                    delay = self.limiter.record_rate_limit(e)  # acquire() holds back all workers
+                    own_backoff = 0.0
+                else:
+                    delay = own_backoff = 2 ** attempt * random.uniform(1.0, 1.5)
+                if attempt >= self.max_retries:
+                    raise
+                self.stats.retries += 1
+                trace.retries += 1
+                print(f"> Retry {attempt + 1}/{self.max_retries} in {delay:.1f}s: {e}")
+                start = time.perf_counter()
+                await asyncio.sleep(own_backoff)
+                trace.wait += time.perf_counter() - start
+                continue
+            trace.request += time.perf_counter() - sent
+            if partial is not None and partial.first_chunk is not None:
+                trace.ttft = partial.first_chunk - sent
+            used = response.input_tokens + response.cache_write_tokens + response.output_tokens
+            self.limiter.record_success(used, estimated, response.headers)
+            trace.add_usage(response)
+            self.charge(trace, response)
+            return response
+        raise RuntimeError("unreachable")
+
+    async def answer_page(self, prompt: str, image, trace: PageTrace) -> str:
+        """Encode the page and return the answer text (from the cache or from the provider)."""
+        start = time.perf_counter()
+        encoded = await asyncio.to_thread(encode_image, image, self.encoding)
+        image.close()  # Only the encoded page is needed from here on; free the pixels while the request runs
+        trace.encode = time.perf_counter() - start
+        trace.payload_bytes, trace.width, trace.height = len(encoded.data), encoded.width, encoded.height
+        key = ResponseCache.make_key(self.provider.model, prompt, self.provider.cache_params(), encoded.data)
+        cached = self.cache.get(key)
+        if cached is not None:
+            trace.cached = True
+            return cached["text"]
+        partial = PartialAnswer(self.output_path(trace.doc, trace.page)) if self.stream else None
+        response = await self.send_with_retries(prompt, encoded, trace, partial)
+        self.record_response(key, response)
+        if partial is not None:
+            partial.discard()
+        return response.text
+
+    async def answer_text(self, prompt: str, trace: PageTrace) -> str:
+        """Answer to a text-only prompt (from the cache or from the provider)."""
+        key = ResponseCache.make_key(self.provider.model, prompt, self.provider.cache_params(), b"")
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached["text"]
+        response = await self.send_with_retries(prompt, None, trace)
+        self.record_response(key, response)
+        return response.text
+
+    async def parse_answer(self, text: str, trace: PageTrace):
+        """Parse an answer; if it cannot be repaired locally, ask the model once to repair it (text only)."""
+        start = time.perf_counter()
+        try:
+            result, trace.repairs = self.task.parse_report(text)
+        except TaskParseError as e:
+            prompt = self.task.repair_prompt(text, e) if self.repair_requests else None
+            if prompt is None:
+                raise
+            trace.parse += time.perf_counter() - start
+            print(f"> {self.page_label(trace.doc, trace.page)}: {e} — asking for a repaired answer")
+            self.stats.repair_requests += 1
+            trace.repairs = [REPAIR_REQUEST]
+            repaired = await self.answer_text(prompt, trace)
+            start = time.perf_counter()
+            result, repairs = self.task.parse_report(repaired)
+            trace.repairs += repairs
+        trace.parse += time.perf_counter() - start
+        if trace.repairs:
+            self.stats.pages_repaired += trace.pages
+        return result
+
+    def charge(self, trace: PageTrace, response):
+        """Book the cost of an answered request and warn once if the projection exceeds the budget."""
+        pages = 0 if REPAIR_REQUEST in trace.repairs else trace.pages  # The page was charged with its first answer
+        trace.cost += self.ledger.charge(trace.doc, trace.page, pages, self.doc_folders.get(trace.doc, ""), response)
+        budget = self.ledger.budget
+        if budget is not None and not self.projection_warned:
+            pages_left = self.stats.pages_planned - self.ledger.pages - self.stats.pages_failed
+            projected = self.ledger.projection(pages_left)
+            if projected > budget:
+                self.projection_warned = True
+                print(f"> Projected spend ${projected:.2f} exceeds the budget of ${budget:.2f}: "
+                      f"about {int((budget - self.ledger.spent) / self.ledger.cost_per_page())} more pages fit")
+
+    def record_response(self, key: str, response):
+        """Add the token usage of a new answer to the totals and store the answer in the cache."""
+        self.stats.input_tokens += response.input_tokens
+        self.stats.output_tokens += response.output_tokens
+        self.stats.cache_read_tokens += response.cache_read_tokens
+        self.stats.cache_write_tokens += response.cache_write_tokens
+        self.cache.put(key, {"text": response.text, "input_tokens": response.input_tokens,
+                             "output_tokens": response.output_tokens})
+
+    def copy_result(self, source: str, doc_name: str, page_no: int | None) -> str:
+        """Write the result file of a near-identical page as the result of this page and journal it."""
+        with open(source, "r", encoding="utf-8") as f:
+            text = f.read()
+        out_path = self.output_path(doc_name, page_no)
+        atomic_write_text(out_path, text)
+        self.journal.mark_done(doc_name, page_no or 1, self.provider.model, self.task.prompt_hash, out_path)
+        return out_path
+
+    def write_result(self, doc_name: str, page_no: int | None, result) -> str:
+        """Write the result file atomically and record the page in the journal."""
+        out_path = self.output_path(doc_name, page_no)
+        atomic_write_text(out_path, self.task.serialize(result))
+        self.journal.mark_done(doc_name, page_no or 1, self.provider.model, self.task.prompt_hash, out_path)
+        return out_path
+
+    @staticmethod
+    def page_label(doc_name: str, page_no: int | None) -> str:
+        """Name of a page in progress messages."""
+        return doc_name if page_no is None else f"page {page_no} of {doc_name}"
+
+    def new_trace(self, doc_name: str, page_no: int | None, **fields) -> PageTrace:
+        """Empty trace record of a page."""
+        return PageTrace(doc_name, page_no, self.provider.model, self.task.name, **fields)
+
+    def fail_page(self, trace: PageTrace, message: str, error: Exception, status: str = "error"):
+        """Count a failed page, record it in the trace and report it."""
+        self.stats.pages_failed += trace.pages
+        trace.status, trace.error = status, str(error)
+        self.tracer.write(trace)
+        print(message)
+
+    def skip_over_budget(self, trace: PageTrace, error: Exception):
+        """Record a page that was not sent because of the budget (counted at the end of the run)."""
+        trace.status, trace.error = "budget", str(error)
+        self.tracer.write(trace)
+
+    async def finish_page(self, doc_name: str, page_no: int | None, text: str, trace: PageTrace = None):
+        """Parse the answer, write the result and count the page. Failures are reported, not raised."""
+        label = self.page_label(doc_name, page_no)
+        trace = trace if trace is not None else self.new_trace(doc_name, page_no)
+        try:
+            result = await self.parse_answer(text, trace)
+            start = time.perf_counter()
+            await asyncio.to_thread(self.write_result, doc_name, page_no, result)
+            trace.write = time.perf_counter() - start
+        except BudgetExceeded as e:
+            self.skip_over_budget(trace, e)
+            return
+        except TaskParseError as e:
+            self.fail_page(trace, f"> {label}: {e}", e, status="failed")
+            return
+        except Exception as e:  # pylint: disable=broad-except
+            self.fail_page(trace, f"❌ Fehler bei {label}: {e}", e)
+            return
+        self.stats.pages_done += 1
+        self.tracer.write(trace)
+        print(f"> {label} ... Done." + (f" (repaired: {', '.join(trace.repairs)})" if trace.repairs else ""))
+
+    async def deduplicate(self, doc_name: str, page_no: int | None, image, trace: PageTrace) -> Representative | None:
+        """Hash the page and look for a near-identical page that is (or was) sent.
+
+        Returns None if the page got the result of such a page, otherwise its own cluster entry: the page
+        is sent, and near-identical pages that follow wait for its result.
+        """
+        label = self.page_label(doc_name, page_no)
+        start = time.perf_counter()
+        value = await asyncio.to_thread(self.dedup.hash, image)
+        trace.encode += time.perf_counter() - start
+        while True:
+            representative, distance = self.dedup.match(value)
+            if representative is None:
+                return self.dedup.add(value, doc_name, page_no)
+            output = await representative.wait()
+            if output is None:
+                continue  # The representative failed; look for another one (or send this page)
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.copy_result, output, doc_name, page_no)
+            except OSError as e:
+                print(f"> {label}: result of {representative.label} could not be copied ({e}), sending the page")
+                return self.dedup.add(value, doc_name, page_no)
+            trace.write = time.perf_counter() - start
+            trace.duplicate_of = representative.label
+            self.dedup.add_duplicate(representative, doc_name, page_no, distance)
+            self.stats.pages_done += 1
+            self.stats.pages_deduplicated += 1
+            self.tracer.write(trace)
+            print(f"> {label} ... Done. (near-identical to {representative.label}, distance {distance})")
+            return None
+
+    async def mask_page(self, page_no: int | None, image, trace: PageTrace):
+        """The page with the dodis.ch stamp masked (before it is measured, hashed and encoded)."""
+        if self.cleanup is None or not self.cleanup.mask:
+            return image
+        start = time.perf_counter()
+        masked, trace.masked = await asyncio.to_thread(mask_stamp, image, page_no, self.dpi, self.cleanup)
+        trace.encode += time.perf_counter() - start
+        if masked is not image:
+            image.close()
+            self.stats.stamps_masked += len(trace.masked)
+        return masked
+
+    async def trim_page(self, image, trace: PageTrace):
+        """The page cropped to its text (after the content filter, which needs the whole page)."""
+        if self.cleanup is None or not self.cleanup.trim:
+            return image
+        start = time.perf_counter()
+        trimmed, share = await asyncio.to_thread(trim_margins, image, self.cleanup)
+        trace.encode += time.perf_counter() - start
+        if trimmed is not image:
+            image.close()
+            trace.trimmed = round(share, 4)
+            self.stats.pages_trimmed += 1
+            self.stats.area_trimmed += share
+        return trimmed
+
+    async def screen_page(self, doc_name: str, page_no: int | None, image, trace: PageTrace) -> str | None:
+        """Prompt for a page after the content filter; None if the page is blank and got the empty result."""
+        prompt = self.task.prompt_for(doc_name, page_no)
+        if self.content_filter is None:
+            return prompt
+        start = time.perf_counter()
+        content = await asyncio.to_thread(measure_content, image, self.content_filter)
+        trace.encode += time.perf_counter() - start
+        trace.content, trace.text_area = classify(content, self.content_filter), round(content.text_area, 5)
+        if trace.content == "sparse":
+            sparse = self.task.sparse_prompt(doc_name, page_no)
+            if sparse is not None:
+                self.stats.pages_sparse += 1
+                return sparse
+        if trace.content != "blank":
+            return prompt
+        image.close()
+        await self.write_empty_result(doc_name, page_no, trace,
+                                      f"⚠️ blank page, text area {content.text_area:.4f}, not sent")
+        return None
+
+    async def write_empty_result(self, doc_name: str, page_no: int | None, trace: PageTrace, note: str):
+        """Write the task's empty result of a blank page without a request."""
+        label = self.page_label(doc_name, page_no)
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(self.write_result, doc_name, page_no, self.task.empty_result())
+        except OSError as e:
+            self.fail_page(trace, f"❌ Fehler bei {label}: {e}", e)
+            return
+        trace.write = time.perf_counter() - start
+        self.stats.pages_done += 1
+        self.stats.pages_blank += 1
+        self.stats.blank_pages.append(label)
+        self.tracer.write(trace)
+        print(f"> {label} ... Done. ({note})")
+
+    async def send_page(self, doc_name: str, page_no: int | None, prompt: str, image, trace: PageTrace):
+        """Encode → cache/send → parse → write of one page."""
+        try:
+            text = await self.answer_page(prompt, image, trace)
+        except BudgetExceeded as e:
+            self.skip_over_budget(trace, e)
+            return
+        except Exception as e:  # pylint: disable=broad-except
+            self.fail_page(trace, f"❌ Fehler bei {self.page_label(doc_name, page_no)}: {e}", e)
+            return
+        await self.finish_page(doc_name, page_no, text, trace)
+
+    async def process_page(self, path: str, page_no: int | None, image, render_seconds: float = 0.0):
+        """Run one page through cleanup → content filter → dedup → encode → cache/send → parse → write.
+
+        Failures are reported, not raised, so one odd page does not stop the workers. A representative
+        of near-identical pages is always finished, so the pages waiting for it are released.
+        """
+        doc_name = os.path.basename(path)
+        trace = self.new_trace(doc_name, page_no, rasterize=render_seconds)
+        representative = None
+        try:
+            image = await self.mask_page(page_no, image, trace)
+            prompt = await self.screen_page(doc_name, page_no, image, trace)
+            if prompt is None:
+                return
+            image = await self.trim_page(image, trace)
+            if self.dedup is not None:
+                representative = await self.deduplicate(doc_name, page_no, image, trace)
+                if representative is None:
+                    return
+            await self.send_page(doc_name, page_no, prompt, image, trace)
+        except Exception as e:  # pylint: disable=broad-except
+            self.fail_page(trace, f"❌ Fehler bei {self.page_label(doc_name, page_no)}: {e}", e)
+        finally:
+            if representative is not None:
+                # A failed representative lets its near-identical pages be sent themselves
+                self.dedup.finish(representative,
+                                  self.output_path(doc_name, page_no) if trace.status == "ok" else None)
+
+    # Run
+
+    async def run_async(self):
+        """Render pages in the background and process them with `concurrency` workers."""
+        jobs = await asyncio.to_thread(self.plan_jobs)
+        print("----------------------------------------")
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+
+        async def producer():
+            pages = render_pages_parallel(jobs, dpi=self.dpi, workers=self.render_workers, render=render_source)
+            while (page := await asyncio.to_thread(next, pages, None)) is not None:
+                if self.ledger.stopped:
+                    await asyncio.to_thread(pages.close)  # Stop rendering pages that will not be sent
+                    break
+                if page.error is not None:
+                    doc_name = os.path.basename(page.pdf_path)
+                    self.fail_page(self.new_trace(doc_name, page.page_no, rasterize=page.render_seconds),
+                                   f"❌ Fehler beim Konvertieren von {doc_name}: {page.error}", page.error)
+                    continue
+                await queue.put(page)
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        async def worker():
+            while (page := await queue.get()) is not None:
+                await self.process_page(page.pdf_path, page.page_no, page.image, page.render_seconds)
+
+        await asyncio.gather(producer(), *(worker() for _ in range(self.concurrency)))
+
+    def run(self) -> RunStats:
+        """Run the pipeline and print the summary."""
+        start_time = time.time()
+        print("----------------------------------------")
+        print(f"{self.task.name} with {self.provider.model}: {os.path.abspath(self.input_dir)}")
+        if not self.resume:
+            self.journal.reset()
+            if self.dedup is not None:
+                self.dedup.reset()
+        elif len(self.journal) > 0:
+            print(f"Resume: {len(self.journal)} pages already done according to the journal")
+        asyncio.run(self.run_async())
+        self.stats.duration = time.time() - start_time
+        if self.ledger.stopped:
+            self.stats.pages_over_budget = max(0, self.stats.pages_planned - self.stats.pages_done
+                                               - self.stats.pages_failed)
+        self.ledger.write_report()
+        if self.dedup is not None:
+            self.dedup.write_report()
+        if self.result_store is not None:
+            # Pages without a trace record (tracing off) are stored under the run of this pipeline
+            self.stats.pages_stored = self.result_store.ingest(self.output_dir, self.task.name, self.provider.model,
+                                                               self.tracer.run_id)["added"]
+        self.print_summary()
+        self.provider.close()
+        self.cache.close()
+        self.tracer.close()
+        return self.stats
+
+    def print_summary(self):
+        """Print the end-of-run report."""
+        stats = self.stats
+        print("----------------------------------------")
+        print(f"Total processing time: {stats.duration:.2f} seconds")
+        print(f"Pages done/failed/skipped: {stats.pages_done} / {stats.pages_failed} / {stats.pages_skipped}"
+              f" (retries: {stats.retries}, rate limited: {stats.rate_limited})")
+        total_input = stats.input_tokens + stats.cache_read_tokens + stats.cache_write_tokens
+        print(f"Total tokens (in/out): {total_input} / {stats.output_tokens}")
+        if stats.cache_read_tokens or stats.cache_write_tokens:
+            print(f"Input tokens uncached/cache read/cache write: {stats.input_tokens} / "
+                  f"{stats.cache_read_tokens} / {stats.cache_write_tokens}")
+        if stats.stamps_masked or stats.pages_trimmed:
+            print(f"Page cleanup: {stats.stamps_masked} dodis.ch stamps masked, {stats.pages_trimmed} pages trimmed "
+                  f"(on average {stats.area_trimmed / stats.pages_trimmed if stats.pages_trimmed else 0:.0%} "
+                  f"of the area)")
+        if stats.pages_text:
+            print(f"Text input: {stats.pages_text} pages sent as their transcription instead of the image")
+        if stats.mentions_aligned or stats.model_offsets:
+            print(f"Mention alignment: {stats.mentions_aligned} mentions found in the transcriptions "
+                  f"({stats.mentions_fuzzy} fuzzy), {stats.model_offsets_wrong} of {stats.model_offsets} "
+                  f"offsets of the model corrected")
+        if stats.pages_blank or stats.pages_sparse:
+            print(f"Content filter: {stats.pages_blank} blank pages not sent, "
+                  f"{stats.pages_sparse} low-content pages sent with the short prompt")
+        if stats.blank_pages:
+            # An empty result is never written silently: check these pages if a text is missing
+            print(f"⚠️ Empty result written without a request: {', '.join(stats.blank_pages)}")
+        if self.dedup is not None and self.dedup.pages_hashed:
+            print(f"Near-identical pages: {stats.pages_deduplicated} got the result of another page "
+                  f"(report: {self.dedup.report_path})")
+        if stats.pages_repaired or stats.repair_requests:
+            print(f"Answers repaired: {stats.pages_repaired} pages (repair requests: {stats.repair_requests})")
+        if stats.files == 0:
+            print("No files were processed — check input directory or file types.")
+        elif self.ledger.pages > 0:
+            # Per page and per file: a file (PDF) has many pages. Only the files that sent requests count;
+            # files answered from the journal or the cache have no output tokens in this run
+            print(f"Average output tokens per page: {stats.output_tokens / self.ledger.pages:.2f}, "
+                  f"per file: {stats.output_tokens / len(self.ledger.documents):.2f}")
+        in_cost = self.ledger.cost(stats.input_tokens, 0, stats.cache_read_tokens, stats.cache_write_tokens)
+        out_cost = self.ledger.cost(0, stats.output_tokens)
+        print(f"Estimated cost (in/out{self.pricing_note}, prices {self.ledger.price_version}): "
+              f"${in_cost:.2f} / ${out_cost:.2f} (${self.ledger.cost_per_page():.4f} per page)")
+        if self.ledger.budget is not None:
+            print(f"Budget: ${self.ledger.spent:.2f} of ${self.ledger.budget:.2f} spent"
+                  + (f", {stats.pages_over_budget} pages not sent (about "
+                     f"${self.ledger.cost_per_page() * stats.pages_over_budget:.2f} more)"
+                     if stats.pages_over_budget else ""))
+        if os.path.exists(self.ledger.report_path):
+            print(f"Cost per document and folder: {self.ledger.report_path}")
+        if self.result_store is not None:
+            print(f"Result store: {stats.pages_stored} result files added to {self.result_store.path}")
+        print(self.cache.summary())
+        if self.tracer.records:
+            print("\n".join(stage_table(self.tracer.records)))
+            if self.tracer.enabled:
+                print(f"Trace: {self.tracer.path} (summary: python run_trace.py {self.output_dir})")
+        print("----------------------------------------")
@@ -0,0 +1,50 @@
+"""Versioned list prices of the models used by the scripts, in dollars per million tokens.
+
+Prices change over time. A change gets a new version instead of an edit of an old one, so the costs in
+older ledgers (cost_ledger.py stores the version with every request) can still be reproduced.
+price_for() finds a model by its exact name or by the longest prefix, so dated snapshots such as
+"claude-sonnet-4-5-20250929" get the price of their family.
+
+Batch discounts are not part of the table; the engine applies them (Pipeline.price_factor).
+"""
+
+from typing import NamedTuple
+
+
+class Price(NamedTuple):
+    """List price of a model in dollars per million tokens. None = input price x provider factor."""
+    input: float
+    output: float
+    cache_read: float | None = None
+    cache_write: float | None = None
+
+
+PRICE_TABLES = {
+    "2025-03": {
+        "claude-3-7-sonnet": Price(3.00, 15.00, 0.30, 3.75),
+        "claude-3-5-haiku": Price(0.80, 4.00, 0.08, 1.00),
+        "gemini-2.0-flash": Price(0.10, 0.40, 0.025),
+        "gemini-1.5-pro": Price(1.25, 5.00, 0.3125),
+        "gpt-4o": Price(2.50, 10.00, 1.25),
+        "gpt-4o-mini": Price(0.15, 0.60, 0.075),
+    },
+    "2025-10": {
+        "claude-sonnet-4-5": Price(3.00, 15.00, 0.30, 3.75),
+        "claude-3-7-sonnet": Price(3.00, 15.00, 0.30, 3.75),
+        "claude-3-5-haiku": Price(0.80, 4.00, 0.08, 1.00),
+        "gemini-2.5-flash": Price(0.30, 2.50, 0.03),
+        "gemini-2.0-flash": Price(0.10, 0.40, 0.025),
+        "gpt-4o": Price(2.50, 10.00, 1.25),
+        "gpt-4o-mini": Price(0.15, 0.60, 0.075),
+    },
+}
+CURRENT_PRICE_VERSION = "2025-10"
+
+
+def price_for(model: str, version: str = CURRENT_PRICE_VERSION) -> Price | None:
+    """Price of model in a table version (exact name or longest prefix), None if unknown."""
+    table = PRICE_TABLES[version]
+    if model in table:
+        return table[model]
+    matches = [name for name in table if model.startswith(name)]
+    return table[max(matches, key=len)] if matches else None
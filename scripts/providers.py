@@ -0,0 +1,440 @@
+"""Model providers for the pipeline engine (pipeline.py).
+
+A provider sends one prompt plus one encoded page to a model and returns the answer text together
+with the token usage. Instead of the page image, page can be a text that stands in for the page (the
+transcription of the page, see transcript_pipeline.py); page=None sends the prompt alone, e.g. to
+repair an answer. Everything else
+(rendering, encoding, caching, retries, concurrency, writing results) is done by the engine, so it
+works the same for every provider.
+
+send_stream() streams the answer instead: the text is handed to a callback chunk by chunk as it
+arrives (the engine appends it to disk, see partial_answer.py). Claude can also continue a partial
+answer of an interrupted request (assistant prefill).
+
+The API clients are created on first use from the keys in the environment (.env). The SDK retries
+are switched off, so rate-limit errors reach the engine's rate limiter (rate_limiter.py). base_url
+points a provider at another endpoint, e.g. the local mock server (mock_llm_server.py).
+
+With cache_prompt=True the static prompt is sent as a cacheable prefix (Anthropic cache_control,
+Gemini context caching; OpenAI caches long prefixes automatically). input_tokens then only counts the
+uncached input; cache reads and cache writes are reported separately because they are billed at
+other prices (cache_read_price / cache_write_price, relative to the input price).
+"""
+
+import asyncio
+import datetime
+import os
+import time
+from typing import Callable, NamedTuple
+
+from image_encoding import EncodedImage
+
+
+class ProviderResponse(NamedTuple):
+    """Answer text and token usage of one request (plus the HTTP headers, where the SDK exposes them)."""
+    text: str
+    input_tokens: int  # Uncached input tokens
+    output_tokens: int
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+    headers: dict | None = None
+
+
+class Provider:
+    """Base class. Subclasses implement send() (and send_stream()) for one API."""
+
+    name = "base"  # Key into image_encoding.PROVIDER_LONG_EDGE
+    supports_prefill = False  # send_stream() can continue a partial answer
+    cache_read_price = 1.0   # Price of cached input tokens relative to the input price
+    cache_write_price = 1.0  # Price of input tokens written to the cache relative to the input price
+
+    def __init__(self, model: str, temperature: float = None, max_tokens: int = None, system: str = None,
+                 cache_prompt: bool = False):
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.system = system
+        self.cache_prompt = cache_prompt
+
+    def cache_params(self) -> dict:
+        """Generation parameters that change the answer and therefore belong into the cache key."""
+        return {"temperature": self.temperature, "max_tokens": self.max_tokens, "system": self.system}
+
+    async def send(self, prompt: str, page: EncodedImage | str | None) -> ProviderResponse:
+        """Send prompt and page (image, text in place of the page or None: prompt only) to the model."""
+        raise NotImplementedError
+
+    async def send_stream(self, prompt: str, page: EncodedImage | str | None, on_text: Callable[[str], None],
+                          prefill: str = "") -> ProviderResponse:  # pylint: disable=unused-argument
+        """Like send(), but on_text(chunk) is called with every piece of the answer as it arrives.
+
+        prefill is a partial answer the model continues (only if supports_prefill); the returned text
+        includes it. Providers without streaming hand over the whole answer as one chunk.
+        """
+        response = await self.send(prompt, page)
+        on_text(response.text)
+        return response
+
+    def close(self):
+        """Release resources held on the provider side (e.g. context caches)."""
+
+
+class ClaudeProvider(Provider):
+    """Anthropic Messages API (Claude)."""
+
+    name = "anthropic"
+    supports_prefill = True
+    cache_read_price = 0.1
+    cache_write_price = 1.25  # 5-minute cache
+
+    def __init__(self, model: str, temperature: float = None, max_tokens: int = 8192, system: str = None,
+                 base_url: str = None, cache_prompt: bool = False):
+        super().__init__(model, temperature, max_tokens, system, cache_prompt)
+        self.base_url = base_url
+        self._client = None
+
+    @property
+    def client(self):
+        """AsyncAnthropic client, created on first use."""
+        if self._client is None:
+            from anthropic import AsyncAnthropic  # pylint: disable=import-outside-toplevel
+            api_key = os.getenv("ANTHROPIC_API_KEY") or os.getenv("CLAUDE_API_KEY")
+            if not api_key:
+                raise RuntimeError("Kein API-Key gefunden. Bitte ANTHROPIC_API_KEY oder CLAUDE_API_KEY in .env setzen.")
+            self._client = AsyncAnthropic(api_key=api_key, base_url=self.base_url, max_retries=0)
+        return self._client
+
+    def build_request(self, prompt: str, page: EncodedImage | str | None) -> dict:
+        """Keyword arguments for messages.create(). The prompt comes first, so it is a cacheable prefix."""
+        prompt_block = {"type": "text", "text": prompt}
+        if self.cache_prompt and page is not None:
+            prompt_block["cache_control"] = {"type": "ephemeral"}
+        content = [prompt_block]
+        if isinstance(page, str):
+            content.append({"type": "text", "text": page})
+        elif page is not None:
+            content.append({
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": page.media_type,
+                    "data": page.to_base64(),
+                },
+            })
+        request = {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "messages": [{"role": "user", "content": content}],
+        }
+        if self.temperature is not None:
+            request["temperature"] = self.temperature
+        if self.system:
+            request["system"] = self.system
+        return request
+
+    @staticmethod
+    def extract_text(resp, strip: bool = True) -> str:
+        """Join the text blocks of a response (SDK objects or dicts)."""
+        text_parts = []
+        for block in (resp.content or []):
+            txt = getattr(block, "text", None)
+            if txt is None and isinstance(block, dict):
+                txt = block.get("text")
+            if txt:
+                text_parts.append(txt)
+        text = "".join(text_parts)
+        return text.strip() if strip else text
+
+    @staticmethod
+    def usage_tokens(resp) -> tuple[int, int, int, int]:
+        """(input, output, cache read, cache write) tokens of a response, 0 if missing."""
+        usage = getattr(resp, "usage", None)
+        return tuple(int(getattr(usage, field, 0) or 0) for field in (
+            "input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"))
+
+    async def send(self, prompt: str, page: EncodedImage | str | None) -> ProviderResponse:
+        raw = await self.client.messages.with_raw_response.create(**self.build_request(prompt, page))
+        resp = raw.parse()
+        return ProviderResponse(self.extract_text(resp), *self.usage_tokens(resp), headers=dict(raw.headers))
+
+    async def send_stream(self, prompt: str, page: EncodedImage | str | None, on_text: Callable[[str], None],
+                          prefill: str = "") -> ProviderResponse:
+        request = self.build_request(prompt, page)
+        if prefill:
+            request["messages"].append({"role": "assistant", "content": prefill})
+        async with self.client.messages.stream(**request) as stream:
+            async for text in stream.text_stream:
+                on_text(text)
+            message = await stream.get_final_message()
+        text = (prefill + self.extract_text(message, strip=False)).strip()
+        return ProviderResponse(text, *self.usage_tokens(message), headers=dict(stream.response.headers))
+
+    # Message Batches API: half the price, answers within 24 hours (see batch_pipeline.py)
+
+    async def submit_batch(self, requests: dict[str, dict]) -> str:
+        """Submit {custom_id: build_request(...)} as one Message Batch and return the batch id."""
+        batch = await self.client.messages.batches.create(
+            requests=[{"custom_id": custom_id, "params": params} for custom_id, params in requests.items()])
+        return batch.id
+
+    async def retrieve_batch(self, batch_id: str):
+        """Current state of a batch (processing_status, request_counts)."""
+        return await self.client.messages.batches.retrieve(batch_id)
+
+    async def batch_results(self, batch_id: str):
+        """Yield (custom_id, ProviderResponse or None, error message) for every request of an ended batch."""
+        async for entry in await self.client.messages.batches.results(batch_id):
+            result = entry.result
+            if result.type == "succeeded":
+                yield entry.custom_id, ProviderResponse(self.extract_text(result.message),
+                                                        *self.usage_tokens(result.message)), None
+            else:
+                error = getattr(getattr(result, "error", None), "error", None)
+                yield entry.custom_id, None, getattr(error, "message", None) or result.type
+
+
+class GeminiProvider(Provider):
+    """Google Gemini (google.generativeai).
+
+    With cache_prompt=True every distinct prompt is stored once in a context cache (CachedContent,
+    together with the system instruction) and the requests only carry the page. The cache lives for
+    cache_ttl seconds, is extended while it is in use and deleted by close().
+
+    base_url switches to the REST transport (e.g. for the mock server). Its async client does not
+    work in google-generativeai 0.8, so the requests then run in a worker thread.
+    """
+
+    name = "gemini"
+    cache_read_price = 0.1
+
+    def __init__(self, model: str, temperature: float = None, max_tokens: int = None, system: str = None,
+                 timeout: int = 600, cache_prompt: bool = False, cache_ttl: int = 3600, base_url: str = None):
+        super().__init__(model, temperature, max_tokens, system, cache_prompt)
+        self.timeout = timeout
+        self.base_url = base_url
+        self.cache_ttl = cache_ttl
+        self._model = None
+        self._contexts = {}  # prompt -> [CachedContent, GenerativeModel, creation time] (None, None if not possible)
+        self._context_lock = asyncio.Lock()
+        self._unreported_cache_writes = 0
+
+    @property
+    def generation_config(self) -> dict | None:
+        """Temperature and output limit, None if both are defaults."""
+        generation_config = {}
+        if self.temperature is not None:
+            generation_config["temperature"] = self.temperature
+        if self.max_tokens is not None:
+            generation_config["max_output_tokens"] = self.max_tokens
+        return generation_config or None
+
+    @property
+    def generative_model(self):
+        """GenerativeModel instance, created on first use."""
+        if self._model is None:
+            import google.generativeai as genai  # pylint: disable=import-outside-toplevel
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("GEMINI_API_KEY nicht gefunden. Bitte .env Datei prüfen!")
+            if self.base_url:
+                genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": self.base_url})
+            else:
+                genai.configure(api_key=api_key)
+            self._model = genai.GenerativeModel(self.model, generation_config=self.generation_config,
+                                                system_instruction=self.system)
+        return self._model
+
+    def create_context(self, prompt: str):
+        """Store the prompt in a context cache; returns the cache and a model that uses it."""
+        import google.generativeai as genai  # pylint: disable=import-outside-toplevel
+        from google.generativeai import caching  # pylint: disable=import-outside-toplevel
+        _ = self.generative_model  # Configures the API key
+        context = caching.CachedContent.create(model=self.model, system_instruction=self.system, contents=[prompt],
+                                               ttl=datetime.timedelta(seconds=self.cache_ttl))
+        model = genai.GenerativeModel.from_cached_content(context, generation_config=self.generation_config)
+        return context, model
+
+    async def cached_model(self, prompt: str):
+        """Model that has the prompt in its context cache, or None (caching off or not possible)."""
+        if not self.cache_prompt:
+            return None
+        async with self._context_lock:
+            if prompt not in self._contexts:
+                try:
+                    context, model = await asyncio.to_thread(self.create_context, prompt)
+                    self._unreported_cache_writes += int(context.usage_metadata.total_token_count or 0)
+                except Exception as e:  # pylint: disable=broad-except
+                    print(f"> Context caching not possible, the prompt is sent with every page: {e}")
+                    context = model = None
+                self._contexts[prompt] = [context, model, time.monotonic()]
+            entry = self._contexts[prompt]
+            if entry[0] is not None and time.monotonic() - entry[2] > self.cache_ttl / 2:
+                await asyncio.to_thread(entry[0].update, ttl=datetime.timedelta(seconds=self.cache_ttl))
+                entry[2] = time.monotonic()
+            return entry[1]
+
+    async def send(self, prompt: str, page: EncodedImage | str | None) -> ProviderResponse:
+        return await self.generate(prompt, self.part(page))
+
+    async def send_stream(self, prompt: str, page: EncodedImage | str | None, on_text: Callable[[str], None],
+                          prefill: str = "") -> ProviderResponse:
+        return await self.generate(prompt, self.part(page), on_text)
+
+    @staticmethod
+    def part(page: EncodedImage | str | None):
+        """Content part of a page: inline image, text or None."""
+        return page.as_gemini_part() if isinstance(page, EncodedImage) else page
+
+    @staticmethod
+    def chunk_text(chunk) -> str:
+        """Text of a streamed chunk ("" for chunks without text, e.g. the final one with the usage)."""
+        try:
+            return chunk.text or ""
+        except ValueError:
+            return ""
+
+    def stream_in_thread(self, model, contents: list, on_text: Callable[[str], None]):
+        """Streamed generate_content() of the REST transport, run in a worker thread."""
+        answer = model.generate_content(contents, stream=True, request_options={"timeout": self.timeout})
+        for chunk in answer:
+            on_text(self.chunk_text(chunk))
+        return answer
+
+    async def generate(self, prompt: str, part, on_text: Callable[[str], None] = None) -> ProviderResponse:
+        """Send prompt and one content part (page image, text or uploaded file, None: prompt only).
+
+        The prompt may come from the context cache; prompts without a part are one-off and not cached.
+        With on_text the answer is streamed.
+        """
+        model = await self.cached_model(prompt) if part is not None else None
+        if model is not None:
+            contents = [part]
+        else:
+            contents = [prompt] if part is None else [prompt, part]
+        model = model or self.generative_model
+        if on_text is not None and self.base_url:
+            answer = await asyncio.to_thread(self.stream_in_thread, model, contents, on_text)
+        elif on_text is not None:
+            answer = await model.generate_content_async(contents, stream=True,
+                                                        request_options={"timeout": self.timeout})
+            async for chunk in answer:
+                on_text(self.chunk_text(chunk))
+        elif self.base_url:
+            answer = await asyncio.to_thread(model.generate_content, contents,
+                                             request_options={"timeout": self.timeout})
+        else:
+            answer = await model.generate_content_async(contents, request_options={"timeout": self.timeout})
+        usage = answer.usage_metadata
+        cached = int(getattr(usage, "cached_content_token_count", 0) or 0)
+        cache_writes, self._unreported_cache_writes = self._unreported_cache_writes, 0
+        return ProviderResponse(answer.text or "", int(usage.prompt_token_count or 0) - cached,
+                                int(usage.candidates_token_count or 0), cached, cache_writes)
+
+    # Files API: whole documents instead of page images (see document_pipeline.py)
+
+    async def upload(self, path: str, mime_type: str = "application/pdf"):
+        """Upload a file through the Files API and wait until Gemini has processed it."""
+        import google.generativeai as genai  # pylint: disable=import-outside-toplevel
+        _ = self.generative_model  # Configures the API key
+        uploaded = await asyncio.to_thread(genai.upload_file, path, mime_type=mime_type,
+                                           display_name=os.path.basename(path))
+        while uploaded.state.name == "PROCESSING":
+            await asyncio.sleep(2)
+            uploaded = await asyncio.to_thread(genai.get_file, uploaded.name)
+        if uploaded.state.name != "ACTIVE":
+            raise RuntimeError(f"Upload von {os.path.basename(path)} fehlgeschlagen: {uploaded.state.name}")
+        return uploaded
+
+    async def delete_upload(self, uploaded):
+        """Delete an uploaded file (they would otherwise be kept for 48 hours)."""
+        import google.generativeai as genai  # pylint: disable=import-outside-toplevel
+        await asyncio.to_thread(genai.delete_file, uploaded.name)
+
+    async def send_document(self, prompt: str, uploaded) -> ProviderResponse:
+        """Send the prompt together with an uploaded document."""
+        return await self.generate(prompt, uploaded)
+
+    def close(self):
+        """Delete the context caches, so their storage is not billed until the TTL ends."""
+        for context, _, _ in self._contexts.values():
+            if context is not None:
+                try:
+                    context.delete()
+                except Exception as e:  # pylint: disable=broad-except
+                    print(f"> Context cache could not be deleted: {e}")
+        self._contexts.clear()
+
+
+class OpenAIProvider(Provider):
+    """OpenAI Chat Completions API. Prompts of 1024+ tokens are cached automatically by OpenAI."""
+
+    name = "openai"
+    cache_read_price = 0.5
+
+    def __init__(self, model: str, temperature: float = None, max_tokens: int = None, system: str = None,
+                 api_key: str = None, base_url: str = None):
+        super().__init__(model, temperature, max_tokens, system)
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+
+    @property
+    def client(self):
+        """AsyncOpenAI client, created on first use."""
+        if self._client is None:
+            from openai import AsyncOpenAI  # pylint: disable=import-outside-toplevel
+            api_key = self.api_key or os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY nicht gefunden. Bitte .env Datei prüfen!")
+            self._client = AsyncOpenAI(api_key=api_key, base_url=self.base_url, max_retries=0)
+        return self._client
+
+    def build_messages(self, prompt: str, page: EncodedImage | str | None) -> list[dict]:
+        """Chat messages with the page as data URL."""
+        messages = []
+        if self.system:
+            messages.append({"role": "system", "content": self.system})
+        content = [{"type": "text", "text": prompt}]
+        if isinstance(page, str):
+            content.append({"type": "text", "text": page})
+        elif page is not None:
+            content.append({"type": "image_url",
+                            "image_url": {"url": f"data:{page.media_type};base64,{page.to_base64()}"}})
+        messages.append({"role": "user", "content": content})
+        return messages
+
+    def build_request(self, prompt: str, page: EncodedImage | str | None) -> dict:
+        """Keyword arguments for chat.completions.create()."""
+        request = {"model": self.model, "messages": self.build_messages(prompt, page)}
+        if self.temperature is not None:
+            request["temperature"] = self.temperature
+        if self.max_tokens is not None:
+            request["max_tokens"] = self.max_tokens
+        return request
+
+    @staticmethod
+    def usage_tokens(usage) -> tuple[int, int, int]:
+        """(uncached input, output, cached input) tokens, 0 if the usage is missing."""
+        if usage is None:
+            return 0, 0, 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = int(getattr(details, "cached_tokens", 0) or 0)
+        return int(usage.prompt_tokens) - cached, int(usage.completion_tokens), cached
+
+    async def send(self, prompt: str, page: EncodedImage | str | None) -> ProviderResponse:
+        raw = await self.client.chat.completions.with_raw_response.create(**self.build_request(prompt, page))
+        answer = raw.parse()
+        return ProviderResponse(answer.choices[0].message.content or "", *self.usage_tokens(answer.usage),
+                                headers=dict(raw.headers))
+
+    async def send_stream(self, prompt: str, page: EncodedImage | str | None, on_text: Callable[[str], None],
+                          prefill: str = "") -> ProviderResponse:
+        request = {**self.build_request(prompt, page), "stream": True, "stream_options": {"include_usage": True}}
+        raw = await self.client.chat.completions.with_raw_response.create(**request)
+        parts, usage = [], None
+        async for chunk in raw.parse():
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                on_text(parts[-1])
+            usage = chunk.usage or usage  # Only the last chunk carries the usage
+        return ProviderResponse("".join(parts), *self.usage_tokens(usage), headers=dict(raw.headers))
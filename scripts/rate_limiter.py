@@ -0,0 +1,215 @@
+"""Per-model rate limiting for the pipeline engine.
+
+With several requests in flight the providers answer with 429 (rate limit) or 529 (overloaded).
+RateLimiter shapes the dispatch with two token buckets, one for requests per minute and one for
+tokens per minute. It learns from rate-limit response headers where the provider sends them
+(Anthropic and OpenAI). On a rate-limit error it pauses all dispatch with jittered exponential
+backoff and lowers the refill rate (multiplicative decrease). Successful requests slowly restore
+the rate again (additive increase), so a run settles just below the quota instead of oscillating.
+"""
+
+import asyncio
+import math
+import random
+import re
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+
+class RateLimit(NamedTuple):
+    """Budget of one model: requests and tokens (input + output) per minute. None = unlimited."""
+    rpm: int | None = None
+    tpm: int | None = None
+
+
+# Defaults for the models used in this repository (lowest paid tier). Override per script if needed.
+DEFAULT_LIMITS = {
+    "claude-sonnet-4-5-20250929": RateLimit(rpm=50, tpm=30_000),
+    "gemini-2.5-flash": RateLimit(rpm=1_000, tpm=1_000_000),
+    "gpt-4o": RateLimit(rpm=500, tpm=30_000),
+}
+# Models that are not in the table get the lowest budget of the table until the API headers say otherwise
+FALLBACK_LIMIT = RateLimit(rpm=50, tpm=30_000)
+
+
+def default_limit(model: str) -> RateLimit:
+    """Default budget of a model; FALLBACK_LIMIT (with a warning) for models that are not in DEFAULT_LIMITS."""
+    if model not in DEFAULT_LIMITS:
+        print(f"⚠️ No rate limit known for {model}: using {FALLBACK_LIMIT.rpm} requests and "
+              f"{FALLBACK_LIMIT.tpm} tokens per minute until the API reports its limits")
+        return FALLBACK_LIMIT
+    return DEFAULT_LIMITS[model]
+
+
+class TokenBucket:
+    """Continuously refilled bucket with `per_minute` capacity."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, factor: float = 1.0):
+        """Add the tokens earned since the last call (refill rate scaled by factor)."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60 * factor)
+        self.updated = now
+
+    def wait_time(self, amount: float, factor: float = 1.0) -> float:
+        """Seconds until amount tokens are available (0 if available now)."""
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / (self.capacity / 60 * factor)
+
+    def set_capacity(self, per_minute: float):
+        """Change the budget, keeping the current fill level where possible."""
+        self.capacity = float(per_minute)
+        self.tokens = min(self.tokens, self.capacity)
+
+
+def parse_reset(value: str) -> float | None:
+    """Seconds until a rate-limit reset header ("2025-01-01T12:00:00Z", "6m0s", "20ms", "1.5")."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    if "T" in value:
+        try:
+            reset = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            return max(0.0, (reset - datetime.now(timezone.utc)).total_seconds())
+        except ValueError:
+            return None
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r"([\d.]+)(ms|h|m|s)", value)
+    try:
+        return sum(float(number) * units[unit] for number, unit in parts) if parts else None
+    except ValueError:
+        return None  # "1.2.3s"
+
+
+def parse_count(value: str | None) -> int | None:
+    """Integer of a limit or remaining header ("50", "50.0"), None if missing or malformed."""
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if math.isfinite(number) else None
+
+
+def retry_after(exc: Exception) -> float | None:
+    """Retry-After of a failed request in seconds, if the error carries the response headers."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    return parse_reset(headers.get("retry-after"))
+
+
+def is_rate_limit_error(exc: Exception) -> bool:
+    """True for 429 (rate limit) and 529 (overloaded) errors of any of the SDKs."""
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    if status in (429, 529):
+        return True
+    return type(exc).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests")
+
+
+class RateLimiter:
+    """Shapes dispatch against an RPM and a TPM budget and backs off on rate-limit errors."""
+
+    def __init__(self, limit: RateLimit = RateLimit(), safety: float = 0.9, max_backoff: float = 60.0):
+        self.safety = safety
+        self.max_backoff = max_backoff
+        self.requests = TokenBucket(limit.rpm * safety) if limit.rpm else None
+        self.tokens = TokenBucket(limit.tpm * safety) if limit.tpm else None
+        self.factor = 1.0          # Share of the budget currently used (lowered on 429)
+        self.paused_until = 0.0    # monotonic time until which no request is dispatched
+        self.consecutive_limits = 0
+        self._lock = None
+
+    def _buckets(self, estimated_tokens: int):
+        if self.requests is not None:
+            yield self.requests, 1
+        if self.tokens is not None:
+            yield self.tokens, estimated_tokens
+
+    async def acquire(self, estimated_tokens: int = 0):
+        """Wait until a request with estimated_tokens may be sent, then take it from the budget."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if self.paused_until > now:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                for bucket, _ in self._buckets(estimated_tokens):
+                    bucket.refill(self.factor)
+                wait = max((bucket.wait_time(amount, self.factor)
+                            for bucket, amount in self._buckets(estimated_tokens)), default=0.0)
+                if wait <= 0:
+                    for bucket, amount in self._buckets(estimated_tokens):
+                        bucket.tokens -= min(amount, bucket.capacity)
+                    return
+                await asyncio.sleep(wait)
+
+    def record_success(self, used_tokens: int, estimated_tokens: int, headers=None):
+        """Correct the token bucket with the real usage and learn from rate-limit headers."""
+        if self.tokens is not None:
+            self.tokens.tokens -= used_tokens - min(estimated_tokens, self.tokens.capacity)
+        self.consecutive_limits = 0
+        self.factor = min(1.0, self.factor + 0.02)
+        if headers:
+            self.update_from_headers(headers)
+
+    def record_rate_limit(self, exc: Exception = None) -> float:
+        """Pause all dispatch after a 429/529 and lower the rate. Returns the pause in seconds."""
+        self.consecutive_limits += 1
+        self.factor = max(0.1, self.factor * 0.7)
+        # Jitter, so the waiting workers do not all come back at the same moment
+        delay = retry_after(exc) if exc is not None else None
+        if delay is not None:
+            delay += random.uniform(0.0, 1.0)
+        else:
+            delay = min(self.max_backoff, 2 ** (self.consecutive_limits - 1)) * random.uniform(1.0, 1.5)
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        return delay
+
+    def update_from_headers(self, headers):
+        """Adopt limits and resets from Anthropic (anthropic-ratelimit-*) or OpenAI (x-ratelimit-*) headers."""
+        def get(*names):
+            for name in names:
+                value = headers.get(name)
+                if value is not None:
+                    return value
+            return None
+
+        # The request is already answered: malformed headers are ignored instead of failing the page
+        request_limit = parse_count(get("anthropic-ratelimit-requests-limit", "x-ratelimit-limit-requests"))
+        token_limit = parse_count(get("anthropic-ratelimit-tokens-limit", "x-ratelimit-limit-tokens"))
+        if request_limit and request_limit > 0:
+            if self.requests is None:
+                self.requests = TokenBucket(request_limit * self.safety)
+            else:
+                self.requests.set_capacity(request_limit * self.safety)
+        if token_limit and token_limit > 0:
+            if self.tokens is None:
+                self.tokens = TokenBucket(token_limit * self.safety)
+            else:
+                self.tokens.set_capacity(token_limit * self.safety)
+
+        # Nothing left until the reset: pause instead of running into a 429
+        for remaining_names, reset_names in (
+                (("anthropic-ratelimit-requests-remaining", "x-ratelimit-remaining-requests"),
+                 ("anthropic-ratelimit-requests-reset", "x-ratelimit-reset-requests")),
+                (("anthropic-ratelimit-tokens-remaining", "x-ratelimit-remaining-tokens"),
+                 ("anthropic-ratelimit-tokens-reset", "x-ratelimit-reset-tokens"))):
+            remaining = parse_count(get(*remaining_names))
+            if remaining is not None and remaining <= 0:
+                reset = parse_reset(get(*reset_names))
+                if reset:
+                    self.paused_until = max(self.paused_until, time.monotonic() + reset)
@@ -0,0 +1,308 @@
+"""Columnar store of the results of all runs (Parquet dataset, partitioned by task/model/run).
+
+The engine writes one result file per page (<doc>_page_<n>.txt or .json) below the output folders, and
+every analysis used to walk and parse these trees again. ingest() collects the result files of an
+output folder into a Parquet dataset with one row per result file:
+- folder (relative to the ingested folder), doc, page (None for single images and for the <doc>.json
+  of the whole-document mode, which covers `pages` pages),
+- text: the result file as written (the transcription, or the JSON of a JSON task),
+- entities: persons and places of NER results with normalized name, confidence, geo coordinates and
+  mention offsets; results stored as {"error": ..., "raw_text": ...} are read with the NER parser,
+- status, token usage, cost, latency (seconds of the requests), ttft, retries and response cache hits
+  from the run traces (run_trace.py); None for results without a trace,
+- source path, size and mtime of the result file and the time it was ingested.
+task, model and run are the hive partitions (task=ner/model=gemini-2.5-flash/run=20251017-101500/).
+They come from the trace record of the page, the run is the name of its trace file. Results without a
+trace, like the older Gemini results in answers/, get the task, model and run given to ingest(); the
+task is otherwise taken from the file extension. The split page files of the whole-document mode get
+task, model and run of their document; its usage is on the row of the <doc>.json.
+
+Ingesting is incremental: result files that are in the store with the same size and mtime are skipped,
+new and changed ones are appended as a new Parquet file per partition. load() reads the store (or the
+partitions matching a filter) in one vectorized read and keeps the latest row per result file.
+
+    python result_store.py ingest ../answers/google_transcript --model gemini-2.5-flash --run 2025-03
+    python result_store.py ingest ../answers/google_ner --model gemini-2.5-flash --run 2025-03
+    python result_store.py ingest ../answers/anthropic_transcript             # task/model/run from the traces
+    python result_store.py stats --task ner
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from cost_ledger import REPORT_FILENAME as COST_REPORT_FILENAME
+from page_dedup import REPORT_FILENAME as DEDUP_REPORT_FILENAME
+from run_trace import TRACE_DIRNAME, load_traces
+from tasks import NerTask, TaskParseError
+
+DEFAULT_STORE_DIR = "../answers/result_store"
+PARTITIONS = ["task", "model", "run"]
+UNTRACED_RUN = "untraced"
+# <doc>_page_<n>.txt/.json or <doc>.txt/.json; hidden files (.batches.json, .page_hashes.jsonl) are state, not results
+RESULT_FILE = re.compile(r"^(?P<doc>[^.].*?)(?:_page_(?P<page>\d+))?(?P<extension>\.txt|\.json)$")
+REPORT_FILES = {COST_REPORT_FILENAME, DEDUP_REPORT_FILENAME}
+EXTENSION_TASKS = {".txt": "transcription", ".json": "ner"}
+USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens")
+
+MENTION = pa.struct([("start", pa.int64()), ("end", pa.int64())])
+ENTITY = pa.struct([("kind", pa.string()), ("name", pa.string()), ("normalized", pa.string()),
+                    ("confidence", pa.float64()), ("lat", pa.float64()), ("lon", pa.float64()),
+                    ("mentions", pa.list_(MENTION))])
+SCHEMA = pa.schema([
+    ("folder", pa.string()), ("doc", pa.string()), ("page", pa.int32()), ("pages", pa.int32()),
+    ("text", pa.string()), ("entities", pa.list_(ENTITY)), ("status", pa.string()),
+    *((name, pa.int64()) for name in USAGE_FIELDS),
+    ("cost", pa.float64()), ("latency", pa.float64()), ("ttft", pa.float64()), ("retries", pa.int32()),
+    ("cached", pa.bool_()),
+    ("source", pa.string()), ("source_size", pa.int64()), ("source_mtime", pa.float64()), ("ingested", pa.float64()),
+    *((name, pa.string()) for name in PARTITIONS),
+])
+# Partition values are read as strings: a run named 2025 must not become a number
+PARTITIONING = ds.partitioning(pa.schema([(name, pa.string()) for name in PARTITIONS]), flavor="hive")
+KINDS = {"persons": "person", "places": "place"}
+
+
+def number(value) -> float | None:
+    """Float of a JSON value, None if it is not a number."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def ner_result(data):
+    """Stored NER result; answers stored as {"error": ..., "raw_text": ...} are read with the NER parser."""
+    if isinstance(data, dict) and "raw_text" in data and not any(key in data for key in KINDS):
+        try:
+            return NerTask("").parse_report(data["raw_text"])[0]  # Answer that could not be parsed when it was written
+        except TaskParseError:
+            return None
+    return data
+
+
+def entity_rows(data) -> list[dict]:
+    """Persons and places of a NER result as rows of the entities column."""
+    data = ner_result(data)
+    rows = []
+    for key, kind in KINDS.items():
+        entities = data.get(key) if isinstance(data, dict) else None
+        for entity in entities if isinstance(entities, list) else []:
+            if not isinstance(entity, dict) or not isinstance(entity.get("name"), str):
+                continue
+            geo = entity.get("geo") if isinstance(entity.get("geo"), dict) else {}
+            mentions = entity.get("mentions") if isinstance(entity.get("mentions"), list) else []
+            rows.append({
+                "kind": kind, "name": entity["name"],
+                "normalized": entity["normalized"] if isinstance(entity.get("normalized"), str) else None,
+                "confidence": number(entity.get("confidence")),
+                "lat": number(geo.get("lat")), "lon": number(geo.get("lon")),
+                "mentions": [{"start": NerTask.offset(m.get("start")), "end": NerTask.offset(m.get("end"))}
+                             for m in mentions if isinstance(m, dict) and NerTask.offset(m.get("start")) is not None
+                             and NerTask.offset(m.get("end")) is not None],
+            })
+    return rows
+
+
+def result_files(directory: str, extension: str, pages_only: bool = False) -> dict[str, str]:
+    """Relative path -> path of the result files with extension below directory (report files are skipped)."""
+    files = {}
+    for folder, dirnames, filenames in os.walk(directory):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in filenames:
+            match = RESULT_FILE.match(filename)
+            if match is None or match["extension"] != extension or filename in REPORT_FILES:
+                continue
+            if match["page"] or not pages_only:
+                path = os.path.join(folder, filename)
+                files[os.path.relpath(path, directory)] = path
+    return files
+
+
+def trace_index(directory: str) -> dict[tuple[str, int | None], tuple[dict, str]]:
+    """(doc, page) -> latest successful trace record of a page and its run, from the traces of directory."""
+    trace_dir = os.path.join(directory, TRACE_DIRNAME)
+    if not os.path.isdir(trace_dir):
+        return {}
+    index = {}
+    for filename in sorted(f for f in os.listdir(trace_dir) if f.endswith(".jsonl")):
+        run = os.path.splitext(filename)[0]
+        for record in load_traces(os.path.join(trace_dir, filename)):
+            if record.get("status") != "ok":
+                continue  # Failed pages wrote no result file
+            key = (os.path.splitext(record["doc"])[0], record.get("page"))
+            if key not in index or index[key][0]["finished"] <= record["finished"]:
+                index[key] = (record, run)
+    return index
+
+
+class ResultStore:
+    """Parquet dataset of the result files of all runs."""
+
+    def __init__(self, path: str = DEFAULT_STORE_DIR):
+        self.path = path
+
+    def exists(self) -> bool:
+        """True once something was ingested."""
+        return os.path.isdir(self.path) and any(
+            filename.endswith(".parquet") for _, _, filenames in os.walk(self.path) for filename in filenames)
+
+    def dataset(self) -> ds.Dataset:
+        """The store as a pyarrow dataset (for filters and projections pandas does not offer)."""
+        return ds.dataset(self.path, format="parquet", partitioning=PARTITIONING)
+
+    def known_sources(self) -> dict[str, tuple[int, float, bool]]:
+        """Result file -> size, mtime and whether it was ingested with a trace (latest row per file)."""
+        if not self.exists():
+            return {}
+        table = self.dataset().to_table(columns=["source", "source_size", "source_mtime", "run", "ingested"])
+        frame = table.to_pandas().sort_values("ingested").drop_duplicates("source", keep="last")
+        return {source: (size, mtime, run != UNTRACED_RUN) for source, size, mtime, run in zip(
+            frame["source"], frame["source_size"], frame["source_mtime"], frame["run"])}
+
+    # Ingesting
+
+    def ingest(self, output_dir: str, task: str = None, model: str = None, run: str = None) -> dict:
+        """Append the new and changed result files below output_dir; returns counters.
+
+        task, model and run are used for result files without a trace record.
+        """
+        counts = {"added": 0, "unchanged": 0, "invalid": 0}
+        root = os.path.abspath(output_dir)
+        store = os.path.abspath(self.path)
+        known = self.known_sources()
+        rows = []
+        ingested = time.time()
+        for folder, dirnames, filenames in os.walk(root):
+            # Hidden folders hold journals, traces and partial answers; the store may be below output_dir
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith(".") and os.path.join(folder, d) != store)
+            traces = trace_index(folder)
+            for filename in sorted(filenames):
+                match = RESULT_FILE.match(filename)
+                if match is None or filename in REPORT_FILES:
+                    continue
+                path = os.path.join(folder, filename)
+                stat = os.stat(path)
+                page = int(match["page"]) if match["page"] else None
+                traced = traces.get((match["doc"], page)) or traces.get((match["doc"], None))
+                if path in known and known[path][:2] == (stat.st_size, stat.st_mtime) \
+                        and (known[path][2] or traced is None):
+                    counts["unchanged"] += 1
+                    continue
+                row = self.result_row(path, match, page, traced, stat)
+                if row is None:
+                    counts["invalid"] += 1
+                    continue
+                row.update(folder=os.path.relpath(folder, root), ingested=ingested)
+                if traced is None:
+                    row.update(task=task or EXTENSION_TASKS[match["extension"]], model=model or "unknown",
+                               run=run or UNTRACED_RUN)
+                rows.append(row)
+        if rows:
+            table = pa.Table.from_pylist(rows, schema=SCHEMA)
+            pq.write_to_dataset(table, self.path, partition_cols=PARTITIONS,
+                                basename_template=f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}-{{i}}"
+                                                  ".parquet",
+                                existing_data_behavior="overwrite_or_ignore")
+        counts["added"] = len(rows)
+        return counts
+
+    @staticmethod
+    def result_row(path: str, match: re.Match, page: int | None, traced: tuple[dict, str] | None,
+                   stat: os.stat_result) -> dict | None:
+        """Row of one result file; None if it cannot be read."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError):
+            return None
+        entities = None
+        if match["extension"] == ".json":
+            try:
+                entities = entity_rows(json.loads(text))
+            except json.JSONDecodeError:
+                entities = []
+        row = {"doc": match["doc"], "page": page, "pages": 1, "text": text, "entities": entities,
+               "status": None, "source": path, "source_size": stat.st_size, "source_mtime": stat.st_mtime}
+        if traced is None:
+            return row
+        record, run = traced
+        row.update(task=record["task"], model=record["model"], run=run, status=record["status"])
+        if record.get("page") == page:  # The split page files of a whole document have no usage of their own
+            row.update({name: record.get(name) for name in USAGE_FIELDS},
+                       pages=record.get("pages", 1), cost=record.get("cost"), latency=record.get("request"),
+                       ttft=record.get("ttft"), retries=record.get("retries"), cached=record.get("cached"))
+        return row
+
+    # Reading
+
+    def load(self, columns: list[str] = None, filters: list = None, latest: bool = True) -> pd.DataFrame:
+        """Rows of the store as a DataFrame.
+
+        filters are pyarrow filters, e.g. [("task", "==", "ner"), ("model", "==", "gemini-2.5-flash")];
+        only the matching partitions are read. latest keeps only the latest row per result file.
+        """
+        if not self.exists():
+            return pd.DataFrame(columns=columns or SCHEMA.names)
+        read = columns if columns is None or not latest else list(dict.fromkeys([*columns, "source", "ingested"]))
+        frame = pd.read_parquet(self.path, columns=read, filters=filters, partitioning=PARTITIONING)
+        if latest:
+            frame = frame.sort_values("ingested", kind="stable").drop_duplicates("source", keep="last")
+        return frame[columns].reset_index(drop=True) if columns else frame.reset_index(drop=True)
+
+
+def print_stats(frame: pd.DataFrame):
+    """Pages, entities, tokens and request latency per task/model/run."""
+    if frame.empty:
+        print("The store is empty.")
+        return
+    frame = frame.assign(entity_count=frame["entities"].map(lambda e: 0 if e is None else len(e)),
+                         tokens_in=frame["input_tokens"] + frame["cache_read_tokens"] + frame["cache_write_tokens"])
+    for column in PARTITIONS:
+        frame[column] = frame[column].astype(str)
+    summary = frame.groupby(PARTITIONS).agg(
+        pages=("page", "size"), docs=("doc", "nunique"), entities=("entity_count", "sum"),
+        tokens_in=("tokens_in", "sum"), tokens_out=("output_tokens", "sum"), cost=("cost", "sum"),
+        latency_p50=("latency", "median"), latency_p95=("latency", lambda s: s.quantile(0.95)))
+    with pd.option_context("display.width", 160, "display.max_columns", None):
+        print(summary.to_string(float_format=lambda value: f"{value:.3f}"))
+
+
+def main():
+    """Command line: ingest output folders or print the statistics of the store."""
+    parser = argparse.ArgumentParser(description="Columnar store of the pipeline results")
+    parser.add_argument("--store", default=DEFAULT_STORE_DIR, help="Parquet dataset (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="append new and changed result files of output folders")
+    ingest.add_argument("output_dirs", nargs="+")
+    ingest.add_argument("--task", help="task of results without a trace (default: from the file extension)")
+    ingest.add_argument("--model", help="model of results without a trace")
+    ingest.add_argument("--run", help=f"run of results without a trace (default: {UNTRACED_RUN})")
+    stats = commands.add_parser("stats", help="pages, entities, tokens and latency per task/model/run")
+    for name in PARTITIONS:
+        stats.add_argument(f"--{name}")
+    args = parser.parse_args()
+
+    store = ResultStore(args.store)
+    start = time.perf_counter()
+    if args.command == "ingest":
+        for output_dir in args.output_dirs:
+            counts = store.ingest(output_dir, args.task, args.model, args.run)
+            print(f"{output_dir}: {counts['added']} added, {counts['unchanged']} unchanged, "
+                  f"{counts['invalid']} unreadable")
+    else:
+        filters = [(name, "==", getattr(args, name)) for name in PARTITIONS if getattr(args, name)]
+        print_stats(store.load(filters=filters or None))
+    print(f"({(time.perf_counter() - start) * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Structured per-page traces of pipeline runs and their summary.
+
+The engine writes one JSON line per page to <output_dir>/.run_traces/<run start>.jsonl with the
+duration of every stage in seconds:
+- rasterize: rendering the PDF page (or loading the image file)
+- encode: preparing the page for the provider: cleanup, content filter, near-duplicate hash and encoding
+  (whole-document mode: uploading the PDF)
+- wait: waiting for the rate limiter and for the backoff between retries
+- request: the requests to the provider (all attempts)
+- parse: turning the answer into a result
+- write: writing the result file and the journal entry
+plus payload size, image size, token usage, cost, retries, repairs, response cache hit, status and model.
+Pages answered with the result of a near-identical page record it in duplicate_of. With the page
+cleanup, masked lists the masked parts of the dodis.ch stamp and trimmed the cropped share of the page
+area (page_cleanup.py). With the content filter, content is "blank", "sparse" or "text" and text_area
+the measured share of text (page_content.py).
+Pages sent as their transcription (transcript_pipeline.py) record the transcript file in transcript.
+Streamed requests also record ttft, the time from sending the request to the first chunk of the answer.
+In the batch mode only parse and write are timed; the requests run on the provider's side.
+
+The summary reports p50/p95/p99 per stage and pages/s of a run:
+
+    python run_trace.py ../answers/anthropic_transcript          # latest run of an output folder
+    python run_trace.py ../answers/anthropic_transcript/.run_traces/20251017-101500.jsonl
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+
+TRACE_DIRNAME = ".run_traces"
+STAGES = ("rasterize", "encode", "wait", "request", "parse", "write")
+
+
+@dataclass
+class PageTrace:  # pylint: disable=too-many-instance-attributes
+    """Trace record of one page (or of one document in the whole-document mode)."""
+    doc: str
+    page: int | None
+    model: str
+    task: str
+    pages: int = 1
+    status: str = "ok"  # ok, failed (answer could not be parsed), error, budget (not sent)
+    error: str | None = None
+    rasterize: float = 0.0
+    encode: float = 0.0
+    wait: float = 0.0
+    request: float = 0.0
+    parse: float = 0.0
+    write: float = 0.0
+    payload_bytes: int = 0
+    width: int = 0
+    height: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+    cost: float = 0.0  # Dollars (cost_ledger.py)
+    retries: int = 0
+    ttft: float | None = None  # Seconds to the first streamed chunk of the answered request
+    duplicate_of: str | None = None  # Page whose result was copied (page_dedup.py); nothing was sent
+    masked: list = field(default_factory=list)  # Masked parts of the dodis.ch stamp: "qr", "link"
+    trimmed: float = 0.0  # Share of the page area cropped away with the empty margins
+    content: str | None = None  # blank (nothing was sent), sparse or text (page_content.py)
+    text_area: float | None = None
+    transcript: str | None = None  # Transcription sent instead of the page image (transcript_pipeline.py)
+    repairs: list = field(default_factory=list)  # Repairs of the answer (json_repair.py, repair request)
+    cached: bool = False  # Answer came from the response cache
+    run_started: float = 0.0
+    finished: float = 0.0
+
+    def add_usage(self, response):
+        """Add the token usage of a provider response (a page can need a second, repair request)."""
+        self.input_tokens += response.input_tokens
+        self.output_tokens += response.output_tokens
+        self.cache_read_tokens += response.cache_read_tokens
+        self.cache_write_tokens += response.cache_write_tokens
+
+
+class TraceWriter:
+    """Appends PageTrace records of one run to a JSONL file (thread-safe, flushed per record)."""
+
+    def __init__(self, directory: str, enabled: bool = True):
+        self.enabled = enabled
+        self.run_started = time.time()
+        self.run_id = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.run_started))
+        self.path = os.path.join(directory, TRACE_DIRNAME, f"{self.run_id}.jsonl")
+        self._file = None
+        self._lock = threading.Lock()
+        self.records = []
+
+    def write(self, trace: PageTrace):
+        """Finish the record and append it to the trace file."""
+        trace.run_started = self.run_started
+        trace.finished = time.time()
+        record = asdict(trace)
+        with self._lock:
+            self.records.append(record)
+            if not self.enabled:
+                return
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")  # pylint: disable=consider-using-with
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def close(self):
+        """Close the trace file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def percentile(values: list[float], q: float) -> float:
+    """q-th percentile (0-100) with linear interpolation; 0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def load_traces(path: str) -> list[dict]:
+    """Records of a trace file; a directory means the latest trace of that output folder."""
+    if os.path.isdir(path):
+        trace_dir = path if os.path.basename(os.path.normpath(path)) == TRACE_DIRNAME else \
+            os.path.join(path, TRACE_DIRNAME)
+        files = sorted(f for f in os.listdir(trace_dir) if f.endswith(".jsonl"))
+        if not files:
+            raise FileNotFoundError(f"No traces in {trace_dir}")
+        path = os.path.join(trace_dir, files[-1])
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue  # Torn last line of an interrupted run
+    return records
+
+
+def summarize(records: list[dict]) -> list[str]:
+    """Lines of the summary: pages/s, status counts and p50/p95/p99 per stage."""
+    if not records:
+        return ["No trace records."]
+    pages = sum(r.get("pages", 1) for r in records)
+    pages_ok = sum(r.get("pages", 1) for r in records if r["status"] == "ok")
+    pages_unsent = sum(r.get("pages", 1) for r in records if r["status"] == "budget")
+    started = min(r["run_started"] for r in records)
+    wall = max(r["finished"] for r in records) - started
+    cached = sum(1 for r in records if r.get("cached"))
+    duplicates = sum(1 for r in records if r.get("duplicate_of"))
+    blank = sum(1 for r in records if r.get("content") == "blank")
+    lines = [
+        f"Pages: {pages} ({pages_ok} ok, {pages - pages_ok - pages_unsent} failed, {pages_unsent} over budget), "
+        f"{cached} records from the response cache, {duplicates} from near-identical pages, {blank} blank",
+        f"Throughput: {pages_ok / wall if wall > 0 else 0.0:.2f} pages/s over {wall:.1f} s",
+        f"Tokens in/out: {sum(r['input_tokens'] + r['cache_read_tokens'] + r['cache_write_tokens'] for r in records)}"
+        f" / {sum(r['output_tokens'] for r in records)}, retries: {sum(r['retries'] for r in records)}, "
+        f"mean payload: {sum(r['payload_bytes'] for r in records) / len(records) / 1024:.0f} KiB",
+    ]
+    return lines + stage_table(records)
+
+
+def stage_table(records: list[dict]) -> list[str]:
+    """p50/p95/p99, max and total seconds per stage."""
+    lines = [f"{'stage':<10} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'max s':>8} {'total s':>9}"]
+    for stage in STAGES:
+        # Cache hits, near-duplicates and blank pages did not wait or send anything; they would hide the real
+        # request latency
+        values = [r[stage] for r in records
+                  if not ((r.get("cached") or r.get("duplicate_of") or r.get("content") == "blank")
+                          and stage in ("wait", "request"))]
+        lines.append(f"{stage:<10} {percentile(values, 50):>8.3f} {percentile(values, 95):>8.3f} "
+                     f"{percentile(values, 99):>8.3f} {max(values, default=0.0):>8.3f} {sum(values):>9.1f}")
+    ttfts = [r["ttft"] for r in records if r.get("ttft") is not None]
+    if ttfts:
+        lines.append(f"{'ttft':<10} {percentile(ttfts, 50):>8.3f} {percentile(ttfts, 95):>8.3f} "
+                     f"{percentile(ttfts, 99):>8.3f} {max(ttfts):>8.3f} {'':>9}")
+    return lines
+
+
+def main():
+    """Command line: print the summary of a run trace."""
+    parser = argparse.ArgumentParser(description="Summarize a pipeline run trace")
+    parser.add_argument("path", help="trace file (.jsonl) or output folder of a run (latest trace)")
+    args = parser.parse_args()
+    print("\n".join(summarize(load_traces(args.path))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""Tasks for the pipeline engine (pipeline.py).
+
+A task knows the prompt, how an answer is turned into a result and how the result is written to
+disk. The engine stores one result file per page: <doc>_page_<n><extension> for PDFs and
+<doc><extension> for single images.
+
+JSON answers are read tolerantly (json_repair.py) and NER results are checked against the
+persons/places/content schema. For answers that cannot be repaired locally, a task can provide a
+repair prompt: the engine then sends the broken answer as text (without the page image and the long
+prompt) and asks the model for the corrected JSON.
+
+Pages that the content filter (page_content.py) finds blank get the empty result of the task without a
+request; low-content pages are sent with the short prompt of the task, if it has one.
+
+TextNerTask sends the transcription of a page instead of its image, with the offsets of the mentions
+referring to that text (transcript_pipeline.py), or without offsets, which are then computed locally.
+"""
+
+import json
+
+from json_repair import TRUNCATED, JsonRepairError, repair_json
+from page_journal import prompt_hash
+
+
+class TaskParseError(ValueError):
+    """The answer of the model could not be turned into a result."""
+
+
+class Task:
+    """Base class: the answer text is the result."""
+
+    name = "task"
+    extension = ".txt"
+
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+        self.prompt_hash = prompt_hash(prompt)
+
+    def prompt_for(self, doc_name: str, page_no: int | None) -> str:  # pylint: disable=unused-argument
+        """Prompt for one page. Override for prompts that contain page specific values."""
+        return self.prompt
+
+    def parse_report(self, text: str) -> tuple[object, list[str]]:
+        """Result and the repairs that were needed to get it. Raises TaskParseError."""
+        return text, []
+
+    def repair_prompt(self, text: str, error: Exception) -> str | None:  # pylint: disable=unused-argument
+        """Prompt that asks the model to fix an answer that cannot be parsed, None if not possible."""
+        return None
+
+    def serialize(self, result) -> str:
+        """Text that is written to the result file."""
+        return result or ""
+
+    def empty_result(self):
+        """Result of a blank page (written without a request)."""
+        return ""
+
+    def sparse_prompt(self, doc_name: str, page_no: int | None) -> str | None:  # pylint: disable=unused-argument
+        """Short prompt for pages with little content (a page number, a stamp); None: use the full prompt."""
+        return None
+
+
+SPARSE_TRANSCRIPTION_PROMPT = """Diese Seite enthält nur wenig Text (z. B. eine Seitenzahl, einen Stempel, eine
+Notiz oder einen Titel). Transkribiere den gesamten Text der Seite exakt und in der originalen Schreibweise, Zeile für
+Zeile. Gib nur die Transkription zurück, ohne Erklärungen. Enthält die Seite keinen lesbaren Text, antworte mit einer
+leeren Antwort."""
+
+
+class TranscriptionTask(Task):
+    """Page transcription; the answer is stored as plain text."""
+
+    name = "transcription"
+
+    def sparse_prompt(self, doc_name: str, page_no: int | None) -> str | None:  # pylint: disable=unused-argument
+        return SPARSE_TRANSCRIPTION_PROMPT
+
+
+REPAIR_PROMPT = """Die folgende Antwort sollte {expected} sein, lässt sich aber nicht lesen ({error}).
+Gib genau dieses JSON vollständig und gültig zurück: dieselben Inhalte, keine neuen Einträge, keine Erklärungen,
+keine Markdown-Codeblöcke. Ist die Antwort abgeschnitten, schliesse das JSON nach dem letzten vollständigen Eintrag ab.
+
+ANTWORT:
+{text}"""
+
+
+class JsonTask(Task):
+    """The model answers with JSON (optionally wrapped in a ```json code fence or surrounded by text)."""
+
+    name = "json"
+    extension = ".json"
+    expected = "ein einziges gültiges JSON-Objekt"
+
+    def parse_report(self, text: str) -> tuple[object, list[str]]:
+        try:
+            repaired = repair_json(text)
+        except JsonRepairError as e:
+            raise TaskParseError(f"Failed to parse JSON: {e}") from e
+        return repaired.value, repaired.repairs
+
+    def repair_prompt(self, text: str, error: Exception) -> str | None:
+        """Text-only request for the corrected JSON; answers without any JSON cannot be repaired."""
+        if "{" not in text and "[" not in text:
+            return None
+        return REPAIR_PROMPT.format(expected=self.expected, error=error, text=text)
+
+    def serialize(self, result) -> str:
+        return json.dumps(result, indent=4, ensure_ascii=False)
+
+    def empty_result(self):
+        return {}
+
+
+class NerTask(JsonTask):
+    """Named entity recognition with the persons/places/content schema.
+
+    The answer is validated: persons and places must be lists of entities with a name, mentions with
+    offsets need integer start/end, confidence is a number between 0 and 1. Invalid entries are dropped
+    (and reported) instead of failing the page. A missing persons or places key fails the page, unless
+    the answer was cut off, in which case the missing lists are empty.
+    """
+
+    name = "ner"
+    required_keys = ("persons", "places")
+    expected = 'ein JSON-Objekt mit den Schlüsseln "persons", "places" und "content"'
+
+    def parse_report(self, text: str) -> tuple[object, list[str]]:
+        data, repairs = super().parse_report(text)
+        if isinstance(data, list) and len(data) == 1 and isinstance(data[0], dict):
+            data = data[0]
+            repairs.append("list around the object removed")
+        if not isinstance(data, dict):
+            raise TaskParseError("Answer is not a JSON object")
+        missing = [key for key in self.required_keys if key not in data]
+        if missing and TRUNCATED not in repairs:
+            raise TaskParseError(f"Answer does not contain the keys {', '.join(self.required_keys)}")
+        dropped = 0
+        for key in self.required_keys:
+            entities, invalid = self.valid_entities(data.get(key))
+            data[key] = entities
+            dropped += invalid
+        if "content" in data:
+            content = data["content"]
+            content = [content] if isinstance(content, dict) else content if isinstance(content, list) else []
+            data["content"] = [entry for entry in content if isinstance(entry, dict)]
+            dropped += len(content) - len(data["content"])
+        if missing:
+            repairs.append(f"missing {', '.join(missing)} set to []")
+        if dropped:
+            repairs.append(f"{dropped} invalid entries dropped")
+        return data, repairs
+
+    def empty_result(self):
+        return {"persons": [], "places": [], "content": []}
+
+    @staticmethod
+    def offset(value) -> int | None:
+        """Character offset as int (also from floats and digit strings), None if invalid."""
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return None
+        return int(number) if number >= 0 and number == int(number) else None
+
+    def valid_entities(self, entities) -> tuple[list[dict], int]:
+        """Entities with a name and cleaned mentions and confidence; returns them and the number dropped."""
+        if entities is None:
+            return [], 0
+        if isinstance(entities, dict):
+            entities = [entities]
+        if not isinstance(entities, list):
+            return [], 1
+        valid, dropped = [], 0
+        for entity in entities:
+            if not isinstance(entity, dict) or not isinstance(entity.get("name"), str) or not entity["name"].strip():
+                dropped += 1
+                continue
+            if "mentions" in entity:
+                mentions = entity["mentions"] if isinstance(entity["mentions"], list) else []
+                cleaned = []
+                for mention in mentions:
+                    if not isinstance(mention, dict):
+                        continue
+                    if "start" not in mention and "end" not in mention:
+                        cleaned.append(mention)  # No offsets (e.g. only the page in document mode)
+                        continue
+                    start, end = self.offset(mention.get("start")), self.offset(mention.get("end"))
+                    if start is not None and end is not None and start <= end:
+                        cleaned.append({**mention, "start": start, "end": end})
+                entity["mentions"] = cleaned
+            if "confidence" in entity:
+                try:
+                    entity["confidence"] = min(1.0, max(0.0, float(entity["confidence"])))
+                except (TypeError, ValueError):
+                    entity["confidence"] = None
+            valid.append(entity)
+        return valid, dropped
+
+
+DOCUMENT_INSTRUCTIONS = """
+SEITENZUORDNUNG
+Du erhältst das ganze Dokument mit allen Seiten auf einmal. Eine Entität, die auf mehreren Seiten oder über einen
+Seitenumbruch hinweg genannt wird, ist eine einzige Entität.
+- Ergänze jede Person, jeden Ort und jeden Eintrag in "content" um das Feld "pages": Liste aller Seitenzahlen
+  (beginnend bei 1), auf denen sie vorkommen.
+- Ergänze jede Nennung in "mentions" um das Feld "page". "start"/"end" beziehen sich auf den Text dieser Seite.
+Diese beiden Felder sind zusätzlich zum Schema Pflicht.
+"""
+
+
+class DocumentNerTask(NerTask):
+    """NER over a whole document in one request, with the page numbers of every entity.
+
+    The result of the document is split into the usual per-page results (split_pages), so the output
+    files are the same as in the per-page mode. Entities without page information go to page 1.
+    """
+
+    name = "ner_document"
+    entity_keys = ("persons", "places", "content")
+
+    def __init__(self, prompt: str):
+        super().__init__(prompt.rstrip() + "\n" + DOCUMENT_INSTRUCTIONS)
+
+    @staticmethod
+    def page_number(value) -> int | None:
+        """Page number given by the model (int, float or string), None if it is not a number."""
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    def entity_pages(self, entity: dict, page_count: int) -> list[int]:
+        """Valid page numbers of an entity, from "pages" or from the pages of its mentions."""
+        pages = entity.get("pages") or [m.get("page") for m in entity.get("mentions") or [] if isinstance(m, dict)]
+        valid = sorted({n for n in map(self.page_number, pages) if n is not None and 1 <= n <= page_count})
+        return valid or [1]
+
+    def split_pages(self, result: dict, page_count: int) -> dict[int, dict]:
+        """{page_no: result} with every entity on the pages it occurs; mentions only of that page."""
+        pages = {page_no: {key: [] for key in self.entity_keys} for page_no in range(1, page_count + 1)}
+        for key in self.entity_keys:
+            for entity in result.get(key) or []:
+                if not isinstance(entity, dict):
+                    continue
+                for page_no in self.entity_pages(entity, page_count):
+                    page_entity = dict(entity)
+                    if "mentions" in entity:
+                        page_entity["mentions"] = [
+                            m for m in entity["mentions"] or []
+                            if not isinstance(m, dict) or self.page_number(m.get("page", page_no)) == page_no]
+                    pages[page_no][key].append(page_entity)
+        return pages
+
+
+TEXT_INSTRUCTIONS = """
+TEXTEINGABE
+Du erhältst nicht das Bild der Seite, sondern ihre Transkription: der Text nach der Zeile "TEXT:" am Ende der
+Nachricht. Werte nur diesen TEXT aus. "start"/"end" sind Zeichenpositionen in genau diesem TEXT (0-basiert, "end"
+exklusiv, die Zeile "TEXT:" zählt nicht mit), so dass TEXT[start:end] die Nennung wörtlich wiedergibt.
+"""
+
+NO_OFFSET_INSTRUCTIONS = """
+TEXTEINGABE
+Du erhältst nicht das Bild der Seite, sondern ihre Transkription: der Text nach der Zeile "TEXT:" am Ende der
+Nachricht. Werte nur diesen TEXT aus. Abweichend vom Schema: Lass das Feld "mentions" bei allen Personen und Orten
+weg, die Nennungen werden anschliessend im TEXT gesucht. Gib "name" deshalb genau so an, wie er im TEXT steht.
+"""
+
+
+class TextNerTask(NerTask):
+    """NER on the transcription of a page instead of its image (transcript_pipeline.py).
+
+    prompt stays the prompt of the page images, which are still sent for pages without a transcription,
+    and so does the prompt hash of the journal: pages finished in either way are not sent again.
+    With omit_offsets the model is told to leave out the mentions; they are then found in the text by
+    the pipeline (mention_alignment.py), which saves output tokens.
+    """
+
+    name = "ner_text"
+
+    def __init__(self, prompt: str, omit_offsets: bool = False):
+        super().__init__(prompt)
+        self.omit_offsets = omit_offsets
+        self.text_prompt = prompt.rstrip() + "\n" + (NO_OFFSET_INSTRUCTIONS if omit_offsets else TEXT_INSTRUCTIONS)
+
+    def text_prompt_for(self, doc_name: str, page_no: int | None) -> str:  # pylint: disable=unused-argument
+        """Prompt for a page sent as text; the same for every page, so it can be cached as a prefix."""
+        return self.text_prompt
+
+    @staticmethod
+    def text_part(text: str) -> str:
+        """The transcription as it is sent after the prompt."""
+        return "TEXT:\n" + text
@@ -0,0 +1,160 @@
+"""Text input mode of the pipeline engine: NER on existing transcriptions.
+
+The per-page mode renders every page and sends the image, although many pages are already transcribed
+(the .txt results of claude_transcript.py and gemini_transcript_pdf.py). An image costs far more input
+tokens than its text, and the start/end offsets the NER prompt asks for only make sense for a text.
+TranscriptPipeline sends the transcription of a page as text instead (TextNerTask): the mention offsets
+then refer to the characters of a file on disk. Only pages without a transcription are rendered and
+sent as images, with the unchanged prompt.
+
+Transcriptions are found by their path relative to a transcript directory, which mirrors input_dir:
+page n of input_dir/<folder>/<doc>.pdf is <transcript dir>/<folder>/<doc>_page_<n>.txt (<doc>.txt for
+image files). A page whose transcription is in more than one of transcript_dirs is reported and sent
+as image, so a file of another folder is never attached to it. An empty transcription (a blank page) gets
+the empty result without a request. The prompt is the same for every page and comes first, so it is
+cached as a prefix like the prompt of the image requests (cache_prompt of the provider).
+
+With align the mentions of the answer are replaced by the spans of the entity names in the
+transcription (mention_alignment.py) before the result is written, so the offsets are right even where
+the model counted wrong, or where it was told to leave them out (TextNerTask with omit_offsets).
+"""
+
+import asyncio
+import os
+import time
+
+from cost_ledger import BudgetExceeded
+from llm_cache import ResponseCache
+from mention_alignment import align_mentions
+from pipeline import Pipeline
+from result_store import result_files
+from run_trace import PageTrace
+
+
+def index_transcripts(transcript_dirs: list[str]) -> tuple[dict[str, str], set[str]]:
+    """Relative path -> path of the transcriptions below the directories, and the relative paths found in more
+    than one of them (left out of the index)."""
+    transcripts, collisions = {}, set()
+    for directory in transcript_dirs:
+        for relative, path in result_files(directory, ".txt").items():
+            if relative in transcripts:
+                collisions.add(relative)
+            else:
+                transcripts[relative] = path
+    for relative in collisions:
+        del transcripts[relative]
+    return transcripts, collisions
+
+
+def read_text(path: str) -> str:
+    """Content of a transcription."""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class TranscriptPipeline(Pipeline):
+    """Pipeline that sends the transcription of a page instead of its image where there is one.
+
+    Needs a TextNerTask (text_prompt_for, text_part).
+    """
+
+    def __init__(self, *args, transcript_dirs: list[str], align: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.transcript_dirs = transcript_dirs
+        self.align = align or self.task.omit_offsets
+        self.text_jobs = []
+        self.page_texts = {}  # (doc, page) -> transcription of the pages sent as text, until their answer is parsed
+
+    def transcript_path(self, path: str, page_no: int | None) -> str:
+        """Path of the transcription of a page relative to a transcript directory."""
+        name = os.path.splitext(os.path.basename(self.output_path(os.path.basename(path), page_no)))[0] + ".txt"
+        return os.path.normpath(os.path.join(os.path.relpath(os.path.dirname(path), self.input_dir), name))
+
+    def plan_jobs(self) -> list[tuple[str, int | None]]:
+        """Pages to render; pages with a transcription are kept back in text_jobs."""
+        jobs = super().plan_jobs()
+        transcripts, collisions = index_transcripts(self.transcript_dirs)
+        image_jobs = []
+        for path, page_no in jobs:
+            relative = self.transcript_path(path, page_no)
+            transcript = transcripts.get(relative)
+            if relative in collisions:
+                print(f"⚠️ {relative} is in more than one of {', '.join(self.transcript_dirs)}: sent as image")
+            if transcript is None:
+                image_jobs.append((path, page_no))
+            else:
+                self.text_jobs.append((path, page_no, transcript))
+        print(f"> Text input: {len(self.text_jobs)} pages with a transcription, {len(image_jobs)} pages as images")
+        return image_jobs
+
+    def estimate_input_tokens(self, prompt: str, encoded) -> int:
+        """Rough input tokens of a request; a transcription counts like the prompt."""
+        if isinstance(encoded, str):
+            return (len(prompt) + len(encoded)) // 3
+        return super().estimate_input_tokens(prompt, encoded)
+
+    async def parse_answer(self, text: str, trace: PageTrace):
+        """Parse an answer; the mentions of a page sent as text are aligned with its transcription."""
+        result = await super().parse_answer(text, trace)
+        page_text = self.page_texts.pop((trace.doc, trace.page), None)
+        if self.align and page_text is not None:
+            start = time.perf_counter()
+            counts = align_mentions(result, page_text)
+            trace.parse += time.perf_counter() - start
+            self.stats.mentions_aligned += counts.exact + counts.fuzzy
+            self.stats.mentions_fuzzy += counts.fuzzy
+            self.stats.model_offsets += counts.model_offsets
+            self.stats.model_offsets_wrong += counts.model_offsets - counts.model_correct
+        return result
+
+    async def answer_transcript(self, prompt: str, text: str, trace: PageTrace) -> str:
+        """Answer to the prompt and a transcription (from the cache or from the provider)."""
+        key = ResponseCache.make_key(self.provider.model, prompt, self.provider.cache_params(), text.encode("utf-8"))
+        cached = self.cache.get(key)
+        if cached is not None:
+            trace.cached = True
+            return cached["text"]
+        response = await self.send_with_retries(prompt, text, trace)
+        self.record_response(key, response)
+        return response.text
+
+    async def process_transcript(self, path: str, page_no: int | None, transcript: str):
+        """Read → cache/send → parse → write of one page with a transcription."""
+        doc_name = os.path.basename(path)
+        trace = self.new_trace(doc_name, page_no, transcript=transcript)
+        start = time.perf_counter()
+        try:
+            text = await asyncio.to_thread(read_text, transcript)
+        except (OSError, UnicodeDecodeError) as e:
+            self.fail_page(trace, f"❌ Fehler beim Lesen von {transcript}: {e}", e)
+            return
+        trace.encode = time.perf_counter() - start
+        if not text.strip():
+            trace.content = "blank"
+            await self.write_empty_result(doc_name, page_no, trace, "empty transcription, not sent")
+            return
+        part = self.task.text_part(text)
+        trace.payload_bytes = len(part.encode("utf-8"))
+        try:
+            answer = await self.answer_transcript(self.task.text_prompt_for(doc_name, page_no), part, trace)
+        except BudgetExceeded as e:
+            self.skip_over_budget(trace, e)
+            return
+        except Exception as e:  # pylint: disable=broad-except
+            self.fail_page(trace, f"❌ Fehler bei {self.page_label(doc_name, page_no)}: {e}", e)
+            return
+        self.stats.pages_text += 1
+        self.page_texts[(doc_name, page_no)] = text
+        await self.finish_page(doc_name, page_no, answer, trace)
+
+    async def run_async(self):
+        """Render and send the pages without a transcription, then send the transcriptions."""
+        await super().run_async()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_one(path: str, page_no: int | None, transcript: str):
+            async with semaphore:
+                if not self.ledger.stopped:
+                    await self.process_transcript(path, page_no, transcript)
+
+        await asyncio.gather(*(run_one(*job) for job in self.text_jobs))